@@ -6,11 +6,13 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('plantilla.xlsx', '.')],
-    hiddenimports=['openpyxl.cell._writer', 'openpyxl.worksheet._writer'],
+    # main, QtSvg and bs4 are imported lazily (on first scrape / first icon render)
+    hiddenimports=['openpyxl.cell._writer', 'openpyxl.worksheet._writer', 'main', 'PySide6.QtSvg'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Optional extras pulled in by openpyxl/Pillow/bs4 that the app never uses
+    excludes=['tkinter', 'numpy', 'pandas', 'matplotlib', 'IPython', 'pytest', 'html5lib', 'cchardet'],
     noarchive=False,
     optimize=0,
 )
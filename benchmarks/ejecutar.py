@@ -0,0 +1,328 @@
+# Offline benchmark suite: stages and end-to-end runs against the local stub server.
+#
+#   python benchmarks/ejecutar.py                          # 1, 10, 100 and 1000 pages
+#   python benchmarks/ejecutar.py --paginas 1 10 --solo parseo escritura
+#   python benchmarks/ejecutar.py --latencia 0.05 --errores 0.05 --concurrencia 4
+#   python benchmarks/ejecutar.py --comparar benchmarks/resultados/base.json
+#
+# Benchmarks (each one is the best of --repeticiones runs):
+#   parseo/<motor>              one listing page with lxml, lxml by chunks and bs4
+#   escritura/<modo>/<filas>    fill the template with 10 rows per page ("insertar"
+#                               overflow and "masivo" output), split into template
+#                               load, cell writing, logo and save using invima_metricas
+#   e2e/<paginas>               generar_reporte_async against servidor.py, with the
+#                               per-stage times of the run
+#   incremental/<paginas>       check rather than benchmark: incremental runs with the
+#                               "truncar" overflow over a listing that does not fit the
+#                               template must, between them, report every alert once
+#   inventario/<equipos>        index a synthetic inventory (invima_inventario) and cross
+#                               it with synthetic alerts; seeded, so runs are comparable
+#
+# Results go to benchmarks/resultados/<date>_<commit>.json. With --comparar every
+# time is checked against an earlier result file and the script exits with 1 when
+# one is more than --umbral slower. Nothing here touches the network.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from invima_excel import crear_escritor  # noqa: E402
+from invima_metricas import Metricas, activar  # noqa: E402
+from invima_parser import HAY_LXML, parsear_listado, parsear_listado_stream  # noqa: E402
+from invima_incremental import SinAlertasNuevas  # noqa: E402
+from invima_inventario import IndiceInventario, ItemInventario  # noqa: E402
+from main import generar_reporte_async  # noqa: E402
+from servidor import Servidor, cargar_fixtures, pagina  # noqa: E402
+
+RESULTADOS = Path(__file__).resolve().parent / 'resultados'
+ETAPAS = ('parseo', 'escritura', 'e2e', 'incremental', 'inventario')
+# Differences below this are noise whatever the ratio
+MINIMO_S = 0.005
+
+
+def _mejor(funcion: Callable[[], Dict], repeticiones: int) -> Dict:
+    """Runs `funcion` (which returns a dict with 's') several times and keeps the fastest."""
+    return min((funcion() for _ in range(repeticiones)), key=lambda r: r['s'])
+
+
+def _config_base(directorio: str) -> Dict:
+    return {
+        'plantilla_path': str(ROOT / 'plantilla.xlsx'),
+        'salida_path': os.path.join(directorio, 'reporte.xlsx'),
+        'template_has_logo': False,
+        'image_path': str(ROOT / 'logotipo.png'),
+        'cache_http': False,
+        'almacen_path': '',
+        'huellas_path': '',
+        'reanudar': False,
+        'delay': 0,
+        'factor_espera': 0,
+    }
+
+
+def medir_parseo(repeticiones: int) -> Dict[str, Dict]:
+    paginas = cargar_fixtures()
+    motores = {'bs4': lambda p: parsear_listado(p, 'bs4')}
+    if HAY_LXML:
+        motores['lxml'] = lambda p: parsear_listado(p, 'lxml')
+        # Same chunk size as the download, so this is what the streaming path costs
+        motores['lxml_stream'] = lambda p: list(parsear_listado_stream(p[i:i + 16384] for i in range(0, len(p), 16384)))
+    resultados = {}
+    for motor, parsear in motores.items():
+        vueltas = max(1, 50 // len(paginas))
+
+        def correr():
+            inicio = time.perf_counter()
+            for _ in range(vueltas):
+                for contenido in paginas:
+                    parsear(contenido)
+            return {'s': (time.perf_counter() - inicio) / (vueltas * len(paginas))}
+
+        resultados[f'parseo/{motor}'] = _mejor(correr, repeticiones)
+    return resultados
+
+
+def _inventario_sintetico(equipos: int, alertas: int, semilla: int):
+    """Inventory items and alert names built from the same invented vocabulary.
+
+    Device nouns follow a Zipf-like law, so a few appear in thousands of rows like
+    "monitor" does; modifiers and generic words are shared by every kind of device.
+    """
+    azar = random.Random(semilla)
+
+    def palabra() -> str:
+        return ''.join(azar.choice('bcdfglmnprstv') + azar.choice('aeiou') for _ in range(azar.randint(3, 5)))
+
+    nombres = [palabra() for _ in range(2000)]
+    pesos = [1 / (i + 1) ** 0.8 for i in range(len(nombres))]
+    modificadores = ('adulto pediatrico neonatal desechable esteril portatil digital electronico manual automatico '
+                     'reusable estandar universal doble simple grande mediano pequeno largo corto').split()
+    genericos = 'equipo sistema kit set unidad accesorio repuesto dispositivo'.split()
+    marcas = [palabra().capitalize() for _ in range(300)]
+
+    def descripcion() -> str:
+        partes = [azar.choice(genericos)] if azar.random() < 0.3 else []
+        partes += azar.choices(nombres, pesos, k=azar.choice([1, 1, 2]))
+        partes += azar.sample(modificadores, azar.randint(0, 3))
+        return ' '.join(partes)
+
+    items = [
+        ItemInventario(descripcion(), azar.choice(marcas), f'INVIMA {azar.randint(2005, 2024)}DM-{azar.randint(0, 9999999):07d}',
+                       f'{palabra()[:2].upper()}-{azar.randint(100, 9999)}')
+        for _ in range(equipos)
+    ]
+    textos = [f'Alerta sanitaria {descripcion()} marca {azar.choice(marcas)} por falla en funcionamiento'
+              for _ in range(alertas)]
+    return items, textos
+
+
+def medir_inventario(repeticiones: int, semilla: int, equipos: int = 40000, alertas: int = 3000) -> Dict[str, Dict]:
+    items, textos = _inventario_sintetico(equipos, alertas, semilla)
+
+    def indexar():
+        inicio = time.perf_counter()
+        IndiceInventario(items)
+        return {'s': time.perf_counter() - inicio, 'filas': len(items)}
+
+    indice = IndiceInventario(items)
+
+    def cruzar():
+        inicio = time.perf_counter()
+        coincidencias = sum(1 for texto in textos if indice.buscar(texto))
+        return {'s': time.perf_counter() - inicio, 'filas': len(textos), 'con_coincidencias': coincidencias}
+
+    return {
+        f'inventario/indice/{equipos}': _mejor(indexar, repeticiones),
+        f'inventario/cruce/{equipos}x{alertas}': _mejor(cruzar, repeticiones),
+    }
+
+
+def medir_escritura(paginas: int, repeticiones: int, directorio: str) -> Dict[str, Dict]:
+    fixtures = cargar_fixtures()
+    alertas = [alerta for numero in range(paginas) for alerta in parsear_listado(pagina(fixtures, numero, paginas))]
+    modos = {
+        'insertar': {'modo_salida': 'plantilla', 'desbordamiento': 'insertar'},
+        'masivo': {'modo_salida': 'masivo'},
+    }
+    resultados = {}
+    for modo, ajustes in modos.items():
+        config = {**_config_base(directorio), **ajustes}
+
+        def correr():
+            metricas = Metricas()
+            inicio = time.perf_counter()
+            with activar(metricas):
+                escritor = crear_escritor(config)
+                for alerta in alertas:
+                    escritor.agregar(alerta)
+                escritor.guardar()
+            return {'s': time.perf_counter() - inicio, 'filas': len(alertas), 'tramos': metricas.resumen()['tramos']}
+
+        resultados[f'escritura/{modo}/{len(alertas)}'] = _mejor(correr, repeticiones)
+    return resultados
+
+
+def medir_e2e(paginas: int, repeticiones: int, directorio: str, args) -> Dict[str, Dict]:
+    def correr():
+        with Servidor(paginas, args.latencia, args.errores, args.semilla) as servidor:
+            config = {
+                **_config_base(directorio),
+                'base_url': servidor.url,
+                # One more page than there are, so the run ends on the empty one
+                'num_pages': paginas + 1,
+                'concurrencia': args.concurrencia,
+                'desbordamiento': 'insertar',
+                'max_errores_consecutivos': 10,
+            }
+            metricas = Metricas()
+            inicio = time.perf_counter()
+            escritor = asyncio.run(generar_reporte_async(config, None, metricas))
+            segundos = time.perf_counter() - inicio
+            return {
+                's': segundos,
+                'filas': escritor.total,
+                'peticiones': servidor.peticiones,
+                'errores_inyectados': servidor.fallos,
+                'tramos': metricas.resumen()['tramos'],
+                'contadores': metricas.resumen()['contadores'],
+            }
+
+    return {f'e2e/{paginas}': _mejor(correr, repeticiones)}
+
+
+def verificar_incremental(paginas: int, directorio: str) -> Dict[str, Dict]:
+    """Incremental runs with the "truncar" overflow until nothing new is left.
+
+    Raises AssertionError if an alert is reported twice or never, which happens
+    when the alerts that did not fit are registered as seen (or never fetched again).
+    """
+    config_base = _config_base(directorio)
+    with Servidor(paginas) as servidor:
+        config = {
+            **config_base,
+            'base_url': servidor.url,
+            'num_pages': paginas + 1,
+            'incremental': True,
+            'vistos_path': os.path.join(directorio, f'vistos_{paginas}.txt'),
+            'desbordamiento': 'truncar',
+        }
+        inicio = time.perf_counter()
+        reportadas: List[str] = []
+        ejecuciones = 0
+        while True:
+            try:
+                escritor = asyncio.run(generar_reporte_async(config))
+            except SinAlertasNuevas:
+                break
+            ejecuciones += 1
+            reportadas += escritor.risarh_escritos
+            assert ejecuciones <= paginas * 10, 'incremental runs never ran out of alerts'
+        segundos = time.perf_counter() - inicio
+    esperadas = {alerta.clave for numero in range(paginas) for alerta in parsear_listado(pagina(cargar_fixtures(), numero, paginas))}
+    assert len(reportadas) == len(set(reportadas)), 'an alert was reported twice'
+    faltan = esperadas - set(reportadas)
+    assert not faltan, f'{len(faltan)} alerts were never reported (e.g. {sorted(faltan)[0]})'
+    return {f'incremental/{paginas}': {'s': segundos, 'filas': len(reportadas), 'ejecuciones': ejecuciones}}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def comparar(actual: Dict, base: Dict, umbral: float) -> List[str]:
+    """Names of the benchmarks in both results that got more than `umbral` slower."""
+    regresiones = []
+    print(f'\nCompared with {base.get("commit")} ({base.get("fecha")}):')
+    for nombre, datos in actual['resultados'].items():
+        anterior = base.get('resultados', {}).get(nombre)
+        if anterior is None:
+            continue
+        cociente = datos['s'] / anterior['s'] if anterior['s'] else float('inf')
+        peor = cociente > 1 + umbral and datos['s'] - anterior['s'] > MINIMO_S
+        if peor:
+            regresiones.append(nombre)
+        print(f'  {nombre:<28}{anterior["s"]:>10.4f}{datos["s"]:>10.4f}  x{cociente:.2f}{"  REGRESSION" if peor else ""}')
+    return regresiones
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the INVIMA scraper and report writer.')
+    parser.add_argument('--paginas', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--solo', nargs='+', choices=ETAPAS, default=list(ETAPAS))
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--latencia', type=float, default=0.0, help='Stub server latency per response, in seconds.')
+    parser.add_argument('--errores', type=float, default=0.0, help='Fraction of stub responses that fail with 503.')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--salida', help='Result file (default: resultados/<date>_<commit>.json).')
+    parser.add_argument('--comparar', help='Earlier result file to compare against.')
+    parser.add_argument('--umbral', type=float, default=0.25, help='Allowed slowdown before failing (0.25 = 25%%).')
+    args = parser.parse_args()
+
+    commit = _commit()
+    ahora = datetime.now()
+    informe = {
+        'fecha': ahora.isoformat(timespec='seconds'),
+        'commit': commit,
+        'maquina': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'parametros': {clave: valor for clave, valor in vars(args).items() if clave not in ('salida', 'comparar')},
+        'resultados': {},
+    }
+
+    def registrar(resultados: Dict[str, Dict]) -> None:
+        for nombre, datos in resultados.items():
+            informe['resultados'][nombre] = datos
+            extra = f'  ({datos["filas"]} rows)' if 'filas' in datos else ''
+            print(f'{nombre:<30}{datos["s"]:>10.4f} s{extra}', flush=True)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        if 'parseo' in args.solo:
+            registrar(medir_parseo(args.repeticiones))
+        if 'inventario' in args.solo:
+            registrar(medir_inventario(args.repeticiones, args.semilla))
+        for paginas in args.paginas:
+            if 'escritura' in args.solo:
+                registrar(medir_escritura(paginas, args.repeticiones, directorio))
+            if 'e2e' in args.solo:
+                registrar(medir_e2e(paginas, args.repeticiones, directorio, args))
+            # The check needs a listing that overflows the template, and is slow on big ones
+            if 'incremental' in args.solo and 5 <= paginas <= 100:
+                registrar(verificar_incremental(paginas, directorio))
+
+    destino = Path(args.salida) if args.salida else RESULTADOS / f'{ahora:%Y%m%d-%H%M%S}_{commit}.json'
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f'\nResults saved to {destino}')
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            regresiones = comparar(informe, json.load(f), args.umbral)
+        if regresiones:
+            print(f'{len(regresiones)} benchmark(s) slower than allowed: {", ".join(regresiones)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
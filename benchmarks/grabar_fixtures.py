@@ -0,0 +1,85 @@
+# Records listing and detail pages from the real INVIMA site into fixtures/ for
+# the benchmarks.
+#
+#   python benchmarks/grabar_fixtures.py --paginas 5
+#   python benchmarks/grabar_fixtures.py --paginas 5 --refrescar
+#
+# Needs network access only once; the benchmarks then replay the saved pages
+# through servidor.py. For every listing page the detail page of its first row
+# is saved as detalle_NNN.html, and the detail links of the listing are rewritten
+# to the /alerta-N form the stub routes. Pages already in fixtures/ are kept
+# unless --refrescar is given.
+#
+# The bundled listado_000.html and detalle_000.html are synthetic pages with the
+# same markup as the site (not recordings), so the suite runs even if this script
+# was never used; --refrescar replaces them with real ones.
+
+import argparse
+import html
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from invima_http import crear_sesion  # noqa: E402
+from invima_parser import parsear_listado  # noqa: E402
+from servidor import FIXTURES, RUTA  # noqa: E402
+
+URL = 'https://app.invima.gov.co/alertas/dispositivos-medicos-invima?field_tipo_de_documento_value=1&field_a_o_value=1'
+CABECERAS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+}
+
+
+def enlaces_locales(contenido: bytes, enlaces, primero: int) -> bytes:
+    """Rewrite each detail link to RUTA/alerta-N (N from `primero`) so servidor.py serves it."""
+    for desplazamiento, enlace in enumerate(enlaces):
+        local = b'href="%s/alerta-%d"' % (RUTA.encode(), primero + desplazamiento)
+        for forma in {enlace, html.escape(enlace)}:
+            contenido = contenido.replace(b'href="%s"' % forma.encode(), local)
+    return contenido
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Record INVIMA listing and detail pages as benchmark fixtures.')
+    parser.add_argument('--paginas', type=int, default=5)
+    parser.add_argument('--url', default=URL)
+    parser.add_argument('--delay', type=float, default=1.0, help='Seconds between requests.')
+    parser.add_argument('--refrescar', action='store_true',
+                        help='Record again pages already in fixtures/ (including the bundled synthetic ones).')
+    args = parser.parse_args()
+
+    FIXTURES.mkdir(parents=True, exist_ok=True)
+    with crear_sesion(CABECERAS) as sesion:
+        for numero in range(args.paginas):
+            destino = FIXTURES / f'listado_{numero:03d}.html'
+            destino_detalle = FIXTURES / f'detalle_{numero:03d}.html'
+            if not args.refrescar and destino.exists() and destino_detalle.exists():
+                print(f'{destino.name} already recorded; use --refrescar to replace it.')
+                continue
+            url = f'{args.url}&page={numero}'
+            respuesta = sesion.get(url, timeout=30)
+            respuesta.raise_for_status()
+            alertas = parsear_listado(respuesta.content, tipo_contenido=respuesta.headers.get('Content-Type'))
+            if not alertas:
+                print(f'Page {numero} has no alerts; stopping.')
+                break
+            enlaces = list(dict.fromkeys(alerta.enlace for alerta in alertas if alerta.enlace))
+            if enlaces:
+                time.sleep(args.delay)
+                detalle = sesion.get(urljoin(url, enlaces[0]), timeout=30)
+                detalle.raise_for_status()
+                destino_detalle.write_bytes(detalle.content)
+                print(f'{destino_detalle.name}: {len(detalle.content)} bytes')
+            destino.write_bytes(enlaces_locales(respuesta.content, enlaces, numero * len(alertas)))
+            print(f'{destino.name}: {len(alertas)} alerts, {len(respuesta.content)} bytes')
+            time.sleep(args.delay)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+# Local stub of the INVIMA listing that replays the recorded pages in fixtures/.
+#
+#   python benchmarks/servidor.py --paginas 100 --latencia 0.05 --errores 0.1
+#
+# Page N of the listing is fixture N modulo the number of fixtures, with the
+# RISARH numbers shifted so every page has distinct alerts. Pages from --paginas
+# onwards come back empty, like the real site past its last page. The detail link
+# of every row serves one of the detalle_*.html fixtures. With
+# --errores some responses are a 503 with Retry-After (seeded, reproducible);
+# ETag/304 and gzip behave like the real server so the HTTP cache and the
+# compressed download paths are exercised too.
+
+import argparse
+import gzip
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+RUTA = '/alertas/dispositivos-medicos-invima'
+
+_FILA = re.compile(rb'<div class="views-row.*?(?=<div class="views-row|</div>\s*<h2|\Z)', re.S)
+_RISARH = re.compile(rb'RISARH-(\d+)')
+_DETALLE = re.compile(rb'/alerta-(\d+)')
+
+
+def cargar_fixtures(directorio: Path = FIXTURES, patron: str = 'listado_*.html') -> List[bytes]:
+    paginas = [p.read_bytes() for p in sorted(directorio.glob(patron))]
+    if not paginas:
+        raise FileNotFoundError(f'No fixtures in {directorio}; run grabar_fixtures.py first.')
+    return paginas
+
+
+def pagina(fixtures: List[bytes], numero: int, paginas: int) -> bytes:
+    """Listing page `numero` out of `paginas` built from the recorded `fixtures`."""
+    if numero >= paginas:
+        return _FILA.sub(b'', fixtures[0])
+    base = fixtures[numero % len(fixtures)]
+    desplazamiento = 10000 * (numero // len(fixtures))
+    if not desplazamiento:
+        return base
+    base = _RISARH.sub(lambda m: b'RISARH-%d' % (int(m.group(1)) + desplazamiento), base)
+    return _DETALLE.sub(lambda m: b'/alerta-%d' % (int(m.group(1)) + desplazamiento), base)
+
+
+class Servidor:
+    """Stub server running in a background thread; use as a context manager."""
+
+    def __init__(self, paginas: int, latencia: float = 0.0, errores: float = 0.0,
+                 semilla: int = 0, fixtures: Optional[List[bytes]] = None,
+                 puerto: int = 0):
+        self.paginas = paginas
+        self.latencia = latencia
+        self.errores = errores
+        self.fixtures = fixtures or cargar_fixtures()
+        self.detalles = cargar_fixtures(patron='detalle_*.html')
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.fallos = 0
+        self._http = ThreadingHTTPServer(('127.0.0.1', puerto), self._manejador())
+        self._http.daemon_threads = True
+        self._hilo = None
+
+    @property
+    def url(self) -> str:
+        # Same query string as the real listing, so main appends &page=N the same way
+        host, puerto = self._http.server_address[:2]
+        return f'http://{host}:{puerto}{RUTA}?field_tipo_de_documento_value=1&field_a_o_value=1'
+
+    def _fallar(self) -> bool:
+        with self._lock:
+            self.peticiones += 1
+            if self.errores and self._azar.random() < self.errores:
+                self.fallos += 1
+                return True
+            return False
+
+    def _manejador(self):
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                detalle = _DETALLE.search(url.path.encode()) if url.path.startswith(RUTA + '/') else None
+                if url.path != RUTA and detalle is None:
+                    self._responder(404, b'')
+                    return
+                if servidor.latencia:
+                    time.sleep(servidor.latencia)
+                if servidor._fallar():
+                    self._responder(503, b'', {'Retry-After': '0'})
+                    return
+                if detalle is not None:
+                    numero = int(detalle.group(1))
+                    cuerpo = servidor.detalles[numero % len(servidor.detalles)]
+                else:
+                    numero = int(parse_qs(url.query).get('page', ['0'])[0])
+                    cuerpo = pagina(servidor.fixtures, numero, servidor.paginas)
+                etag = '"%s"' % hashlib.md5(cuerpo).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self._responder(304, b'', {'ETag': etag})
+                    return
+                cabeceras = {'Content-Type': 'text/html; charset=utf-8', 'ETag': etag}
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    cuerpo = gzip.compress(cuerpo, compresslevel=1)
+                    cabeceras['Content-Encoding'] = 'gzip'
+                self._responder(200, cuerpo, cabeceras)
+
+            def _responder(self, estado, cuerpo, cabeceras=None):
+                self.send_response(estado)
+                for nombre, valor in (cabeceras or {}).items():
+                    self.send_header(nombre, valor)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                try:
+                    self.wfile.write(cuerpo)
+                except ConnectionError:
+                    # The client gave up (e.g. a cancelled run); nothing to report
+                    pass
+
+        return Manejador
+
+    def __enter__(self) -> 'Servidor':
+        self._hilo = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._http.shutdown()
+        self._http.server_close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Local stub of the INVIMA listing.')
+    parser.add_argument('--paginas', type=int, default=10, help='Pages with alerts; later ones are empty.')
+    parser.add_argument('--latencia', type=float, default=0.0, help='Seconds to wait before each response.')
+    parser.add_argument('--errores', type=float, default=0.0, help='Fraction of responses that fail with 503.')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+    with Servidor(args.paginas, args.latencia, args.errores, args.semilla, puerto=args.puerto) as servidor:
+        print(f'Serving {args.paginas} pages at {servidor.url}  (Ctrl+C to stop)')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,242 @@
+"""Línea de comandos sin interfaz gráfica, pensada para tareas programadas.
+
+    python -m invima [ejecutar] [--config config.json] [--set clave=valor ...]
+    python -m invima almacen --desde 2024-01-01 --hasta 2024-12-31
+    python -m invima lote reportes.json [--almacen] [--procesos N]
+    python -m invima vigilar [--intervalo MINUTOS] [--una-vez]
+    python -m invima api [--host 127.0.0.1] [--puerto 8080]
+
+Lee `config.json` (o el indicado con `--config`) y aplica encima las opciones de la
+línea de comandos. Por la salida estándar escribe una línea JSON por evento:
+`{"evento": "progreso", ...}` durante la ejecución y un `{"evento": "resumen", ...}`
+final con cifras, tiempos y la ruta generada. Con `--texto` se escriben los mensajes
+tal cual, como en la GUI.
+
+Códigos de salida: 0 si todo fue bien, 1 ante un error y 3 si el modo incremental
+no encontró alertas nuevas. Solo se importa lo necesario para el comando pedido
+(nunca PySide6).
+"""
+
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from invima_incremental import SinAlertasNuevas
+from invima_metricas import Metricas
+
+SIN_ALERTAS_NUEVAS = 3
+
+
+def _valor(texto: str):
+    # Los valores se interpretan como JSON cuando es posible ("3", "true", "[...]")
+    try:
+        return json.loads(texto)
+    except ValueError:
+        return texto
+
+
+def cargar_config(ruta: str, ajustes: Sequence[str] = ()) -> Dict:
+    """Config de `ruta` (si existe) con los `clave=valor` de `ajustes` encima."""
+    config = {}
+    if Path(ruta).exists():
+        with open(ruta, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    for ajuste in ajustes:
+        clave, separador, valor = ajuste.partition("=")
+        if not separador or not clave:
+            raise ValueError(f"Ajuste inválido {ajuste!r}; se esperaba clave=valor.")
+        config[clave.strip()] = _valor(valor)
+    return config
+
+
+class Salida:
+    """Escribe los eventos por stdout, en JSON por línea o como texto."""
+
+    def __init__(self, texto: bool = False):
+        self.texto = texto
+        self.inicio = time.perf_counter()
+
+    def segundos(self) -> float:
+        return round(time.perf_counter() - self.inicio, 3)
+
+    def emitir(self, evento: str, **datos) -> None:
+        if self.texto:
+            if "mensaje" in datos:
+                print(datos["mensaje"], flush=True)
+            elif evento == "resumen":
+                print(", ".join(f"{clave}: {valor}" for clave, valor in datos.items()), flush=True)
+            return
+        print(json.dumps({"evento": evento, "t": self.segundos(), **datos}, default=str), flush=True)
+
+    def progress(self, mensaje: str) -> None:
+        self.emitir("progreso", mensaje=mensaje)
+
+
+def _ejecutar(args, config: Dict, salida: Salida) -> Dict:
+    from main import generar_reporte_async
+
+    metricas = Metricas()
+    escritor = asyncio.run(generar_reporte_async(config, salida.progress, metricas))
+    return {
+        "salida": escritor.salida,
+        "alertas": escritor.total,
+        "escritas": len(escritor.risarh_escritos),
+        "metricas": metricas.resumen(),
+    }
+
+
+def _almacen(args, config: Dict, salida: Salida) -> Dict:
+    from invima_almacen import AlmacenAlertas
+    from invima_excel import crear_escritor
+
+    almacen_path = config.get("almacen_path", "alertas_invima.sqlite3")
+    if not almacen_path or not Path(almacen_path).exists():
+        raise RuntimeError(f"No existe el histórico de alertas '{almacen_path}'.")
+    desde = date.fromisoformat(args.desde) if args.desde else None
+    hasta = date.fromisoformat(args.hasta) if args.hasta else None
+    with AlmacenAlertas(almacen_path) as almacen:
+        escritor = None
+        for alerta in almacen.consultar(desde, hasta):
+            if escritor is None:
+                escritor = crear_escritor(config, salida.progress)
+            escritor.agregar(alerta)
+    if escritor is None:
+        raise RuntimeError("No hay alertas en el histórico para el rango solicitado.")
+    escritor.guardar()
+    return {
+        "salida": escritor.salida,
+        "alertas": escritor.total,
+        "escritas": len(escritor.risarh_escritos),
+    }
+
+
+def _vigilar(args, config: Dict, salida: Salida) -> Dict:
+    from invima_vigilancia import vigilar_async
+
+    async def vigilar() -> Dict:
+        # Ctrl+C o SIGTERM terminan la revisión en curso y luego detienen la vigilancia
+        detener = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(senal, detener.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        return await vigilar_async(config, salida.progress, detener, 1 if args.una_vez else None)
+
+    return asyncio.run(vigilar())
+
+
+def _api(args, config: Dict, salida: Salida) -> Dict:
+    from invima_api import ApiAlertas
+
+    api = ApiAlertas(
+        config,
+        args.host or config.get("api_host", "127.0.0.1"),
+        args.puerto or int(config.get("api_puerto", 8080)),
+        salida.progress,
+    )
+    salida.progress(f"API escuchando en {api.url} (Ctrl+C para detener).")
+    try:
+        api.servir()
+    except KeyboardInterrupt:
+        pass
+    return {"url": api.url, "peticiones": api.peticiones}
+
+
+def _lote(args, config: Dict, salida: Salida) -> Dict:
+    from invima_lote import ejecutar_lote
+
+    with open(args.especificaciones, "r", encoding="utf-8") as f:
+        especificaciones = json.load(f)
+    salidas = ejecutar_lote(config, especificaciones, args.procesos, args.almacen, salida.progress)
+    if not all(salidas):
+        raise RuntimeError(f"Fallaron {salidas.count(None)} de {len(salidas)} reportes.")
+    return {"salidas": salidas, "reportes": len(salidas)}
+
+
+def _parser() -> argparse.ArgumentParser:
+    comun = argparse.ArgumentParser(add_help=False)
+    comun.add_argument("--config", default="config.json", help="Archivo de configuración (por defecto config.json).")
+    comun.add_argument("--set", dest="ajustes", action="append", default=[], metavar="CLAVE=VALOR",
+                       help="Sobrescribe una clave de la configuración; el valor se lee como JSON si es posible.")
+    comun.add_argument("--salida", help="Atajo de --set salida_path=...")
+    comun.add_argument("--plantilla", help="Atajo de --set plantilla_path=...")
+    comun.add_argument("--inventario", help="Atajo de --set inventario_path=... (CSV o XLSX de equipos).")
+    comun.add_argument("--texto", action="store_true", help="Mensajes legibles en lugar de JSON por línea.")
+
+    parser = argparse.ArgumentParser(prog="python -m invima", description="Reportes de alertas INVIMA sin interfaz gráfica.")
+    comandos = parser.add_subparsers(dest="comando")
+
+    ejecutar = comandos.add_parser("ejecutar", parents=[comun], help="Descarga el listado y genera el reporte (por defecto).")
+    ejecutar.add_argument("--paginas", type=int, help="Atajo de --set num_pages=...")
+    ejecutar.add_argument("--incremental", action="store_true", default=None, help="Solo alertas no reportadas antes.")
+    ejecutar.add_argument("--detalle", action="store_true", default=None, help="Completar cada alerta con su página de detalle.")
+    ejecutar.set_defaults(funcion=_ejecutar)
+
+    almacen = comandos.add_parser("almacen", parents=[comun], help="Genera el reporte desde el histórico local, sin red.")
+    almacen.add_argument("--desde", help="Fecha inicial (aaaa-mm-dd).")
+    almacen.add_argument("--hasta", help="Fecha final (aaaa-mm-dd).")
+    almacen.set_defaults(funcion=_almacen)
+
+    lote = comandos.add_parser("lote", parents=[comun], help="Varios reportes con una sola descarga.")
+    lote.add_argument("especificaciones", help="JSON con la lista de reportes.")
+    lote.add_argument("--almacen", action="store_true", help="Usar el histórico local en lugar de descargar.")
+    lote.add_argument("--procesos", type=int, help="Procesos en paralelo.")
+    lote.set_defaults(funcion=_lote)
+
+    vigilar = comandos.add_parser("vigilar", parents=[comun], help="Revisa el listado periódicamente y avisa de las alertas nuevas.")
+    vigilar.add_argument("--intervalo", type=float, help="Atajo de --set intervalo_minutos=...")
+    vigilar.add_argument("--una-vez", action="store_true", help="Hacer una sola revisión y terminar.")
+    vigilar.set_defaults(funcion=_vigilar)
+
+    api = comandos.add_parser("api", parents=[comun], help="Sirve el histórico local por HTTP (JSON o CSV).")
+    api.add_argument("--host", help="Interfaz donde escuchar (por defecto api_host o 127.0.0.1).")
+    api.add_argument("--puerto", type=int, help="Puerto (por defecto api_puerto o 8080).")
+    api.set_defaults(funcion=_api)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv.insert(0, "ejecutar")
+    args = _parser().parse_args(argv)
+
+    salida = Salida(args.texto)
+    try:
+        config = cargar_config(args.config, args.ajustes)
+    except (OSError, ValueError) as e:
+        salida.emitir("resumen", ok=False, error=str(e), duracion_s=salida.segundos())
+        return 1
+    atajos = {
+        "salida_path": args.salida,
+        "plantilla_path": args.plantilla,
+        "inventario_path": args.inventario,
+        "num_pages": getattr(args, "paginas", None),
+        "incremental": getattr(args, "incremental", None),
+        "detalle": getattr(args, "detalle", None),
+        "intervalo_minutos": getattr(args, "intervalo", None),
+    }
+    config.update({clave: valor for clave, valor in atajos.items() if valor is not None})
+
+    funcion: Callable[[argparse.Namespace, Dict, Salida], Dict] = args.funcion
+    try:
+        resumen = funcion(args, config, salida)
+    except Exception as e:
+        sin_nuevas = isinstance(e, SinAlertasNuevas)
+        salida.emitir("resumen", ok=sin_nuevas, comando=args.comando, sin_alertas_nuevas=sin_nuevas,
+                      error=None if sin_nuevas else str(e), duracion_s=salida.segundos())
+        return SIN_ALERTAS_NUEVAS if sin_nuevas else 1
+    salida.emitir("resumen", ok=True, comando=args.comando, **resumen, duracion_s=salida.segundos())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+"""Registro tipado de una alerta INVIMA, compartido por todo el flujo."""
+
+import hashlib
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Optional
+
+MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+
+def parsear_fecha(texto: str) -> Optional[date]:
+    """Convierte la fecha publicada por INVIMA en `date`.
+
+    Acepta dd/mm/aaaa, aaaa-mm-dd, "15 de marzo de 2024" y el año suelto que
+    muestra el listado (se toma el 1 de enero). Devuelve None si no reconoce el formato.
+    """
+    texto = (texto or "").strip().lower()
+    if not texto:
+        return None
+    if len(texto) == 4 and texto.isdigit():
+        # Caso habitual del listado: solo el año
+        return date(int(texto), 1, 1)
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    m = re.fullmatch(r"(\d{1,2}) de ([a-z]+) de (\d{4})", texto)
+    if m and m.group(2) in MESES:
+        try:
+            return date(int(m.group(3)), MESES[m.group(2)], int(m.group(1)))
+        except ValueError:
+            return None
+    m = re.search(r"\b(\d{4})\b", texto)
+    if m:
+        return date(int(m.group(1)), 1, 1)
+    return None
+
+
+def normalizar_risarh(texto: str) -> str:
+    """Clave de comparación del identificador: sin espacios sobrantes y en mayúsculas.
+
+    Solo sirve para reconocer la misma alerta entre ejecuciones (repetidas, vistas,
+    histórico); lo que se muestra es el texto publicado (`Alerta.risarh`).
+    """
+    return " ".join((texto or "").split()).upper()
+
+
+@dataclass(frozen=True, slots=True)
+class Detalle:
+    """Campos de la página de detalle de una alerta; vacíos si la página no los trae."""
+
+    lotes: str = ""
+    fabricante: str = ""
+    fecha_texto: str = ""
+    descripcion: str = ""
+
+    def texto(self, max_descripcion: int = 1000) -> str:
+        """Resumen en varias líneas para añadir a la novedad reportada."""
+        lineas = [
+            f"{etiqueta}: {valor}"
+            for etiqueta, valor in (("Fabricante", self.fabricante), ("Lotes", self.lotes), ("Fecha", self.fecha_texto))
+            if valor
+        ]
+        if self.descripcion:
+            descripcion = self.descripcion
+            if len(descripcion) > max_descripcion:
+                descripcion = descripcion[:max_descripcion].rstrip() + "…"
+            lineas.append(descripcion)
+        return "\n".join(lineas)
+
+
+@dataclass(frozen=True, slots=True)
+class Alerta:
+    """Una fila del listado de alertas, ya normalizada.
+
+    `fecha_texto` conserva lo publicado (es lo que se escribe en el reporte) y
+    `fecha` es su interpretación como `date`, o None si no se pudo interpretar.
+    Igual con `risarh`, el identificador tal como se publicó, y `clave`, su forma
+    normalizada para reconocer la alerta entre ejecuciones; se calcula una sola vez al
+    crear la alerta y `dataclasses.replace` la conserva (si se cambia `risarh` hay
+    que pasar también la nueva `clave`).
+    `fuente` es el nombre de la fuente de la que salió cuando hay varias (ver `invima_fuentes`),
+    `enlace` el href de su página de detalle y `detalle` lo extraído de ella (ver `invima_detalle`).
+    `cambiada` indica que su RISARH ya se había visto con otro contenido (ver `invima_incremental`).
+    """
+
+    nombre: str
+    risarh: str
+    fecha_texto: str
+    fecha: Optional[date]
+    fuente: str = ""
+    enlace: str = ""
+    detalle: Optional[Detalle] = None
+    cambiada: bool = False
+    clave: str = ""
+
+    def __post_init__(self):
+        # Quien crea la alerta sin `clave` (el histórico, el punto de control) la obtiene aquí
+        if not self.clave and self.risarh:
+            object.__setattr__(self, "clave", normalizar_risarh(self.risarh))
+
+    @classmethod
+    def desde_campos(cls, nombre: str, risarh: str, fecha_texto: str, enlace: str = "") -> "Alerta":
+        """Crea la alerta a partir del texto crudo de la página, normalizándolo una sola vez."""
+        fecha_texto = " ".join((fecha_texto or "").split())
+        risarh = " ".join((risarh or "").split())
+        return cls(
+            nombre=" ".join((nombre or "").split()),
+            risarh=risarh,
+            clave=normalizar_risarh(risarh),
+            fecha_texto=fecha_texto,
+            fecha=parsear_fecha(fecha_texto),
+            enlace=(enlace or "").strip(),
+        )
+
+    def huella(self) -> str:
+        """Resumen (16 hex) del contenido publicado en el listado, para detectar cambios entre ejecuciones."""
+        contenido = f"{self.nombre.casefold()}\x1f{self.fecha_texto.casefold()}"
+        return hashlib.blake2b(contenido.encode("utf-8"), digest_size=8).hexdigest()
+
+    def como_dict(self) -> Dict[str, str]:
+        """Forma antigua del registro ({"Nombre", "RISARH", "Fecha"})."""
+        return {"Nombre": self.nombre, "RISARH": self.risarh, "Fecha": self.fecha_texto}
@@ -0,0 +1,182 @@
+"""Almacén local (SQLite) con el histórico de alertas INVIMA scrapeadas."""
+
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from invima_alerta import Alerta, normalizar_risarh
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS alertas (
+    risarh TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    fecha_texto TEXT NOT NULL,
+    fecha TEXT,
+    primera_vez TEXT NOT NULL,
+    ultima_vez TEXT NOT NULL,
+    risarh_texto TEXT,
+    fuente TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_alertas_risarh ON alertas (risarh);
+CREATE INDEX IF NOT EXISTS ix_alertas_fecha ON alertas (fecha);
+CREATE INDEX IF NOT EXISTS ix_alertas_clave ON alertas (substr(risarh, instr(risarh, 'RISARH')));
+"""
+# Columnas añadidas después de crear la tabla; las bases anteriores las reciben al abrirse
+_COLUMNAS_NUEVAS = {"risarh_texto": "TEXT", "fuente": "TEXT"}
+# El listado publica "No. Identificación interno: RISARH-1400-2024"; desde "RISARH" es la clave indexada
+_CLAVE = "substr(risarh, instr(risarh, 'RISARH'))"
+
+_UPSERT = """
+INSERT INTO alertas (risarh, nombre, fecha_texto, fecha, primera_vez, ultima_vez, risarh_texto, fuente)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (risarh) DO UPDATE SET
+    risarh_texto = excluded.risarh_texto,
+    fuente = coalesce(fuente, excluded.fuente),
+    nombre = excluded.nombre,
+    fecha_texto = excluded.fecha_texto,
+    fecha = excluded.fecha,
+    ultima_vez = excluded.ultima_vez
+"""
+
+
+class AlmacenAlertas:
+    """Base SQLite (modo WAL) con una fila por RISARH.
+
+    La columna `risarh` es la clave normalizada (`Alerta.clave`) y `risarh_texto`
+    el identificador tal como se publicó, que es el que devuelve `consultar`.
+    `fuente` es el nombre de la primera fuente en la que se encontró (NULL con una
+    sola fuente); no cambia aunque la alerta aparezca después en otra.
+
+    `guardar` hace upsert por lotes: una alerta ya conocida actualiza sus datos y
+    `ultima_vez`, conservando `primera_vez`. `consultar` filtra por rango de fechas
+    usando el índice sobre la fecha parseada, sin tocar la red.
+
+    Con `solo_lectura` la base debe existir y se abre sin escribir nada (ni el
+    esquema); es barato, así que cada hilo lector puede abrir la suya.
+    """
+
+    def __init__(self, ruta: str, solo_lectura: bool = False):
+        self.ruta = ruta
+        if solo_lectura:
+            self._conexion = sqlite3.connect(f"{Path(ruta).resolve().as_uri()}?mode=ro", uri=True)
+            return
+        self._conexion = sqlite3.connect(ruta)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(_ESQUEMA)
+        existentes = {fila[1] for fila in self._conexion.execute("PRAGMA table_info(alertas)")}
+        for columna, tipo in _COLUMNAS_NUEVAS.items():
+            if columna not in existentes:
+                self._conexion.execute(f"ALTER TABLE alertas ADD COLUMN {columna} {tipo}")
+
+    def __enter__(self) -> "AlmacenAlertas":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cerrar()
+
+    def cerrar(self) -> None:
+        self._conexion.close()
+
+    def guardar(self, alertas: Iterable[Alerta], tamano_lote: int = 500) -> int:
+        """Inserta o actualiza `alertas` y devuelve cuántas filas se procesaron.
+
+        Las alertas sin RISARH se ignoran porque no hay con qué identificarlas.
+        """
+        ahora = datetime.now().isoformat(timespec="seconds")
+        total = 0
+        lote = []
+        for alerta in alertas:
+            if not alerta.clave:
+                continue
+            lote.append((
+                alerta.clave,
+                alerta.nombre,
+                alerta.fecha_texto,
+                alerta.fecha.isoformat() if alerta.fecha else None,
+                ahora,
+                ahora,
+                alerta.risarh,
+                alerta.fuente or None,
+            ))
+            if len(lote) >= tamano_lote:
+                total += self._escribir_lote(lote)
+                lote = []
+        if lote:
+            total += self._escribir_lote(lote)
+        return total
+
+    def _escribir_lote(self, lote: List[tuple]) -> int:
+        with self._conexion:
+            self._conexion.executemany(_UPSERT, lote)
+        return len(lote)
+
+    @staticmethod
+    def _filtro(
+        desde: Optional[date],
+        hasta: Optional[date],
+        risarh: Optional[str],
+        texto: Optional[str],
+    ) -> Tuple[str, List[object]]:
+        condiciones = []
+        parametros: List[object] = []
+        if desde is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(desde.isoformat())
+        if hasta is not None:
+            condiciones.append("fecha <= ?")
+            parametros.append(hasta.isoformat())
+        if risarh:
+            risarh = normalizar_risarh(risarh)
+            if "RISARH" in risarh:
+                # "RISARH-1400-2024" o un prefijo ("RISARH-1400"): rango sobre el índice de la clave
+                inicio = risarh[risarh.index("RISARH"):]
+                condiciones.append(f"{_CLAVE} >= ? AND {_CLAVE} < ?")
+                parametros += [inicio, inicio[:-1] + chr(ord(inicio[-1]) + 1)]
+            else:
+                # Cualquier otra parte del identificador ("1400-2024") recorre la tabla
+                condiciones.append("instr(risarh, ?) > 0")
+                parametros.append(risarh)
+        if texto:
+            condiciones.append("nombre LIKE ? ESCAPE '\\'")
+            parametros.append("%" + texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        return (" WHERE " + " AND ".join(condiciones)) if condiciones else "", parametros
+
+    def consultar(
+        self,
+        desde: Optional[date] = None,
+        hasta: Optional[date] = None,
+        risarh: Optional[str] = None,
+        texto: Optional[str] = None,
+        limite: Optional[int] = None,
+        desplazamiento: int = 0,
+    ) -> Iterator[Alerta]:
+        """Genera las alertas con fecha en [desde, hasta], de la más reciente a la más antigua.
+
+        `risarh` filtra por parte del identificador y `texto` por parte del nombre (sin
+        distinguir mayúsculas); `limite` y `desplazamiento` paginan el resultado.
+        Se leen del cursor a medida que se consumen, sin cargar el resultado completo.
+        """
+        filtro, parametros = self._filtro(desde, hasta, risarh, texto)
+        # Las filas guardadas antes de existir `risarh_texto` solo tienen la clave
+        sql = (
+            "SELECT nombre, coalesce(risarh_texto, risarh), fecha_texto, fecha, coalesce(fuente, '') "
+            f"FROM alertas{filtro} ORDER BY fecha DESC, risarh DESC"
+        )
+        if limite is not None:
+            sql += " LIMIT ? OFFSET ?"
+            parametros += [limite, desplazamiento]
+        for nombre, risarh, fecha_texto, fecha, fuente in self._conexion.execute(sql, parametros):
+            yield Alerta(nombre, risarh, fecha_texto, date.fromisoformat(fecha) if fecha else None, fuente)
+
+    def contar(
+        self,
+        desde: Optional[date] = None,
+        hasta: Optional[date] = None,
+        risarh: Optional[str] = None,
+        texto: Optional[str] = None,
+    ) -> int:
+        """Cuántas alertas devolvería `consultar` con los mismos filtros y sin paginar."""
+        filtro, parametros = self._filtro(desde, hasta, risarh, texto)
+        return self._conexion.execute(f"SELECT COUNT(*) FROM alertas{filtro}", parametros).fetchone()[0]
@@ -0,0 +1,285 @@
+"""API HTTP local, de solo lectura, sobre el histórico de alertas (`almacen_path`).
+
+    GET  /alertas?desde=2024-01-01&hasta=2024-12-31&risarh=1400-2024&q=jeringa&pagina=2&por_pagina=50
+    GET  /alertas?...&formato=csv          (o con la cabecera Accept: text/csv)
+    GET  /estado
+    POST /actualizar
+
+Las consultas van al histórico SQLite (índices por fecha y RISARH) y nunca
+descargan nada. Cada petición abre su propia conexión de solo lectura, así que se
+atienden en paralelo aunque una actualización esté escribiendo (modo WAL).
+`POST /actualizar` lanza en segundo plano la descarga del listado según la
+configuración (`main.obtener_alertas`), que guarda cada página en el histórico al
+llegar; `GET /estado` dice si sigue en curso y cómo terminó la última.
+
+Las respuestas llevan ETag: si `If-None-Match` coincide se responde 304 sin cuerpo.
+Si el histórico no se puede leer (bloqueado o dañado) se responde 503 con el error en JSON.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import math
+import sqlite3
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from invima_alerta import Alerta
+from invima_almacen import AlmacenAlertas
+
+POR_PAGINA = 50
+MAX_POR_PAGINA = 1000
+FORMATOS = ("json", "csv")
+COLUMNAS_CSV = ("risarh", "nombre", "fecha_texto", "fecha", "fuente")
+
+
+def _fecha(parametros: Dict[str, str], clave: str) -> Optional[date]:
+    valor = parametros.get(clave)
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f"Fecha inválida en '{clave}': {valor!r} (se esperaba aaaa-mm-dd).") from None
+
+
+def _entero(parametros: Dict[str, str], clave: str, defecto: int, minimo: int, maximo: int) -> int:
+    valor = parametros.get(clave)
+    if not valor:
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        numero = minimo - 1
+    if not minimo <= numero <= maximo:
+        raise ValueError(f"'{clave}' debe ser un entero entre {minimo} y {maximo}.")
+    return numero
+
+
+def consulta_desde_parametros(parametros: Dict[str, str]) -> Tuple[Dict, int, int]:
+    """Filtros de `AlmacenAlertas.consultar`, página y tamaño de página de los parámetros de la URL.
+
+    Lanza ValueError si algún parámetro es inválido.
+    """
+    filtros = {
+        "desde": _fecha(parametros, "desde"),
+        "hasta": _fecha(parametros, "hasta"),
+        "risarh": parametros.get("risarh") or None,
+        "texto": parametros.get("q") or None,
+    }
+    por_pagina = _entero(parametros, "por_pagina", POR_PAGINA, 1, MAX_POR_PAGINA)
+    pagina = _entero(parametros, "pagina", 1, 1, 10 ** 9)
+    return filtros, pagina, por_pagina
+
+
+def _como_dict(alerta: Alerta) -> Dict[str, Optional[str]]:
+    return {
+        "risarh": alerta.risarh,
+        "nombre": alerta.nombre,
+        "fecha_texto": alerta.fecha_texto,
+        "fecha": alerta.fecha.isoformat() if alerta.fecha else None,
+        "fuente": alerta.fuente or None,
+    }
+
+
+def _csv(alertas: List[Alerta]) -> bytes:
+    salida = io.StringIO()
+    escritor = csv.DictWriter(salida, COLUMNAS_CSV, lineterminator="\r\n")
+    escritor.writeheader()
+    escritor.writerows(_como_dict(alerta) for alerta in alertas)
+    # Con BOM para que Excel reconozca UTF-8 al abrirlo
+    return ("\ufeff" + salida.getvalue()).encode("utf-8")
+
+
+class ApiAlertas:
+    """Servidor HTTP de la API (ver el docstring del módulo) en `host`:`puerto`.
+
+    `servir` atiende en el hilo actual hasta que se interrumpe; `iniciar` lo hace en
+    un hilo auxiliar (también como gestor de contexto).
+    """
+
+    def __init__(
+        self,
+        config: Dict,
+        host: str = "127.0.0.1",
+        puerto: int = 8080,
+        progress: Optional[Callable[[str], None]] = None,
+    ):
+        self.config = config
+        self.progress = progress
+        self.almacen_path = config.get("almacen_path", "alertas_invima.sqlite3")
+        if not self.almacen_path:
+            raise ValueError("La API necesita el histórico de alertas y 'almacen_path' está vacío.")
+        # Crea la base con su esquema si aún no existe, para que las lecturas no fallen
+        AlmacenAlertas(self.almacen_path).cerrar()
+        self.peticiones = 0
+        self._lock = threading.Lock()
+        self._actualizacion: Optional[threading.Thread] = None
+        self._estado = {"actualizando": False, "inicio": None, "fin": None, "alertas": None, "error": None}
+        self._http = ThreadingHTTPServer((host, int(puerto)), self._manejador())
+        self._http.daemon_threads = True
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._http.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def servir(self) -> None:
+        try:
+            self._http.serve_forever()
+        finally:
+            self._http.server_close()
+
+    def iniciar(self) -> "ApiAlertas":
+        self._hilo = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self) -> None:
+        if self._hilo is not None:
+            self._http.shutdown()
+            self._hilo.join()
+            self._hilo = None
+        self._http.server_close()
+
+    def __enter__(self) -> "ApiAlertas":
+        return self.iniciar()
+
+    def __exit__(self, *exc) -> None:
+        self.detener()
+
+    def estado(self) -> Dict:
+        with self._lock:
+            estado = dict(self._estado)
+        with AlmacenAlertas(self.almacen_path, solo_lectura=True) as almacen:
+            estado["total_almacen"] = almacen.contar()
+        return estado
+
+    def consultar(self, filtros: Dict, pagina: int, por_pagina: int) -> Tuple[int, List[Alerta]]:
+        """Total de alertas que cumplen `filtros` y las de la página pedida."""
+        with AlmacenAlertas(self.almacen_path, solo_lectura=True) as almacen:
+            total = almacen.contar(**filtros)
+            alertas = list(almacen.consultar(**filtros, limite=por_pagina, desplazamiento=(pagina - 1) * por_pagina))
+        return total, alertas
+
+    def actualizar(self) -> bool:
+        """Lanza la descarga del listado en segundo plano; False si ya hay una en curso."""
+        with self._lock:
+            if self._estado["actualizando"]:
+                return False
+            self._estado.update(actualizando=True, inicio=datetime.now().isoformat(timespec="seconds"), fin=None, error=None)
+        self._actualizacion = threading.Thread(target=self._actualizar, daemon=True)
+        self._actualizacion.start()
+        return True
+
+    def _actualizar(self) -> None:
+        # main (requests, openpyxl, httpx) solo se importa si alguien pide una actualización
+        from main import obtener_alertas
+
+        alertas = None
+        error = None
+        try:
+            alertas = len(obtener_alertas(self.config, self.progress))
+        except Exception as e:
+            error = str(e)
+            if self.progress:
+                self.progress(f"Error al actualizar el histórico: {e}")
+        with self._lock:
+            self._estado.update(
+                actualizando=False,
+                fin=datetime.now().isoformat(timespec="seconds"),
+                alertas=alertas,
+                error=error,
+            )
+
+    def _manejador(self):
+        api = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with api._lock:
+                    api.peticiones += 1
+                url = urlsplit(self.path)
+                try:
+                    if url.path == "/alertas":
+                        self._alertas({clave: valores[-1] for clave, valores in parse_qs(url.query).items()})
+                    elif url.path == "/estado":
+                        self._json(200, api.estado())
+                    else:
+                        self._json(404, {"error": f"No existe {url.path}."})
+                except sqlite3.Error as e:
+                    self._error_almacen(e)
+
+            def do_POST(self):
+                with api._lock:
+                    api.peticiones += 1
+                url = urlsplit(self.path)
+                if url.path != "/actualizar":
+                    self._json(404, {"error": f"No existe {url.path}."})
+                    return
+                iniciada = api.actualizar()
+                try:
+                    self._json(202 if iniciada else 409, api.estado())
+                except sqlite3.Error as e:
+                    self._error_almacen(e)
+
+            def _error_almacen(self, error: sqlite3.Error) -> None:
+                # Base bloqueada, dañada o borrada: se responde con el error en lugar de cortar la conexión
+                self._json(503, {"error": f"No se pudo leer el histórico de alertas: {error}"})
+
+            def _alertas(self, parametros: Dict[str, str]) -> None:
+                formato = parametros.get("formato") or ("csv" if "text/csv" in self.headers.get("Accept", "") else "json")
+                try:
+                    if formato not in FORMATOS:
+                        raise ValueError(f"Formato desconocido {formato!r} (opciones: {', '.join(FORMATOS)}).")
+                    filtros, pagina, por_pagina = consulta_desde_parametros(parametros)
+                except ValueError as e:
+                    self._json(400, {"error": str(e)})
+                    return
+                total, alertas = api.consultar(filtros, pagina, por_pagina)
+                cabeceras = {"X-Total-Count": str(total)}
+                if formato == "csv":
+                    self._responder(200, _csv(alertas), "text/csv; charset=utf-8", cabeceras)
+                    return
+                self._json(200, {
+                    "total": total,
+                    "pagina": pagina,
+                    "por_pagina": por_pagina,
+                    "paginas": math.ceil(total / por_pagina),
+                    "alertas": [_como_dict(alerta) for alerta in alertas],
+                }, cabeceras)
+
+            def _json(self, estado: int, datos: Dict, cabeceras: Optional[Dict[str, str]] = None) -> None:
+                cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+                self._responder(estado, cuerpo, "application/json; charset=utf-8", cabeceras)
+
+            def _responder(self, estado: int, cuerpo: bytes, tipo: str, cabeceras: Optional[Dict[str, str]] = None) -> None:
+                cabeceras = dict(cabeceras or {})
+                if estado == 200:
+                    etag = '"%s"' % hashlib.blake2b(cuerpo, digest_size=16).hexdigest()
+                    cabeceras.update({"ETag": etag, "Cache-Control": "no-cache"})
+                    if self.headers.get("If-None-Match") == etag:
+                        estado, cuerpo = 304, b""
+                self.send_response(estado)
+                if estado != 304:
+                    self.send_header("Content-Type", tipo)
+                for nombre, valor in cabeceras.items():
+                    self.send_header(nombre, valor)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                try:
+                    self.wfile.write(cuerpo)
+                except ConnectionError:
+                    pass
+
+        return Manejador
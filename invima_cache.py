@@ -0,0 +1,154 @@
+"""Caché HTTP en disco con validación condicional (ETag / Last-Modified)."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class CacheHTTP:
+    """Guarda cuerpos de respuesta junto a sus validadores para reutilizarlos con 304.
+
+    Cada entrada se guarda como `<sha1(url)>.body` dentro de `directorio` y sus
+    metadatos en `indice.json`. Cuando el total supera `tamano_maximo` bytes se
+    eliminan las entradas usadas hace más tiempo (LRU). Si `ttl` (segundos) está
+    definido, una entrada más reciente que ese valor se sirve sin consultar al
+    servidor; si no, siempre se revalida con If-None-Match / If-Modified-Since.
+
+    Leer una entrada solo actualiza su uso en memoria; el índice se escribe al
+    guardar una entrada nueva y en `cerrar` (también como gestor de contexto).
+    """
+
+    def __init__(self, directorio: str, tamano_maximo: int = 50 * 1024 * 1024, ttl: Optional[float] = None):
+        self.directorio = Path(directorio)
+        self.tamano_maximo = int(tamano_maximo)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._ruta_indice = self.directorio / "indice.json"
+        try:
+            self._indice: Dict[str, Dict] = json.loads(self._ruta_indice.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._indice = {}
+        # Hay usos o revalidaciones en memoria que aún no están en `indice.json`
+        self._sucio = False
+
+    def __enter__(self) -> "CacheHTTP":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cerrar()
+
+    def cerrar(self) -> None:
+        """Escribe el índice si cambió desde la última vez."""
+        with self._lock:
+            if self._sucio:
+                self._guardar_indice()
+
+    @staticmethod
+    def _clave(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _ruta_cuerpo(self, clave: str) -> Path:
+        return self.directorio / f"{clave}.body"
+
+    def _guardar_indice(self) -> None:
+        temporal = self._ruta_indice.with_suffix(".tmp")
+        temporal.write_text(json.dumps(self._indice), encoding="utf-8")
+        os.replace(temporal, self._ruta_indice)
+        self._sucio = False
+
+    def fresca(self, url: str) -> bool:
+        """Indica si la entrada de `url` sigue dentro del TTL y puede servirse sin red."""
+        if self.ttl is None:
+            return False
+        with self._lock:
+            meta = self._indice.get(self._clave(url))
+        return meta is not None and time.time() - meta["guardado"] < self.ttl
+
+    def cabeceras_condicionales(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            meta = self._indice.get(self._clave(url))
+        if not meta:
+            return {}
+        cabeceras = {}
+        if meta.get("etag"):
+            cabeceras["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            cabeceras["If-Modified-Since"] = meta["last_modified"]
+        return cabeceras
+
+    def leer(self, url: str, revalidada: bool = False) -> Optional[bytes]:
+        """Devuelve el cuerpo guardado para `url` (o None) y lo marca como usado.
+
+        Con `revalidada=True` (tras un 304) también se reinicia el TTL de la entrada.
+        """
+        clave = self._clave(url)
+        with self._lock:
+            meta = self._indice.get(clave)
+            if meta is None:
+                return None
+            try:
+                cuerpo = self._ruta_cuerpo(clave).read_bytes()
+            except OSError:
+                del self._indice[clave]
+                self._sucio = True
+                return None
+            ahora = time.time()
+            meta["usado"] = ahora
+            if revalidada:
+                meta["guardado"] = ahora
+            self._sucio = True
+        return cuerpo
+
+    def tipo_contenido(self, url: str) -> Optional[str]:
+        """Cabecera Content-Type con la que se guardó la entrada de `url` (para su charset)."""
+        with self._lock:
+            meta = self._indice.get(self._clave(url))
+        return meta.get("tipo") if meta else None
+
+    def guardar(
+        self,
+        url: str,
+        cuerpo: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        tipo_contenido: Optional[str] = None,
+    ) -> None:
+        # Sin validadores ni TTL la entrada nunca podría reutilizarse
+        if not (etag or last_modified or self.ttl is not None):
+            return
+        if len(cuerpo) > self.tamano_maximo:
+            return
+        clave = self._clave(url)
+        with self._lock:
+            self._ruta_cuerpo(clave).write_bytes(cuerpo)
+            ahora = time.time()
+            self._indice[clave] = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "tipo": tipo_contenido,
+                "tamano": len(cuerpo),
+                "guardado": ahora,
+                "usado": ahora,
+            }
+            self._expulsar()
+            self._guardar_indice()
+
+    def _expulsar(self) -> None:
+        total = sum(meta["tamano"] for meta in self._indice.values())
+        if total <= self.tamano_maximo:
+            return
+        for clave, meta in sorted(self._indice.items(), key=lambda item: item[1]["usado"]):
+            try:
+                self._ruta_cuerpo(clave).unlink()
+            except OSError:
+                pass
+            del self._indice[clave]
+            total -= meta["tamano"]
+            if total <= self.tamano_maximo:
+                break
@@ -0,0 +1,66 @@
+"""Caché permanente de las páginas de detalle de las alertas, por RISARH.
+
+La página de detalle de una alerta casi nunca cambia después de publicada, así que
+se guarda sin caducidad y solo las alertas nuevas cuestan una petición. Se guarda el
+HTML (comprimido) y no los campos extraídos: si `invima_parser.parsear_detalle`
+mejora, las alertas antiguas se benefician sin volver a descargarlas.
+"""
+
+import sqlite3
+import zlib
+from dataclasses import replace
+from datetime import datetime
+from typing import Optional
+
+from invima_alerta import Alerta, Detalle, parsear_fecha
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS detalles (
+    risarh TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    html BLOB NOT NULL,
+    obtenido TEXT NOT NULL
+);
+"""
+
+
+class CacheDetalles:
+    """Base SQLite (modo WAL) con el HTML de la página de detalle de cada RISARH."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(_ESQUEMA)
+
+    def __enter__(self) -> "CacheDetalles":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cerrar()
+
+    def cerrar(self) -> None:
+        self._conexion.close()
+
+    def __len__(self) -> int:
+        return self._conexion.execute("SELECT COUNT(*) FROM detalles").fetchone()[0]
+
+    def leer(self, risarh: str) -> Optional[bytes]:
+        fila = self._conexion.execute("SELECT html FROM detalles WHERE risarh = ?", (risarh,)).fetchone()
+        return zlib.decompress(fila[0]) if fila else None
+
+    def guardar(self, risarh: str, url: str, html: bytes) -> None:
+        with self._conexion:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO detalles (risarh, url, html, obtenido) VALUES (?, ?, ?, ?)",
+                (risarh, url, zlib.compress(html, 6), datetime.now().isoformat(timespec="seconds")),
+            )
+
+
+def enriquecer(alerta: Alerta, detalle: Detalle) -> Alerta:
+    """`alerta` con su detalle; si el detalle trae una fecha completa, reemplaza al año del listado."""
+    fecha = parsear_fecha(detalle.fecha_texto) if detalle.fecha_texto else None
+    if fecha is None:
+        return replace(alerta, detalle=detalle)
+    return replace(alerta, detalle=detalle, fecha_texto=detalle.fecha_texto, fecha=fecha)
@@ -0,0 +1,452 @@
+"""Escritura del reporte Excel a partir de la plantilla."""
+
+from copy import copy
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import openpyxl
+from openpyxl.cell import MergedCell, WriteOnlyCell
+from openpyxl.drawing.image import Image as OpenpyxlImage
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+
+from invima_alerta import Alerta
+from invima_fuentes import fuentes_desde_config
+from invima_inventario import indice_inventario
+from invima_metricas import contar, tramo
+from invima_plantilla import cargar_plantilla, logotipo_png
+
+MODOS_SALIDA = ("plantilla", "masivo")
+# Qué hacer con las alertas que no caben entre `fila_inicial` y `ultima_fila_datos`
+MODOS_DESBORDAMIENTO = ("truncar", "insertar", "hojas")
+# Prefijo de la novedad de una alerta cuyo contenido cambió desde la última ejecución
+MARCA_CAMBIADA = "[ACTUALIZADA] "
+# Excel no admite títulos de hoja más largos
+_MAX_TITULO_HOJA = 31
+
+
+def insertar_logotipo(sheet, config: Dict, progress: Optional[Callable[[str], None]] = None) -> None:
+    """Inserta el logotipo de `image_path` en `image_merge_range` salvo que la plantilla ya lo tenga."""
+    # Decide whether to insert an image. If the template already contains the logo,
+    # the GUI sets `template_has_logo` (default True) and we skip insertion.
+    template_has_logo = bool(config.get('template_has_logo', True))
+    image_path = config.get('image_path', 'logotipo.png')
+    image_merge_range = config.get('image_merge_range', 'A1:B4')
+    # Desired width in pixels for the image (tweak if needed to fit the template)
+    image_width_px = int(config.get('image_width_px', 240))
+
+    if template_has_logo:
+        if progress:
+            progress("Plantilla marcada como que ya contiene el logotipo; omitiendo inserción de imagen.")
+    else:
+        try:
+            img_path_obj = Path(image_path)
+            if img_path_obj.exists():
+                # Optionally merge the target cells so image is visually contained
+                if image_merge_range:
+                    try:
+                        sheet.merge_cells(image_merge_range)
+                    except Exception:
+                        # ignore merge errors and continue
+                        pass
+
+                # Resized with Pillow to target width, preserving aspect ratio (cached per width)
+                png, new_h = logotipo_png(str(img_path_obj), image_width_px)
+                op_img = OpenpyxlImage(BytesIO(png))
+                op_img.width = image_width_px
+                op_img.height = new_h
+                # Anchor to the first cell of the merge (e.g. 'A1')
+                anchor_cell = image_merge_range.split(':')[0]
+                sheet.add_image(op_img, anchor_cell)
+                if progress:
+                    progress(f"Imagen insertada desde: {image_path} en {image_merge_range}")
+            else:
+                if progress:
+                    progress(f"No se encontró imagen en: {image_path} — omitiendo inserción.")
+        except Exception as e:
+            if progress:
+                progress(f"Advertencia: no se pudo insertar la imagen: {e}")
+
+
+class EscritorReporte:
+    """Llena la plantilla fila a fila a medida que llegan las alertas.
+
+    Usa las mismas claves de `config` que `run_invima_scraper` para la plantilla,
+    las filas y los datos fijos. Lo que pasa con las alertas que no caben entre
+    `fila_inicial` y `ultima_fila_datos` depende de `desbordamiento`:
+      - "truncar" (por defecto): solo se cuentan, así que la memoria no crece con ellas.
+      - "insertar": se guardan aparte y al final se insertan de una vez las filas
+        necesarias antes del pie, con el estilo y las combinaciones de la última fila de datos.
+      - "hojas": cada vez que se llena una hoja se añade otra copia de la plantilla.
+    """
+
+    def __init__(self, config: Dict, progress: Optional[Callable[[str], None]] = None):
+        self.config = config
+        self.progress = progress
+        self.plantilla = config.get("plantilla_path", "plantilla.xlsx")
+        self.salida = config.get("salida_path", "reporte_invima_lleno.xlsx")
+        self.fila_inicial = int(config.get("fila_inicial", 6))
+        self.ultima_fila_datos = int(config.get("ultima_fila_datos", 34))
+
+        self.medicamento_dispositivo = config.get("medicamento_dispositivo", "DISPOSITIVO MÉDICO")
+        self.aplica_institucion = config.get("aplica_institucion", "NO")
+        self.acciones_ejecutadas = config.get("acciones_ejecutadas", "N/A")
+        self.responsable_revision = config.get("responsable_revision", "")
+        # Con varias fuentes, cada una puede tener su propio valor de la columna C
+        self.medicamento_por_fuente = {
+            fuente.nombre: fuente.medicamento_dispositivo
+            for fuente in fuentes_desde_config(config)
+            if fuente.medicamento_dispositivo
+        }
+        # Con inventario, la columna E dice qué equipos de la institución coinciden con cada alerta
+        self.inventario = None
+        self.inventario_max_coincidencias = int(config.get("inventario_max_coincidencias", 3))
+        if config.get("inventario_path"):
+            with tramo("carga_inventario"):
+                self.inventario = indice_inventario(
+                    config["inventario_path"],
+                    config.get("inventario_columnas"),
+                    float(config.get("inventario_umbral", 0.6)),
+                )
+            if progress:
+                progress(f"Inventario cargado: {len(self.inventario)} equipos de '{config['inventario_path']}'.")
+
+        self.desbordamiento = config.get("desbordamiento", "truncar")
+        if self.desbordamiento not in MODOS_DESBORDAMIENTO:
+            raise ValueError(
+                f"Modo de desbordamiento desconocido: {self.desbordamiento!r} "
+                f"(opciones: {', '.join(MODOS_DESBORDAMIENTO)})"
+            )
+
+        self.espacios_disponibles = self.ultima_fila_datos - self.fila_inicial + 1
+        self.risarh_escritos: List[str] = []
+        self.total = 0
+        self._pendientes: List[Alerta] = []
+        self._filas_en_hoja = 0
+
+        try:
+            if progress:
+                progress(f"Cargando la plantilla '{self.plantilla}'...")
+            with tramo("carga_plantilla"):
+                self._cargar_plantilla()
+        except FileNotFoundError:
+            if progress:
+                progress(f"ERROR: No se encontró el archivo de plantilla '{self.plantilla}'.")
+            raise
+        except Exception as e:
+            if progress:
+                progress(f"Error al procesar Excel: {e}")
+            raise
+
+    def _cargar_plantilla(self) -> None:
+        self.workbook = cargar_plantilla(self.plantilla)
+        self.sheet = self.workbook.active
+        self.hojas = [self.sheet]
+        self._molde = None
+        if self.desbordamiento == "hojas":
+            # Copia intacta de la plantilla para clonar hojas nuevas; se quita al guardar
+            self._molde = self.workbook.copy_worksheet(self.sheet)
+            self._molde.sheet_state = "hidden"
+
+    def agregar(self, alerta: Alerta) -> bool:
+        """Escribe `alerta` en la siguiente fila libre. Devuelve False si ya no cabe."""
+        self.total += 1
+        if self._filas_en_hoja >= self.espacios_disponibles:
+            if self.desbordamiento == "insertar":
+                self._pendientes.append(alerta)
+                self.risarh_escritos.append(alerta.clave)
+                contar("filas_escritas")
+                return True
+            if self.desbordamiento == "truncar":
+                return False
+            self._nueva_hoja()
+        with tramo("escritura_celdas"):
+            self._escribir_fila(self.sheet, self.fila_inicial + self._filas_en_hoja, alerta)
+        self._filas_en_hoja += 1
+        self.risarh_escritos.append(alerta.clave)
+        contar("filas_escritas")
+        return True
+
+    def _escribir_fila(self, sheet, row: int, alerta: Alerta) -> None:
+        sheet[f'A{row}'] = alerta.fecha_texto
+        sheet[f'B{row}'] = alerta.risarh
+        sheet[f'C{row}'] = self.medicamento_por_fuente.get(alerta.fuente, self.medicamento_dispositivo)
+        sheet[f'D{row}'] = self._novedad(alerta)
+        sheet[f'E{row}'] = self._aplica(alerta)
+        sheet[f'F{row}'] = self.acciones_ejecutadas
+        sheet[f'H{row}'] = self.responsable_revision
+
+    @staticmethod
+    def _novedad(alerta: Alerta) -> str:
+        # Con la página de detalle, la novedad reportada lleva también fabricante, lotes y descripción
+        nombre = f"{MARCA_CAMBIADA}{alerta.nombre}" if alerta.cambiada else alerta.nombre
+        if alerta.fuente:
+            # Con varias fuentes cada alerta dice de cuál salió
+            nombre = f"[{alerta.fuente}] {nombre}"
+        if alerta.detalle is None:
+            return nombre
+        return f"{nombre}\n{alerta.detalle.texto()}".rstrip()
+
+    def _aplica(self, alerta: Alerta) -> str:
+        # Sin inventario (o sin coincidencias) la columna E lleva el valor fijo de la configuración
+        if self.inventario is None:
+            return self.aplica_institucion
+        with tramo("cruce_inventario"):
+            coincidencias = self.inventario.buscar_alerta(alerta, self.inventario_max_coincidencias)
+        if not coincidencias:
+            return self.aplica_institucion
+        contar("alertas_en_inventario")
+        return "SÍ: " + "; ".join(coincidencia.texto() for coincidencia in coincidencias)
+
+    def _nueva_hoja(self) -> None:
+        """Añade una copia de la plantilla (con sus imágenes) y sigue escribiendo en ella."""
+        hoja = self.workbook.copy_worksheet(self._molde)
+        hoja.sheet_state = "visible"
+        sufijo = f" ({len(self.hojas) + 1})"
+        hoja.title = self.hojas[0].title[:_MAX_TITULO_HOJA - len(sufijo)] + sufijo
+        # copy_worksheet no copia las imágenes
+        for imagen in self.hojas[0]._images:
+            datos = imagen._data()
+            # `_data` cierra el búfer original, que aún hace falta para guardar la primera hoja
+            imagen.ref = BytesIO(datos)
+            nueva = OpenpyxlImage(BytesIO(datos))
+            nueva.anchor = copy(imagen.anchor)
+            nueva.width, nueva.height = imagen.width, imagen.height
+            hoja.add_image(nueva)
+        self.hojas.append(hoja)
+        self.sheet = hoja
+        self._filas_en_hoja = 0
+
+    def _insertar_filas(self, cantidad: int) -> int:
+        """Inserta `cantidad` filas tras `ultima_fila_datos` con el formato de esa fila.
+
+        `insert_rows` solo mueve las celdas, así que aquí se desplazan también las
+        combinaciones y altos de fila del pie. El estilo se replica compartiendo el
+        StyleArray de cada columna de la fila modelo, sin copiar fuentes ni bordes por celda.
+        Retorna la primera fila insertada.
+        """
+        sheet = self.sheet
+        modelo = self.ultima_fila_datos
+        desde = modelo + 1
+
+        combinadas_abajo = [rango for rango in sheet.merged_cells.ranges if rango.min_row >= desde]
+        for rango in combinadas_abajo:
+            sheet.merged_cells.remove(rango)
+        altos_abajo = {
+            fila: dimension.height
+            for fila, dimension in sheet.row_dimensions.items()
+            if fila >= desde and dimension.height is not None
+        }
+
+        sheet.insert_rows(desde, cantidad)
+
+        for rango in combinadas_abajo:
+            rango.shift(row_shift=cantidad)
+            sheet.merged_cells.add(rango)
+        for fila in altos_abajo:
+            sheet.row_dimensions[fila].height = None
+        for fila, alto in altos_abajo.items():
+            sheet.row_dimensions[fila + cantidad].height = alto
+
+        # Las celdas cubiertas por combinaciones de la fila modelo se crean ya como
+        # MergedCell con su borde; así no hace falta merge_cells, que es lento fila a fila.
+        estilos = [(celda.column, celda._style, isinstance(celda, MergedCell)) for celda in sheet[modelo] if celda.has_style]
+        combinadas_fila = [
+            (get_column_letter(rango.min_col), get_column_letter(rango.max_col))
+            for rango in sheet.merged_cells.ranges
+            if rango.min_row == rango.max_row == modelo
+        ]
+        alto_modelo = sheet.row_dimensions[modelo].height
+        for fila in range(desde, desde + cantidad):
+            for columna, estilo, combinada in estilos:
+                if combinada:
+                    celda = sheet._cells[(fila, columna)] = MergedCell(sheet, fila, columna)
+                else:
+                    celda = sheet.cell(fila, columna)
+                celda._style = copy(estilo)
+            for primera, ultima in combinadas_fila:
+                sheet.merged_cells.ranges.add(MergedCellRange(sheet, f"{primera}{fila}:{ultima}{fila}"))
+            if alto_modelo is not None:
+                sheet.row_dimensions[fila].height = alto_modelo
+        return desde
+
+    def guardar(self) -> str:
+        """Inserta el logotipo si corresponde, guarda el libro y retorna la ruta de salida."""
+        config = self.config
+        progress = self.progress
+        sheet = self.sheet
+        try:
+            if self.desbordamiento == "truncar" and self.total > self.espacios_disponibles and progress:
+                progress(f"Se extrajeron {self.total} alertas, pero la plantilla tiene espacio para {self.espacios_disponibles}. Se escribieron las primeras {self.espacios_disponibles}.")
+
+            if self._pendientes:
+                if progress:
+                    progress(f"Insertando {len(self._pendientes)} filas adicionales en la plantilla...")
+                with tramo("escritura_celdas"):
+                    fila = self._insertar_filas(len(self._pendientes))
+                    for alerta in self._pendientes:
+                        self._escribir_fila(sheet, fila, alerta)
+                        fila += 1
+                self._pendientes = []
+
+            if self._molde is not None:
+                self.workbook.remove(self._molde)
+                self._molde = None
+                if len(self.hojas) > 1 and progress:
+                    progress(f"Las {self.total} alertas se repartieron en {len(self.hojas)} hojas.")
+
+            with tramo("imagen"):
+                for hoja in self.hojas:
+                    insertar_logotipo(hoja, config, progress)
+
+            with tramo("guardado"):
+                self.workbook.save(self.salida)
+            if progress:
+                progress(f"Reporte guardado en: {self.salida}")
+            return self.salida
+
+        except Exception as e:
+            if progress:
+                progress(f"Error al procesar Excel: {e}")
+            raise
+
+
+class EscritorMasivo(EscritorReporte):
+    """Exportación sin límite de filas con un libro de solo escritura (`write_only`).
+
+    Copia una vez el encabezado de la plantilla (valores, estilos, combinaciones,
+    anchos de columna e imágenes) y el estilo de la primera fila de datos; después
+    cada alerta se añade como una fila nueva que se vuelca directamente al disco.
+    El pie de la plantilla (filas tras `ultima_fila_datos`) se añade al final.
+    Las combinaciones de celdas de las filas de datos no se replican, ya que
+    mantenerlas obligaría a guardar un rango por fila en memoria. Como no hay
+    límite de filas, `desbordamiento` no aplica.
+    """
+
+    def _cargar_plantilla(self) -> None:
+        origen = cargar_plantilla(self.plantilla).active
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = sheet = self.workbook.create_sheet(origen.title)
+        self.hojas = [sheet]
+        self._molde = None
+        self.espacios_disponibles = float("inf")
+
+        # Solo hasta la última columna con contenido o combinada (la plantilla tiene formato hasta Z)
+        self.num_columnas = max(
+            [celda.column for fila in origen.iter_rows(max_row=self.fila_inicial - 1) for celda in fila if celda.value is not None]
+            + [rango.max_col for rango in origen.merged_cells.ranges]
+        )
+        for letra, dimension in origen.column_dimensions.items():
+            sheet.column_dimensions[letra].width = dimension.width
+            sheet.column_dimensions[letra].hidden = dimension.hidden
+        sheet.sheet_format.defaultRowHeight = origen.row_dimensions[self.fila_inicial].height or 15
+        sheet.sheet_format.customHeight = True
+        sheet.page_setup.orientation = origen.page_setup.orientation
+        sheet.page_setup.paperSize = origen.page_setup.paperSize
+        sheet.print_options.horizontalCentered = origen.print_options.horizontalCentered
+
+        for fila in range(1, self.fila_inicial):
+            self._copiar_fila(origen, fila, fila)
+        for rango in origen.merged_cells.ranges:
+            if rango.max_row < self.fila_inicial:
+                sheet.merged_cells.add(CellRange(rango.coord))
+        for imagen in origen._images:
+            sheet.add_image(imagen)
+
+        # Prototipos de estilo: se copian una vez y luego solo se comparte su StyleArray
+        self._estilos = [self._copiar_celda(origen.cell(self.fila_inicial, col))._style for col in range(1, self.num_columnas + 1)]
+        self._origen = origen
+        self._siguiente_fila = self.fila_inicial
+
+    def _copiar_celda(self, celda, valor=None) -> WriteOnlyCell:
+        nueva = WriteOnlyCell(self.sheet, valor)
+        if celda.has_style:
+            nueva.font = copy(celda.font)
+            nueva.border = copy(celda.border)
+            nueva.fill = copy(celda.fill)
+            nueva.number_format = celda.number_format
+            nueva.alignment = copy(celda.alignment)
+            nueva.protection = copy(celda.protection)
+        return nueva
+
+    def _copiar_fila(self, origen, fila_origen: int, fila_destino: int) -> None:
+        alto = origen.row_dimensions[fila_origen].height
+        if alto is not None:
+            self.sheet.row_dimensions[fila_destino].height = alto
+        self.sheet.append([
+            self._copiar_celda(origen.cell(fila_origen, col), origen.cell(fila_origen, col).value)
+            for col in range(1, self.num_columnas + 1)
+        ])
+
+    def agregar(self, alerta: Alerta) -> bool:
+        self.total += 1
+        valores = [
+            alerta.fecha_texto,
+            alerta.risarh,
+            self.medicamento_por_fuente.get(alerta.fuente, self.medicamento_dispositivo),
+            self._novedad(alerta),
+            self._aplica(alerta),
+            self.acciones_ejecutadas,
+            None,
+            self.responsable_revision,
+        ]
+        valores += [None] * (self.num_columnas - len(valores))
+        with tramo("escritura_celdas"):
+            fila = []
+            for valor, estilo in zip(valores, self._estilos):
+                celda = WriteOnlyCell(self.sheet, valor)
+                celda._style = estilo
+                fila.append(celda)
+            self.sheet.append(fila)
+        self.risarh_escritos.append(alerta.clave)
+        contar("filas_escritas")
+        self._siguiente_fila += 1
+        return True
+
+    def guardar(self) -> str:
+        """Añade el pie de la plantilla, guarda el libro y retorna la ruta de salida."""
+        origen = self._origen
+        try:
+            ultima_con_valor = max(
+                (celda.row for fila in origen.iter_rows(min_row=self.ultima_fila_datos + 1) for celda in fila if celda.value is not None),
+                default=self.ultima_fila_datos,
+            )
+            desplazamiento = self._siguiente_fila - (self.ultima_fila_datos + 1)
+            for fila in range(self.ultima_fila_datos + 1, ultima_con_valor + 1):
+                self._copiar_fila(origen, fila, fila + desplazamiento)
+            for rango in origen.merged_cells.ranges:
+                if rango.min_row > self.ultima_fila_datos:
+                    nuevo = CellRange(rango.coord)
+                    nuevo.shift(row_shift=desplazamiento)
+                    self.sheet.merged_cells.add(nuevo)
+        except Exception as e:
+            if self.progress:
+                self.progress(f"Error al procesar Excel: {e}")
+            raise
+        if self.progress:
+            self.progress(f"Exportación masiva: {self.total} filas escritas.")
+        return super().guardar()
+
+
+def crear_escritor(config: Dict, progress: Optional[Callable[[str], None]] = None) -> EscritorReporte:
+    """Escritor según `modo_salida`: "plantilla" (rellena las filas de la plantilla) o "masivo"."""
+    modo = config.get("modo_salida", "plantilla")
+    if modo not in MODOS_SALIDA:
+        raise ValueError(f"Modo de salida desconocido: {modo!r} (opciones: {', '.join(MODOS_SALIDA)})")
+    if modo == "masivo":
+        return EscritorMasivo(config, progress)
+    return EscritorReporte(config, progress)
+
+
+def escribir_reporte(
+    alertas: Iterable[Alerta],
+    config: Dict,
+    progress: Optional[Callable[[str], None]] = None,
+) -> str:
+    """Llena la plantilla con `alertas` y la guarda en `salida_path`. Retorna la ruta generada."""
+    escritor = crear_escritor(config, progress)
+    for alerta in alertas:
+        escritor.agregar(alerta)
+    return escritor.guardar()
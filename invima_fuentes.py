@@ -0,0 +1,68 @@
+"""Fuentes del scraping: combinaciones de filtros del listado de INVIMA.
+
+Sin `fuentes` en la configuración hay una sola, `base_url`. Con `fuentes` cada
+elemento es una URL o un diccionario que cambia los filtros de `base_url`:
+
+    "fuentes": [
+        {"nombre": "Dispositivos 2024", "tipo_documento": 1, "anio": 2024},
+        {"nombre": "Medicamentos 2024", "tipo_documento": 2, "anio": 2024,
+         "medicamento_dispositivo": "MEDICAMENTO", "num_pages": 5},
+        {"nombre": "Otra vista", "base_url": "https://...", "parametros": {"x": "1"}}
+    ]
+
+`nombre` identifica la fuente en el progreso y en `Alerta.fuente`;
+`medicamento_dispositivo` y `num_pages` sustituyen a los generales solo para ella.
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+URL_LISTADO = "https://app.invima.gov.co/alertas/dispositivos-medicos-invima?field_tipo_de_documento_value=1&field_a_o_value=1"
+
+# Filtros del listado con nombre corto en la configuración
+FILTROS = {
+    "tipo_documento": "field_tipo_de_documento_value",
+    "anio": "field_a_o_value",
+}
+
+
+class Fuente(NamedTuple):
+    nombre: str
+    url: str
+    num_pages: int
+    medicamento_dispositivo: Optional[str] = None
+
+
+def url_con_filtros(base_url: str, parametros: Dict[str, object]) -> str:
+    """`base_url` con los parámetros de consulta de `parametros` añadidos o sustituidos."""
+    partes = urlsplit(base_url)
+    consulta = dict(parse_qsl(partes.query, keep_blank_values=True))
+    consulta.update({clave: str(valor) for clave, valor in parametros.items()})
+    return urlunsplit(partes._replace(query=urlencode(consulta)))
+
+
+def fuentes_desde_config(config: Dict) -> List[Fuente]:
+    """Fuentes de `config` en orden; una sola (`base_url`) si no hay `fuentes`."""
+    base_url = config.get("base_url", URL_LISTADO)
+    num_pages = int(config.get("num_pages", 2))
+    especificaciones = config.get("fuentes")
+    if not especificaciones:
+        return [Fuente("", base_url, num_pages)]
+
+    fuentes = []
+    for i, especificacion in enumerate(especificaciones, start=1):
+        if isinstance(especificacion, str):
+            especificacion = {"base_url": especificacion}
+        parametros = {FILTROS[clave]: valor for clave, valor in especificacion.items() if clave in FILTROS}
+        parametros.update(especificacion.get("parametros", {}))
+        url = url_con_filtros(especificacion.get("base_url", base_url), parametros)
+        fuentes.append(Fuente(
+            nombre=str(especificacion.get("nombre") or f"Fuente {i}"),
+            url=url,
+            num_pages=int(especificacion.get("num_pages", num_pages)),
+            medicamento_dispositivo=especificacion.get("medicamento_dispositivo"),
+        ))
+    urls = [fuente.url for fuente in fuentes]
+    if len(set(urls)) != len(urls):
+        raise ValueError("Hay fuentes repetidas en 'fuentes' (misma URL y filtros).")
+    return fuentes
@@ -1,17 +1,18 @@
 from __future__ import annotations
 
 import sys
+import asyncio
+import html
 import json
 from pathlib import Path
 from PySide6.QtGui import QFontDatabase, QFont, QPixmap, QPainter, QColor
 from typing import Dict
 
-from PySide6.QtCore import Qt, Slot, QUrl, QSize, Signal, QObject, QThread
+from PySide6.QtCore import Qt, Slot, QUrl, QSize, Signal, QObject, QThread, QTimer
 from PySide6.QtGui import QDesktopServices
 from PySide6.QtGui import QIcon
 from PySide6.QtGui import QPixmap
 from PySide6.QtGui import QPainter, QColor
-from PySide6.QtSvg import QSvgRenderer
 from PySide6.QtWidgets import QSizePolicy
 from PySide6.QtWidgets import (
     QApplication,
@@ -37,13 +38,28 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtGui import QIcon
 
-import main as invima_main
+from invima_progreso import EventoProgreso, MonitorProgreso
 
 
 class MainWindow(QMainWindow):
+    # Claves de configuración que se editan directamente desde la ventana
+    CLAVES_WIDGETS = (
+        'base_url', 'num_pages', 'plantilla_path', 'salida_path', 'fila_inicial',
+        'ultima_fila_datos', 'medicamento_dispositivo', 'aplica_institucion',
+        'acciones_ejecutadas', 'responsable_revision', 'image_path', 'image_width_px',
+        'template_has_logo',
+    )
+    # Líneas que conserva la caja de progreso; las más antiguas se descartan
+    MAX_LINEAS_LOG = 2000
+    # Cada cuánto se lleva el progreso del scraper a la ventana (ms)
+    INTERVALO_PROGRESO_MS = 150
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Invima Reportes - GUI")
+        # Claves de config.json sin control en la ventana (p. ej. concurrencia); se conservan
+        # al guardar y se pasan tal cual al scraper
+        self._config_extra: Dict = {}
         # Central container wrapped later in a scroll area
         central = QWidget()
         layout = QVBoxLayout(central)
@@ -210,6 +226,13 @@ class MainWindow(QMainWindow):
         self.run_btn.clicked.connect(self.run_scraper)
         btn_layout.addWidget(self.run_btn)
 
+        # Cancels the running scrape; downloaded pages stay in the checkpoint for the next run
+        self.cancel_btn = QPushButton("Cancelar")
+        self.cancel_btn.setProperty('role', 'secondary')
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_scraper)
+        btn_layout.addWidget(self.cancel_btn)
+
         self.open_folder_btn = QPushButton("Abrir carpeta")
         self.open_folder_btn.setProperty('role', 'secondary')
         self.open_folder_btn.clicked.connect(self.open_folder)
@@ -230,10 +253,15 @@ class MainWindow(QMainWindow):
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         layout.addWidget(self.progress_bar)
+        # Pages, alerts, throughput and ETA under the bar
+        self.progress_label = QLabel()
+        self.progress_label.setVisible(False)
+        layout.addWidget(self.progress_label)
 
         self.progress_text = QTextEdit()
         self.progress_text.setObjectName('progressBox')
         self.progress_text.setReadOnly(True)
+        self.progress_text.document().setMaximumBlockCount(self.MAX_LINEAS_LOG)
         self.progress_text.setFixedHeight(200)
         layout.addWidget(self.progress_text)
 
@@ -251,7 +279,17 @@ class MainWindow(QMainWindow):
         scroll.setWidget(central)
         self.setCentralWidget(scroll)
 
-        # Try to set icons for main buttons if icons exist (render play icon in white)
+        # The worker never signals the window per message: this timer collects its progress
+        self._monitor: MonitorProgreso | None = None
+        self._timer_progreso = QTimer(self)
+        self._timer_progreso.setInterval(self.INTERVALO_PROGRESO_MS)
+        self._timer_progreso.timeout.connect(self.actualizar_progreso)
+
+        # Icons are loaded right after the window is shown so QtSvg is not on the startup path
+        QTimer.singleShot(0, self.load_icons)
+
+    def load_icons(self):
+        """Set icons for main buttons if icons exist (render play icon in white)."""
         self.try_set_icon(self.run_btn, 'play.svg', tint=QColor(255,255,255))
         self.try_set_icon(self.open_folder_btn, 'folder-open.svg')
         self.try_set_icon(self.save_cfg_btn, 'save.svg')
@@ -286,8 +324,49 @@ class MainWindow(QMainWindow):
         QDesktopServices.openUrl(__import__("PySide6.QtCore", fromlist=["QUrl"]).QUrl.fromLocalFile(carpeta))
 
     def append_progress(self, text: str):
+        if "\n" in text:
+            # Multi-line messages (e.g. the timing summary table) keep their columns
+            self.progress_text.append(f"<pre>{html.escape(text)}</pre>")
+            return
         self.progress_text.append(text)
 
+    @Slot()
+    def actualizar_progreso(self):
+        """Vuelca en la ventana el avance y los mensajes acumulados por el monitor."""
+        if self._monitor is None:
+            return
+        evento, mensajes = self._monitor.tomar()
+        if mensajes:
+            self.progress_text.setUpdatesEnabled(False)
+            for mensaje in mensajes:
+                self.append_progress(mensaje)
+            self.progress_text.setUpdatesEnabled(True)
+        self.mostrar_avance(evento)
+
+    def mostrar_avance(self, evento: EventoProgreso):
+        if evento.fraccion is None:
+            # Total still unknown (template loading, first request): indeterminate
+            self.progress_bar.setRange(0, 0)
+        else:
+            self.progress_bar.setRange(0, evento.paginas_total)
+            self.progress_bar.setValue(min(evento.paginas, evento.paginas_total))
+        self.progress_label.setText(evento.texto())
+
+    def terminar_progreso(self):
+        self._timer_progreso.stop()
+        self.actualizar_progreso()
+        self._monitor = None
+        self.progress_bar.setVisible(False)
+        self.progress_label.setVisible(False)
+
+    @Slot()
+    def cancel_scraper(self):
+        worker = getattr(self, '_worker', None)
+        if worker is not None:
+            self.cancel_btn.setEnabled(False)
+            self.append_progress("Cancelando...")
+            worker.cancel()
+
     def try_set_icon(self, button: QPushButton, icon_name: str, tint: QColor | None = None):
         """Set QIcon from icons/<icon_name> if the file exists. If tint is provided, render SVG tinted to that color."""
         icons_dir = Path(__file__).parent / 'icons'
@@ -300,6 +379,8 @@ class MainWindow(QMainWindow):
                 button.setIconSize(QSize(20, 20))
                 return
             # Render SVG to a pixmap and tint it
+            from PySide6.QtSvg import QSvgRenderer
+
             renderer = QSvgRenderer(str(svg_path))
             pix = QPixmap(20, 20)
             pix.fill(Qt.transparent)
@@ -328,6 +409,7 @@ class MainWindow(QMainWindow):
     @Slot()
     def save_config(self):
         cfg = {
+            **self._config_extra,
             'base_url': self.url_edit.text().strip(),
             'num_pages': int(self.pages_spin.value()),
             'plantilla_path': self.plantilla_edit.text().strip(),
@@ -358,6 +440,7 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, "No existe", "No se encontró 'config.json' en la carpeta del proyecto.")
                 return
             data = json.loads(path.read_text(encoding='utf-8'))
+            self._config_extra = {k: v for k, v in data.items() if k not in self.CLAVES_WIDGETS}
             # Aplicar valores si existen
             self.url_edit.setText(data.get('base_url', self.url_edit.text()))
             self.pages_spin.setValue(int(data.get('num_pages', self.pages_spin.value())))
@@ -380,6 +463,7 @@ class MainWindow(QMainWindow):
     @Slot()
     def run_scraper(self):
         config: Dict = {
+            **self._config_extra,
             'base_url': self.url_edit.text().strip(),
             'num_pages': int(self.pages_spin.value()),
             'plantilla_path': self.plantilla_edit.text().strip(),
@@ -397,47 +481,69 @@ class MainWindow(QMainWindow):
         # Clear previous logs and start background worker so GUI remains responsive
         self.progress_text.clear()
         self.run_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self._monitor = MonitorProgreso()
         self.progress_bar.setVisible(True)
-        # Indeterminate progress while worker runs
-        self.progress_bar.setRange(0, 0)
+        self.progress_label.setVisible(True)
+        self.mostrar_avance(EventoProgreso())
+        self._timer_progreso.start()
 
         # Worker to run scraper in background thread
         class ScraperWorker(QObject):
-            progress = Signal(str)
             finished = Signal(str)
             error = Signal(str)
+            cancelled = Signal()
 
-            def __init__(self, cfg: Dict):
+            def __init__(self, cfg: Dict, monitor: MonitorProgreso):
                 super().__init__()
                 self.cfg = cfg
+                self.monitor = monitor
+                self._loop = None
+                self._tarea = None
+                self._cancelado = False
+
+            async def _ejecutar(self, invima_main):
+                self._loop = asyncio.get_running_loop()
+                self._tarea = asyncio.current_task()
+                if self._cancelado:
+                    # Cancel was pressed while main was still being imported
+                    raise asyncio.CancelledError()
+                # Messages and counters go to the monitor; the window's timer picks them up
+                return await invima_main.generar_reporte_async(self.cfg, self.monitor, self.monitor.metricas)
+
+            def cancel(self):
+                """Called from the GUI thread: cancels the scrape task at its next await."""
+                self._cancelado = True
+                if self._loop is None or self._tarea is None:
+                    return
+                try:
+                    self._loop.call_soon_threadsafe(self._tarea.cancel)
+                except RuntimeError:
+                    # The loop already finished
+                    pass
 
             @Slot()
             def run(self):
                 try:
-                    # progress callback will emit signals to main thread
-                    def progress_cb(text: str):
-                        try:
-                            self.progress.emit(str(text))
-                        except Exception:
-                            pass
-
-                    salida = invima_main.run_invima_scraper(self.cfg, progress=progress_cb)
-                    self.finished.emit(str(salida))
+                    # The scraper and its dependencies (requests, openpyxl...) load on the first run
+                    import main as invima_main
+
+                    escritor = asyncio.run(self._ejecutar(invima_main))
+                    self.finished.emit(str(escritor.salida))
+                except asyncio.CancelledError:
+                    self.cancelled.emit()
                 except Exception as e:
                     self.error.emit(str(e))
 
         # Create thread and worker
         self._worker_thread = QThread(self)
-        self._worker = ScraperWorker(config)
+        self._worker = ScraperWorker(config, self._monitor)
         self._worker.moveToThread(self._worker_thread)
 
-        # Connect signals
-        self._worker.progress.connect(self.append_progress)
-
         def _on_finished(salida_path: str):
-            self.progress_bar.setVisible(False)
-            self.progress_bar.setRange(0, 100)
+            self.terminar_progreso()
             self.run_btn.setEnabled(True)
+            self.cancel_btn.setEnabled(False)
             QMessageBox.information(self, "Terminado", f"Reporte generado: {salida_path}")
             # cleanup
             try:
@@ -447,8 +553,9 @@ class MainWindow(QMainWindow):
                 pass
 
         def _on_error(msg: str):
-            self.progress_bar.setVisible(False)
+            self.terminar_progreso()
             self.run_btn.setEnabled(True)
+            self.cancel_btn.setEnabled(False)
             QMessageBox.critical(self, "Error", f"Fallo: {msg}")
             try:
                 self._worker_thread.quit()
@@ -456,8 +563,20 @@ class MainWindow(QMainWindow):
             except Exception:
                 pass
 
+        def _on_cancelled():
+            self.terminar_progreso()
+            self.append_progress("Ejecución cancelada. Las páginas ya descargadas se retomarán en la próxima ejecución.")
+            self.run_btn.setEnabled(True)
+            self.cancel_btn.setEnabled(False)
+            try:
+                self._worker_thread.quit()
+                self._worker_thread.wait(2000)
+            except Exception:
+                pass
+
         self._worker.finished.connect(_on_finished)
         self._worker.error.connect(_on_error)
+        self._worker.cancelled.connect(_on_cancelled)
         # Start work when thread starts
         self._worker_thread.started.connect(self._worker.run)
         self._worker_thread.start()
@@ -0,0 +1,308 @@
+"""Utilidades HTTP compartidas por el scraper de alertas INVIMA."""
+
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
+
+try:
+    import httpx
+except ImportError:  # sin httpx el motor asíncrono usa la sesión de requests en hilos
+    httpx = None
+
+from invima_metricas import contar
+
+if TYPE_CHECKING:
+    from invima_cache import CacheHTTP
+
+# Estados que suelen ser transitorios en app.invima.gov.co y merecen reintento
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+class LimitadorTasa:
+    """Limita las peticiones por segundo de forma compartida entre hilos.
+
+    Cada llamada a `esperar` reserva el siguiente turno disponible y duerme
+    hasta que llegue, de modo que varios hilos juntos nunca superan la tasa.
+    Con `peticiones_por_segundo` vacío o <= 0 no se aplica ningún límite.
+    """
+
+    def __init__(self, peticiones_por_segundo: Optional[float] = None):
+        if peticiones_por_segundo and peticiones_por_segundo > 0:
+            self.intervalo = 1.0 / float(peticiones_por_segundo)
+        else:
+            self.intervalo = 0.0
+        self._lock = threading.Lock()
+        self._siguiente = 0.0
+
+    def _reservar_turno(self) -> float:
+        """Reserva el próximo turno y devuelve los segundos que faltan para él."""
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        return turno - ahora
+
+    def esperar(self) -> None:
+        if self.intervalo <= 0:
+            return
+        espera = self._reservar_turno()
+        if espera > 0:
+            time.sleep(espera)
+
+    async def esperar_async(self) -> None:
+        """Como `esperar`, pero cede el bucle de eventos en lugar de bloquear el hilo."""
+        if self.intervalo <= 0:
+            return
+        espera = self._reservar_turno()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+def crear_sesion(
+    headers: Optional[Dict[str, str]] = None,
+    reintentos: int = 3,
+    factor_espera: float = 0.5,
+    conexiones: int = 10,
+) -> requests.Session:
+    """Crea una sesión HTTP reutilizable con keep-alive, compresión y reintentos.
+
+    - Mantiene hasta `conexiones` sockets abiertos por host (un pool por hilo concurrente).
+    - Negocia gzip/deflate y br/zstd cuando están instalados `brotli`/`zstandard`.
+    - Reintenta `reintentos` veces errores de conexión y respuestas 429/5xx con espera
+      exponencial (`factor_espera` * 2^n segundos), respetando la cabecera Retry-After.
+    """
+    politica = Retry(
+        total=reintentos,
+        backoff_factor=factor_espera,
+        status_forcelist=ESTADOS_REINTENTABLES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(pool_connections=conexiones, pool_maxsize=conexiones, max_retries=politica)
+    sesion = requests.Session()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    sesion.headers.update(make_headers(accept_encoding=True))
+    if headers:
+        sesion.headers.update(headers)
+    return sesion
+
+
+def _pedir(
+    url: str,
+    headers: Dict[str, str],
+    session: Optional[requests.Session],
+    cache: Optional["CacheHTTP"],
+    timeout: float,
+    stream: bool,
+    cabeceras_respuesta: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[bytes], Optional[requests.Response]]:
+    """Devuelve (cuerpo, None) si se sirve desde `cache` o (None, respuesta 2xx) si hay que leerla."""
+    cliente = session or requests
+    if cache is not None:
+        if cache.fresca(url):
+            cuerpo = cache.leer(url)
+            if cuerpo is not None:
+                contar("cache_aciertos")
+                _anotar(cabeceras_respuesta, cache.tipo_contenido(url))
+                return cuerpo, None
+        condicionales = cache.cabeceras_condicionales(url)
+        if condicionales:
+            response = cliente.get(url, headers={**headers, **condicionales}, timeout=timeout, stream=stream)
+            if response.status_code != 304:
+                response = _validar(response)
+                _anotar(cabeceras_respuesta, response.headers.get("Content-Type"))
+                return None, response
+            response.close()
+            cuerpo = cache.leer(url, revalidada=True)
+            if cuerpo is not None:
+                contar("cache_aciertos")
+                _anotar(cabeceras_respuesta, cache.tipo_contenido(url))
+                return cuerpo, None
+            # La entrada desapareció entre tanto: se repite sin validadores
+    response = _validar(cliente.get(url, headers=headers, timeout=timeout, stream=stream))
+    _anotar(cabeceras_respuesta, response.headers.get("Content-Type"))
+    return None, response
+
+
+def _anotar(cabeceras_respuesta: Optional[Dict[str, str]], tipo_contenido: Optional[str]) -> None:
+    # El charset de Content-Type decide cómo se decodifica la página (ver `invima_parser`)
+    if cabeceras_respuesta is not None and tipo_contenido:
+        cabeceras_respuesta["Content-Type"] = tipo_contenido
+
+
+def _validar(response: requests.Response) -> requests.Response:
+    # Los reintentos los hace urllib3 dentro de la sesión; su historial queda en la respuesta
+    historial = getattr(getattr(response.raw, "retries", None), "history", None)
+    if historial:
+        contar("reintentos", len(historial))
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
+
+
+def descargar(
+    url: str,
+    headers: Dict[str, str],
+    session: Optional[requests.Session] = None,
+    cache: Optional["CacheHTTP"] = None,
+    timeout: float = 15,
+    cabeceras_respuesta: Optional[Dict[str, str]] = None,
+) -> bytes:
+    """Descarga `url` y devuelve el cuerpo en bytes, pasando por `cache` si se indica.
+
+    Con caché se envían los validadores guardados y un 304 se sirve desde disco.
+    Si se pasa `cabeceras_respuesta` se le añade el Content-Type de la respuesta (o el
+    guardado en la caché). Lanza `requests.exceptions.RequestException` si la petición falla.
+    """
+    cuerpo, response = _pedir(url, headers, session, cache, timeout, False, cabeceras_respuesta)
+    if cuerpo is not None:
+        return cuerpo
+    contar("bytes_descargados", len(response.content))
+    if cache is not None:
+        cache.guardar(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                      response.headers.get("Content-Type"))
+    return response.content
+
+
+def descargar_trozos(
+    url: str,
+    headers: Dict[str, str],
+    session: Optional[requests.Session] = None,
+    cache: Optional["CacheHTTP"] = None,
+    timeout: float = 15,
+    tamano_trozo: int = 16 * 1024,
+    cabeceras_respuesta: Optional[Dict[str, str]] = None,
+) -> Iterator[bytes]:
+    """Como `descargar`, pero entrega el cuerpo por trozos a medida que llega.
+
+    Con `cache` los trozos se acumulan para guardar la entrada al terminar.
+    `cabeceras_respuesta` ya está completo al recibir el primer trozo.
+    """
+    cuerpo, response = _pedir(url, headers, session, cache, timeout, True, cabeceras_respuesta)
+    if cuerpo is not None:
+        yield cuerpo
+        return
+    acumulado = bytearray() if cache is not None else None
+    with response:
+        for trozo in response.iter_content(tamano_trozo):
+            contar("bytes_descargados", len(trozo))
+            if acumulado is not None:
+                acumulado += trozo
+            yield trozo
+    if cache is not None:
+        cache.guardar(url, bytes(acumulado), response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                      response.headers.get("Content-Type"))
+
+
+def segundos_retry_after(valor: Optional[str]) -> Optional[float]:
+    """Interpreta Retry-After (segundos o fecha HTTP). Devuelve None si no es válido."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def crear_cliente_async(headers: Optional[Dict[str, str]] = None, conexiones: int = 10, timeout: float = 15):
+    """Cliente httpx asíncrono equivalente a `crear_sesion` (keep-alive y gzip/br).
+
+    Los reintentos no van en el cliente sino en `descargar_trozos_async`.
+    """
+    if httpx is None:
+        raise RuntimeError("El cliente asíncrono requiere instalar httpx.")
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=timeout,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=conexiones, max_keepalive_connections=conexiones),
+    )
+
+
+async def descargar_trozos_async(
+    url: str,
+    headers: Dict[str, str],
+    cliente: "httpx.AsyncClient",
+    cache: Optional["CacheHTTP"] = None,
+    reintentos: int = 3,
+    factor_espera: float = 0.5,
+    tamano_trozo: int = 16 * 1024,
+    cabeceras_respuesta: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[bytes]:
+    """Versión asíncrona de `descargar_trozos` sobre httpx.
+
+    Aplica la misma política que `crear_sesion`: reintenta errores de conexión y
+    respuestas 429/5xx con espera exponencial, respetando Retry-After.
+    Lanza `httpx.HTTPError` si la petición falla.
+    """
+    condicionales: Dict[str, str] = {}
+    if cache is not None:
+        if cache.fresca(url):
+            cuerpo = cache.leer(url)
+            if cuerpo is not None:
+                contar("cache_aciertos")
+                _anotar(cabeceras_respuesta, cache.tipo_contenido(url))
+                yield cuerpo
+                return
+        condicionales = cache.cabeceras_condicionales(url)
+
+    for intento in range(reintentos + 1):
+        espera = factor_espera * (2 ** intento)
+        peticion = cliente.build_request("GET", url, headers={**headers, **condicionales})
+        try:
+            response = await cliente.send(peticion, stream=True)
+        except httpx.TransportError:
+            if intento == reintentos:
+                raise
+            contar("reintentos")
+            await asyncio.sleep(espera)
+            continue
+        if response.status_code in ESTADOS_REINTENTABLES and intento < reintentos:
+            contar("reintentos")
+            retry_after = segundos_retry_after(response.headers.get("Retry-After"))
+            await response.aclose()
+            await asyncio.sleep(retry_after if retry_after is not None else espera)
+            continue
+        break
+
+    try:
+        if response.status_code == 304 and cache is not None:
+            cuerpo = cache.leer(url, revalidada=True)
+            if cuerpo is not None:
+                contar("cache_aciertos")
+                _anotar(cabeceras_respuesta, cache.tipo_contenido(url))
+                yield cuerpo
+                return
+            # La entrada desapareció entre tanto: al no quedar validadores se pide entera
+            async for trozo in descargar_trozos_async(url, headers, cliente, cache, reintentos, factor_espera, tamano_trozo,
+                                                      cabeceras_respuesta):
+                yield trozo
+            return
+        response.raise_for_status()
+        _anotar(cabeceras_respuesta, response.headers.get("Content-Type"))
+        acumulado = bytearray() if cache is not None else None
+        async for trozo in response.aiter_bytes(tamano_trozo):
+            contar("bytes_descargados", len(trozo))
+            if acumulado is not None:
+                acumulado += trozo
+            yield trozo
+        if cache is not None:
+            cache.guardar(url, bytes(acumulado), response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                          response.headers.get("Content-Type"))
+    finally:
+        await response.aclose()
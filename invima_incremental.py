@@ -0,0 +1,152 @@
+"""Registro de alertas ya procesadas entre ejecuciones.
+
+`RegistroVistos` guarda qué RISARH ya se reportaron (modo incremental) e
+`IndiceHuellas` con qué contenido se vieron por última vez (detección de cambios).
+"""
+
+import os
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterable, Set
+
+from invima_alerta import Alerta
+
+
+class SinAlertasNuevas(RuntimeError):
+    """No apareció ninguna alerta que no estuviera ya en el registro."""
+
+
+class RegistroVistos:
+    """Conjunto persistente de identificadores RISARH ya incluidos en un reporte.
+
+    Se guarda como texto plano (un RISARH por línea) y solo se añaden líneas,
+    así que escribirlo es barato aunque el registro crezca durante años.
+
+    Aparte (`<ruta>.pendientes`) se guardan las alertas que se descargaron pero no
+    cupieron en el reporte: hasta que se registren no cuentan como vistas, y la
+    siguiente ejecución sigue paginando hasta volver a encontrarlas.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = Path(ruta)
+        self.ruta_pendientes = self.ruta.with_name(self.ruta.name + ".pendientes")
+        self._vistos: Set[str] = set()
+        self._pendientes: Set[str] = set()
+        if self.ruta.exists():
+            with self.ruta.open("r", encoding="utf-8") as f:
+                self._vistos = {linea.strip() for linea in f if linea.strip()}
+        if self.ruta_pendientes.exists():
+            with self.ruta_pendientes.open("r", encoding="utf-8") as f:
+                self._pendientes = {linea.strip() for linea in f if linea.strip()}
+
+    def __contains__(self, risarh: str) -> bool:
+        return risarh in self._vistos and risarh not in self._pendientes
+
+    def __len__(self) -> int:
+        return len(self._vistos - self._pendientes)
+
+    @property
+    def pendientes(self) -> Set[str]:
+        """RISARH descargados que aún no se han incluido en ningún reporte."""
+        return set(self._pendientes)
+
+    def agregar(self, identificadores: Iterable[str]) -> int:
+        """Añade los RISARH no registrados todavía y devuelve cuántos eran nuevos."""
+        nuevos = []
+        pendientes = len(self._pendientes)
+        for risarh in identificadores:
+            if not risarh:
+                continue
+            self._pendientes.discard(risarh)
+            if risarh not in self._vistos:
+                self._vistos.add(risarh)
+                nuevos.append(risarh)
+        if nuevos:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            with self.ruta.open("a", encoding="utf-8") as f:
+                f.writelines(f"{risarh}\n" for risarh in nuevos)
+        if len(self._pendientes) != pendientes:
+            self._guardar_pendientes()
+        return len(nuevos)
+
+    def aplazar(self, identificadores: Iterable[str]) -> int:
+        """Deja pendientes los RISARH que no se pudieron reportar y devuelve cuántos hay en total."""
+        antes = len(self._pendientes)
+        self._pendientes.update(risarh for risarh in identificadores if risarh)
+        if len(self._pendientes) != antes:
+            self._guardar_pendientes()
+        return len(self._pendientes)
+
+    def _guardar_pendientes(self) -> None:
+        # Son pocos: se reescribe el archivo completo (o se borra si ya no queda ninguno)
+        if not self._pendientes:
+            self.ruta_pendientes.unlink(missing_ok=True)
+            return
+        self.ruta_pendientes.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta_pendientes.with_name(self.ruta_pendientes.name + ".tmp")
+        with temporal.open("w", encoding="utf-8") as f:
+            f.writelines(f"{risarh}\n" for risarh in sorted(self._pendientes))
+        os.replace(temporal, self.ruta_pendientes)
+
+
+class IndiceHuellas:
+    """Huella del contenido de cada RISARH la última vez que se vio (ver `Alerta.huella`).
+
+    Se guarda como texto plano ("RISARH<TAB>huella" por línea) y solo se añaden
+    líneas: la última de cada RISARH es la vigente. Al abrirlo se reescribe si más
+    de la mitad de las líneas ya están reemplazadas. La consulta es un diccionario
+    en memoria, así que comparar cada alerta cuesta lo mismo con cualquier tamaño.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = Path(ruta)
+        self._huellas: Dict[str, str] = {}
+        self._pendientes: Dict[str, str] = {}
+        self._comparadas: Set[str] = set()
+        lineas = 0
+        if self.ruta.exists():
+            with self.ruta.open("r", encoding="utf-8") as f:
+                for linea in f:
+                    risarh, _, huella = linea.rstrip("\n").rpartition("\t")
+                    if risarh and huella:
+                        self._huellas[risarh] = huella
+                        lineas += 1
+        if lineas > 2 * len(self._huellas) + 1000:
+            self._compactar()
+
+    def __len__(self) -> int:
+        return len(self._huellas)
+
+    def comparar(self, alerta: Alerta) -> Alerta:
+        """`alerta`, marcada como `cambiada` si su RISARH ya se vio con otro contenido.
+
+        Cuenta solo la primera aparición de cada RISARH hasta `confirmar` (las
+        repetidas de la misma ejecución se descartan después). La huella queda
+        pendiente hasta entonces, así una ejecución que falla no borra la marca de la siguiente.
+        """
+        if not alerta.clave or alerta.clave in self._comparadas:
+            return alerta
+        self._comparadas.add(alerta.clave)
+        huella = alerta.huella()
+        anterior = self._huellas.get(alerta.clave)
+        if anterior == huella:
+            return alerta
+        self._pendientes[alerta.clave] = huella
+        return alerta if anterior is None else replace(alerta, cambiada=True)
+
+    def confirmar(self) -> int:
+        """Guarda las huellas nuevas o cambiadas desde la última confirmación y devuelve cuántas eran."""
+        pendientes, self._pendientes = self._pendientes, {}
+        self._comparadas.clear()
+        if pendientes:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            with self.ruta.open("a", encoding="utf-8") as f:
+                f.writelines(f"{risarh}\t{huella}\n" for risarh, huella in pendientes.items())
+            self._huellas.update(pendientes)
+        return len(pendientes)
+
+    def _compactar(self) -> None:
+        temporal = self.ruta.with_name(self.ruta.name + ".tmp")
+        with temporal.open("w", encoding="utf-8") as f:
+            f.writelines(f"{risarh}\t{huella}\n" for risarh, huella in self._huellas.items())
+        os.replace(temporal, self.ruta)
@@ -0,0 +1,324 @@
+"""Cruce de las alertas con el inventario de dispositivos de la institución.
+
+El inventario (CSV o XLSX, con una fila de encabezados) se indexa una vez. Los
+equipos con la misma descripción y marca se agrupan (un inventario repite el mismo
+modelo en muchas unidades) y cada grupo se puntúa una sola vez:
+  - por palabras normalizadas (sin tildes ni plurales) de la descripción, con peso
+    IDF para que las palabras comunes ("equipo", "sistema") cuenten poco: la
+    puntuación es la parte ponderada de las palabras del grupo que está en la alerta,
+    con un extra si también está su marca;
+  - por modelo/referencia y por registro sanitario, que coinciden de forma exacta y
+    bastan por sí solos para proponer el equipo, aunque no coincida ninguna palabra.
+
+El índice invertido solo guarda, para cada grupo, sus palabras más raras: las
+suficientes para que sin ninguna de ellas no pudiera llegar al umbral. Las palabras
+de más del 1 % de los grupos (`MAX_FRACCION_GRUPOS`: "portátil", "adulto") tampoco
+se indexan, salvo cuando un grupo no tiene otra: una alerta que solo comparte con un
+equipo palabras tan comunes no lo propone. Así cada alerta visita pocas listas
+cortas y cruzar miles de alertas con decenas de miles de equipos toma segundos, no
+un recorrido de todos contra todos (`benchmarks/ejecutar.py --solo inventario`).
+"""
+
+import csv
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from invima_alerta import Alerta
+
+# Palabras vacías que no distinguen un equipo de otro
+PALABRAS_VACIAS = frozenset(
+    "a al con de del el en la las lo los para por sin su sus un una uno y o e x tipo".split()
+)
+# Palabras del encabezado (sin tildes, en minúsculas) que identifican cada columna
+ENCABEZADOS = {
+    "nombre": ("nombre", "descripcion", "dispositivo", "equipo", "producto", "articulo"),
+    "marca": ("marca", "fabricante", "laboratorio"),
+    "registro": ("registro", "invima"),
+    "modelo": ("modelo", "referencia"),
+}
+# Filas iniciales donde se busca la de encabezados
+MAX_FILAS_TITULO = 20
+BONO_MARCA = 0.2
+BONO_MODELO = 0.4
+# Palabras de más de esta fracción de los grupos (y de más de MIN_GRUPOS_FRECUENTE) que no se indexan
+MAX_FRACCION_GRUPOS = 0.01
+MIN_GRUPOS_FRECUENTE = 100
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+_REGISTRO = re.compile(r"(?:INVIMA\s*)?(\d{4}\s*[A-Z]{2,4}\s*-?\s*\d{4,8}(?:\s*-?\s*R\d+)?)")
+
+
+@dataclass(frozen=True, slots=True)
+class ItemInventario:
+    nombre: str
+    marca: str = ""
+    registro: str = ""
+    modelo: str = ""
+
+
+class Coincidencia(NamedTuple):
+    puntuacion: float
+    item: ItemInventario
+    # Equipos del inventario con la misma descripción y marca que `item`
+    equipos: int = 1
+
+    def texto(self) -> str:
+        partes = [self.item.nombre]
+        if self.item.marca:
+            partes.append(f"({self.item.marca})")
+        if self.equipos > 1:
+            partes.append(f"x{self.equipos}")
+        elif self.item.registro:
+            partes.append(f"[{self.item.registro}]")
+        return " ".join(partes)
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas sin tildes, con todo lo que no sea letra o número como espacio."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()
+
+
+def _raiz(palabra: str) -> str:
+    # Singular aproximado: "monitores" -> "monitor", "jeringas" -> "jeringa"
+    if len(palabra) > 4 and palabra.endswith("es") and palabra[-3] in "rlndz":
+        return palabra[:-2]
+    if len(palabra) > 3 and palabra.endswith("s") and not palabra[-2].isdigit():
+        return palabra[:-1]
+    return palabra
+
+
+def palabras(texto: str) -> List[str]:
+    """Palabras normalizadas de `texto`, sin vacías ni repetidas, en orden."""
+    vistas = dict.fromkeys(
+        _raiz(p) for p in normalizar(texto).split()
+        if p not in PALABRAS_VACIAS and (len(p) > 1 or p.isdigit())
+    )
+    return list(vistas)
+
+
+def normalizar_registro(texto: str) -> str:
+    clave = re.sub(r"[^0-9A-Z]", "", (texto or "").upper())
+    return clave[6:] if clave.startswith("INVIMA") else clave
+
+
+def registros_en(texto: str) -> List[str]:
+    """Números de registro sanitario INVIMA que aparecen en `texto`, normalizados."""
+    return [normalizar_registro(m) for m in _REGISTRO.findall((texto or "").upper())]
+
+
+def _claves_modelo(texto: str) -> FrozenSet[str]:
+    # "MX-450" se escribe "mx 450" o "mx450": se prueban las palabras y cada par seguido unido
+    partes = normalizar(texto).split()
+    return frozenset(partes) | {a + b for a, b in zip(partes, partes[1:])}
+
+
+class IndiceInventario:
+    """Índice de búsqueda sobre `items` para coincidencias de puntuación >= `umbral`."""
+
+    def __init__(self, items: Sequence[ItemInventario], umbral: float = 0.6):
+        self.items = list(items)
+        self.umbral = umbral
+        grupos: Dict[Tuple, int] = {}
+        self._palabras: List[Tuple[str, ...]] = []
+        self._marcas: List[FrozenSet[str]] = []
+        self._miembros: List[List[int]] = []
+        self._grupo_de: List[int] = []
+        self._registros: Dict[str, List[int]] = {}
+        self._modelos: Dict[str, List[int]] = {}
+        for i, item in enumerate(self.items):
+            propias = tuple(sorted(palabras(item.nombre)))
+            marca = frozenset(palabras(item.marca))
+            grupo = grupos.setdefault((propias, marca), len(grupos))
+            if grupo == len(self._miembros):
+                self._palabras.append(propias)
+                self._marcas.append(marca)
+                self._miembros.append([])
+            self._miembros[grupo].append(i)
+            self._grupo_de.append(grupo)
+            if item.registro:
+                self._registros.setdefault(normalizar_registro(item.registro), []).append(i)
+            modelo = "".join(normalizar(item.modelo).split())
+            if len(modelo) >= 3:
+                self._modelos.setdefault(modelo, []).append(i)
+
+        frecuencias = Counter(p for propias in self._palabras for p in propias)
+        total = max(1, len(self._palabras))
+        self._idf = {palabra: math.log(1 + total / n) for palabra, n in frecuencias.items()}
+        self._pesos = [math.fsum(self._idf[p] for p in propias) for propias in self._palabras]
+        max_grupos = max(MIN_GRUPOS_FRECUENTE, int(MAX_FRACCION_GRUPOS * total))
+        self._postings: Dict[str, List[int]] = {}
+        for grupo, propias in enumerate(self._palabras):
+            # Sin ninguna de las palabras indexadas, lo que queda no alcanza el umbral ni con la marca
+            peso = self._pesos[grupo]
+            minimo = max(0.0, umbral - (BONO_MARCA if self._marcas[grupo] else 0.0)) * peso
+            restante = peso
+            indexadas = 0
+            for palabra in sorted(propias, key=self._idf.__getitem__, reverse=True):
+                if restante < minimo:
+                    break
+                restante -= self._idf[palabra]
+                # La primera es la más rara del grupo: sin ella el grupo no estaría en ninguna lista
+                if frecuencias[palabra] > max_grupos and indexadas:
+                    continue
+                self._postings.setdefault(palabra, []).append(grupo)
+                indexadas += 1
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _puntuacion(self, grupo: int, conjunto: FrozenSet[str]) -> float:
+        peso = self._pesos[grupo]
+        # fsum no depende del orden del conjunto: la misma alerta puntúa igual en cada ejecución
+        puntuacion = math.fsum(map(self._idf.__getitem__, conjunto.intersection(self._palabras[grupo]))) / peso if peso else 0.0
+        if self._marcas[grupo] and self._marcas[grupo] <= conjunto:
+            puntuacion += BONO_MARCA
+        return puntuacion
+
+    def buscar(self, texto: str, limite: int = 3, texto_registros: str = "") -> List[Coincidencia]:
+        """Hasta `limite` coincidencias para `texto`, de mayor a menor puntuación.
+
+        Los registros sanitarios se buscan en `texto` y también en `texto_registros`.
+        """
+        propias = palabras(texto)
+        conjunto = frozenset(propias)
+        grupos = {grupo for palabra in propias for grupo in self._postings.get(palabra, ())}
+        puntos = {grupo: self._puntuacion(grupo, conjunto) for grupo in grupos}
+
+        # Modelo o registro señalan equipos concretos, no todo su grupo, y llegan al umbral
+        # por sí solos; las palabras y la marca solo los ordenan entre ellos
+        concretos: Dict[int, float] = {}
+        for clave in _claves_modelo(texto):
+            for i in self._modelos.get(clave, ()):
+                grupo = self._grupo_de[i]
+                if grupo not in puntos:
+                    puntos[grupo] = self._puntuacion(grupo, conjunto)
+                concretos[i] = max(self.umbral, puntos[grupo] + BONO_MODELO)
+        for registro in registros_en(f"{texto}\n{texto_registros}"):
+            for i in self._registros.get(registro, ()):
+                concretos[i] = max(concretos.get(i, 0.0), self.umbral, 1.0 + BONO_MARCA + BONO_MODELO)
+
+        señalados = {self._grupo_de[i] for i in concretos}
+        candidatos = [
+            (puntuacion, self._miembros[grupo][0], len(self._miembros[grupo]))
+            for grupo, puntuacion in puntos.items()
+            if puntuacion >= self.umbral and grupo not in señalados
+        ]
+        candidatos += [(puntuacion, i, 1) for i, puntuacion in concretos.items()]
+        # Se ordena por la puntuación sin tope, para que la marca desempate entre descripciones completas
+        mejores = sorted(candidatos, key=lambda candidato: (-candidato[0], candidato[1]))
+        return [
+            Coincidencia(min(1.0, puntuacion), self.items[i], equipos)
+            for puntuacion, i, equipos in mejores[:limite]
+        ]
+
+    def buscar_alerta(self, alerta: Alerta, limite: int = 3) -> List[Coincidencia]:
+        """Como `buscar`, con el nombre de la alerta y, si lo hay, el fabricante y el texto del detalle."""
+        if alerta.detalle is None:
+            return self.buscar(alerta.nombre, limite)
+        # La descripción completa solo se usa para registros: sus palabras sueltas darían falsos positivos
+        return self.buscar(
+            f"{alerta.nombre} {alerta.detalle.fabricante}",
+            limite,
+            texto_registros=alerta.detalle.texto(max_descripcion=10 ** 6),
+        )
+
+
+def _columnas(encabezados: Sequence[str], columnas: Optional[Dict[str, str]]) -> Dict[str, int]:
+    # Índice de cada campo en la fila: el indicado en `columnas` o el primer encabezado reconocible
+    normalizados = [normalizar(str(e or "")) for e in encabezados]
+    posiciones = {}
+    for campo, claves in ENCABEZADOS.items():
+        if columnas and campo in columnas:
+            buscado = normalizar(columnas[campo])
+            if buscado not in normalizados:
+                raise ValueError(f"El inventario no tiene la columna {columnas[campo]!r}.")
+            posiciones[campo] = normalizados.index(buscado)
+            continue
+        for i, encabezado in enumerate(normalizados):
+            if i not in posiciones.values() and any(clave in encabezado.split() for clave in claves):
+                posiciones[campo] = i
+                break
+    if "nombre" not in posiciones:
+        raise ValueError("No se encontró la columna con el nombre del equipo en el inventario.")
+    return posiciones
+
+
+def _filas_csv(ruta: Path) -> Iterable[Sequence[str]]:
+    for codificacion in ("utf-8-sig", "cp1252"):
+        try:
+            texto = ruta.read_text(encoding=codificacion)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError(f"No se pudo leer el inventario '{ruta}': no está en UTF-8 ni en Windows-1252.")
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialecto = csv.excel
+    return csv.reader(texto.splitlines(), dialecto)
+
+
+def _filas_xlsx(ruta: Path) -> Iterable[Sequence[str]]:
+    import openpyxl
+
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        for fila in libro.worksheets[0].iter_rows(values_only=True):
+            yield ["" if valor is None else str(valor) for valor in fila]
+    finally:
+        libro.close()
+
+
+def cargar_inventario(ruta: str, columnas: Optional[Dict[str, str]] = None) -> List[ItemInventario]:
+    """Equipos del inventario en `ruta` (.csv o .xlsx).
+
+    Las columnas se reconocen por su encabezado (nombre/descripción, marca/fabricante,
+    registro, modelo/referencia) o se indican con `columnas` ({"nombre": "Descripción", ...}).
+    La fila de encabezados es la primera (de las `MAX_FILAS_TITULO` iniciales) que los tiene.
+    """
+    ruta_path = Path(ruta)
+    filas = iter(_filas_xlsx(ruta_path) if ruta_path.suffix.lower() in (".xlsx", ".xlsm") else _filas_csv(ruta_path))
+    # Los inventarios exportados suelen llevar un título encima de los encabezados
+    posiciones = None
+    error: Optional[ValueError] = None
+    for _, fila in zip(range(MAX_FILAS_TITULO), filas):
+        try:
+            posiciones = _columnas(fila, columnas)
+            break
+        except ValueError as e:
+            error = error or e
+    if posiciones is None:
+        if error is None:
+            # Archivo vacío
+            return []
+        raise error
+    items = []
+    for fila in filas:
+        valores = {campo: (fila[i].strip() if i < len(fila) else "") for campo, i in posiciones.items()}
+        if valores["nombre"]:
+            items.append(ItemInventario(**valores))
+    return items
+
+
+@lru_cache(maxsize=2)
+def _indice(
+    ruta: str, mtime_ns: int, columnas: Optional[Tuple[Tuple[str, str], ...]], umbral: float
+) -> IndiceInventario:
+    return IndiceInventario(cargar_inventario(ruta, dict(columnas) if columnas else None), umbral)
+
+
+def indice_inventario(ruta: str, columnas: Optional[Dict[str, str]] = None, umbral: float = 0.6) -> IndiceInventario:
+    """Índice del inventario en `ruta`; se construye una vez por archivo y fecha de modificación."""
+    ruta = os.path.abspath(ruta)
+    clave_columnas = tuple(sorted(columnas.items())) if columnas else None
+    return _indice(ruta, os.stat(ruta).st_mtime_ns, clave_columnas, umbral)
@@ -0,0 +1,169 @@
+"""Generación por lotes: varios reportes a partir de una sola descarga del listado.
+
+Cada especificación es un diccionario que se combina con la configuración base
+(por ejemplo otro `responsable_revision` o `salida_path`) y puede filtrar por
+fecha con `desde` / `hasta` ("aaaa-mm-dd"). Los reportes se generan en paralelo
+en varios procesos; cada proceso recibe las alertas una sola vez al arrancar.
+
+Uso desde la línea de comandos:
+
+    python invima_lote.py reportes.json --config config.json [--almacen] [--procesos N]
+
+donde `reportes.json` es una lista de especificaciones.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from invima_alerta import Alerta
+from invima_almacen import AlmacenAlertas
+from invima_excel import escribir_reporte
+from main import obtener_alertas
+
+# Alertas del proceso de trabajo, fijadas por `_iniciar_proceso`
+_ALERTAS: List[Alerta] = []
+
+
+def _fecha(valor) -> Optional[date]:
+    if valor is None or isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor))
+
+
+def filtrar_por_fecha(alertas: Sequence[Alerta], desde=None, hasta=None) -> List[Alerta]:
+    """Alertas con fecha en [desde, hasta]; sin límites se devuelven todas.
+
+    Con algún límite se descartan las alertas cuya fecha no se pudo interpretar.
+    """
+    desde, hasta = _fecha(desde), _fecha(hasta)
+    if desde is None and hasta is None:
+        return list(alertas)
+    return [
+        alerta for alerta in alertas
+        if alerta.fecha is not None
+        and (desde is None or alerta.fecha >= desde)
+        and (hasta is None or alerta.fecha <= hasta)
+    ]
+
+
+def _iniciar_proceso(alertas: List[Alerta]) -> None:
+    global _ALERTAS
+    _ALERTAS = alertas
+
+
+def _generar(config: Dict, alertas: Sequence[Alerta]) -> str:
+    seleccion = filtrar_por_fecha(alertas, config.get("desde"), config.get("hasta"))
+    if not seleccion:
+        raise RuntimeError("No hay alertas para el rango solicitado.")
+    return escribir_reporte(seleccion, config)
+
+
+def _generar_en_proceso(config: Dict) -> str:
+    return _generar(config, _ALERTAS)
+
+
+def generar_lote(
+    alertas: Sequence[Alerta],
+    especificaciones: Sequence[Dict],
+    config_base: Optional[Dict] = None,
+    procesos: Optional[int] = None,
+    progress: Optional[Callable[[str], None]] = None,
+) -> List[Optional[str]]:
+    """Genera un reporte por especificación con las mismas `alertas`.
+
+    Cada especificación se combina sobre `config_base` y debe dar un `salida_path`
+    distinto. Con `procesos` igual a 1 (o una sola especificación) todo corre en el
+    proceso actual. Retorna las rutas generadas en el orden de `especificaciones`,
+    con None en las que fallaron (el error se informa por `progress`).
+    """
+    config_base = config_base or {}
+    configs = [{**config_base, **especificacion} for especificacion in especificaciones]
+    salidas = [config.get("salida_path") for config in configs]
+    if len(set(salidas)) != len(salidas) or None in salidas:
+        raise ValueError("Cada reporte del lote necesita un 'salida_path' propio.")
+    alertas = list(alertas)
+    if procesos is None:
+        procesos = min(len(configs), os.cpu_count() or 1)
+    resultados: List[Optional[str]] = [None] * len(configs)
+
+    if procesos <= 1 or len(configs) <= 1:
+        for i, config in enumerate(configs):
+            try:
+                resultados[i] = _generar(config, alertas)
+                if progress:
+                    progress(f"Reporte {i + 1}/{len(configs)} guardado en: {resultados[i]}")
+            except Exception as e:
+                if progress:
+                    progress(f"Reporte {i + 1}/{len(configs)} ({config['salida_path']}) falló: {e}")
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso, initargs=(alertas,)) as pool:
+        futuros = {pool.submit(_generar_en_proceso, config): i for i, config in enumerate(configs)}
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            try:
+                resultados[i] = futuro.result()
+                if progress:
+                    progress(f"Reporte {i + 1}/{len(configs)} guardado en: {resultados[i]}")
+            except Exception as e:
+                if progress:
+                    progress(f"Reporte {i + 1}/{len(configs)} ({configs[i]['salida_path']}) falló: {e}")
+    return resultados
+
+
+def ejecutar_lote(
+    config: Dict,
+    especificaciones: Sequence[Dict],
+    procesos: Optional[int] = None,
+    desde_almacen: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+) -> List[Optional[str]]:
+    """Obtiene las alertas una vez (de la web o del histórico local) y genera todo el lote."""
+    if desde_almacen:
+        almacen_path = config.get("almacen_path", "alertas_invima.sqlite3")
+        if not almacen_path or not Path(almacen_path).exists():
+            raise RuntimeError(f"No existe el histórico de alertas '{almacen_path}'.")
+        with AlmacenAlertas(almacen_path) as almacen:
+            alertas = list(almacen.consultar())
+    else:
+        alertas = obtener_alertas(config, progress)
+    if not alertas:
+        raise RuntimeError("No se extrajeron alertas desde la fuente especificada.")
+    if progress:
+        progress(f"{len(alertas)} alertas obtenidas; generando {len(especificaciones)} reportes...")
+    return generar_lote(alertas, especificaciones, config, procesos, progress)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera varios reportes INVIMA con una sola descarga.")
+    parser.add_argument("especificaciones", help="JSON con la lista de reportes (claves de config por reporte).")
+    parser.add_argument("--config", default="config.json", help="Configuración base (por defecto config.json).")
+    parser.add_argument("--almacen", action="store_true", help="Usar el histórico local en lugar de descargar.")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto, uno por CPU).")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if Path(args.config).exists():
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    with open(args.especificaciones, "r", encoding="utf-8") as f:
+        especificaciones = json.load(f)
+
+    try:
+        salidas = ejecutar_lote(config, especificaciones, args.procesos, args.almacen, progress=print)
+    except Exception as e:
+        print(f"Ejecución fallida: {e}")
+        return 1
+    return 0 if all(salidas) else 1
+
+
+if __name__ == "__main__":
+    # Necesario para los procesos de trabajo en el ejecutable de PyInstaller (Windows)
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
@@ -0,0 +1,251 @@
+"""Métricas estructuradas de una ejecución: tiempos por etapa y contadores.
+
+El código instrumentado llama a `tramo`, `contar` u `observar` sin recibir nada
+más: las métricas activas se guardan en un `ContextVar`, que asyncio hereda en las
+tareas y `asyncio.to_thread` en los hilos auxiliares. Sin métricas activas esas
+llamadas no hacen nada, así que el coste fuera de una ejecución medida es mínimo.
+
+Etapas medidas: descarga, parseo, detalle, carga_plantilla, carga_inventario,
+cruce_inventario, escritura_celdas, imagen y guardado. Contadores:
+bytes_descargados, cache_aciertos, reintentos, paginas, paginas_fallidas,
+paginas_total, alertas, alertas_repetidas, detalles_cache, detalles_descargados,
+alertas_cambiadas, alertas_en_inventario y filas_escritas. Observaciones: filas_por_pagina.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+_ACTIVAS: ContextVar[Optional["Metricas"]] = ContextVar("invima_metricas", default=None)
+
+
+class Metricas:
+    """Acumula tiempos por etapa, contadores y observaciones de una ejecución.
+
+    Las etapas que corren en paralelo (varias páginas a la vez) suman sus tiempos,
+    por eso el total de `descarga` puede superar la duración de la ejecución.
+    """
+
+    def __init__(self):
+        self.inicio = time.time()
+        self._reloj = time.perf_counter()
+        self._lock = threading.Lock()
+        # etapa -> [veces, segundos totales, máximo]
+        self.tramos: Dict[str, List[float]] = {}
+        self.contadores: Dict[str, int] = {}
+        # nombre -> [cuenta, suma, mínimo, máximo]
+        self.observaciones: Dict[str, List[float]] = {}
+
+    def acumular(self, etapa: str, segundos: float) -> None:
+        with self._lock:
+            datos = self.tramos.setdefault(etapa, [0, 0.0, 0.0])
+            datos[0] += 1
+            datos[1] += segundos
+            datos[2] = max(datos[2], segundos)
+
+    def contar(self, nombre: str, cantidad: int = 1) -> None:
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + cantidad
+
+    def observar(self, nombre: str, valor: float) -> None:
+        with self._lock:
+            datos = self.observaciones.get(nombre)
+            if datos is None:
+                self.observaciones[nombre] = [1, valor, valor, valor]
+            else:
+                datos[0] += 1
+                datos[1] += valor
+                datos[2] = min(datos[2], valor)
+                datos[3] = max(datos[3], valor)
+
+    def instantanea(self) -> Dict[str, int]:
+        """Copia de los contadores, barata de pedir a menudo desde otro hilo."""
+        with self._lock:
+            return dict(self.contadores)
+
+    def duracion(self) -> float:
+        return time.perf_counter() - self._reloj
+
+    def resumen(self) -> Dict:
+        """Las métricas como diccionario serializable en JSON."""
+        with self._lock:
+            return {
+                "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                "duracion_s": round(self.duracion(), 4),
+                "tramos": {
+                    etapa: {"veces": int(veces), "segundos": round(total, 4), "max_s": round(maximo, 4)}
+                    for etapa, (veces, total, maximo) in self.tramos.items()
+                },
+                "contadores": dict(self.contadores),
+                "observaciones": {
+                    nombre: {"cuenta": int(cuenta), "suma": suma, "min": minimo, "max": maximo}
+                    for nombre, (cuenta, suma, minimo, maximo) in self.observaciones.items()
+                },
+            }
+
+    def tabla(self) -> str:
+        """Resumen en texto de ancho fijo, para la caja de progreso o la consola."""
+        resumen = self.resumen()
+        lineas = [f"{'Etapa':<18}{'Veces':>7}{'Total (s)':>11}{'Máx (s)':>10}"]
+        for etapa, datos in resumen["tramos"].items():
+            lineas.append(f"{etapa:<18}{datos['veces']:>7}{datos['segundos']:>11.3f}{datos['max_s']:>10.3f}")
+        for nombre, valor in resumen["contadores"].items():
+            lineas.append(f"{nombre:<18}{valor:>7}")
+        for nombre, datos in resumen["observaciones"].items():
+            media = datos["suma"] / datos["cuenta"]
+            lineas.append(f"{nombre:<18} media {media:.1f} (mín {datos['min']:g}, máx {datos['max']:g})")
+        lineas.append(f"{'duración total':<18}{resumen['duracion_s']:>18.3f}")
+        return "\n".join(lineas)
+
+
+@contextmanager
+def activar(metricas: Metricas) -> Iterator[Metricas]:
+    """Hace de `metricas` las activas dentro del bloque (y de las tareas e hilos que lance)."""
+    token = _ACTIVAS.set(metricas)
+    try:
+        yield metricas
+    finally:
+        _ACTIVAS.reset(token)
+
+
+def activas() -> Optional[Metricas]:
+    return _ACTIVAS.get()
+
+
+@contextmanager
+def tramo(etapa: str) -> Iterator[None]:
+    """Mide la duración del bloque como una vez más de `etapa`."""
+    metricas = _ACTIVAS.get()
+    if metricas is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas.acumular(etapa, time.perf_counter() - inicio)
+
+
+def contar(nombre: str, cantidad: int = 1) -> None:
+    metricas = _ACTIVAS.get()
+    if metricas is not None:
+        metricas.contar(nombre, cantidad)
+
+
+def observar(nombre: str, valor: float) -> None:
+    metricas = _ACTIVAS.get()
+    if metricas is not None:
+        metricas.observar(nombre, valor)
+
+
+def cronometrar(iterable: Iterable, etapa: str) -> Iterator:
+    """Entrega los elementos de `iterable` sumando a `etapa` solo el tiempo de obtenerlos.
+
+    Con un iterable de trozos descargados separa la espera de red del trabajo que
+    haga quien los consume (p. ej. el parseo incremental).
+    """
+    metricas = _ACTIVAS.get()
+    if metricas is None:
+        yield from iterable
+        return
+    iterador = iter(iterable)
+    total = 0.0
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                total += time.perf_counter() - inicio
+                return
+            total += time.perf_counter() - inicio
+            yield elemento
+    finally:
+        metricas.acumular(etapa, total)
+
+
+async def cronometrar_async(iterable, etapa: str) -> AsyncIterator:
+    """Versión asíncrona de `cronometrar`."""
+    metricas = _ACTIVAS.get()
+    total = 0.0
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = await iterable.__anext__()
+            except StopAsyncIteration:
+                total += time.perf_counter() - inicio
+                return
+            total += time.perf_counter() - inicio
+            yield elemento
+    finally:
+        if metricas is not None:
+            metricas.acumular(etapa, total)
+
+
+class SumideroJSON:
+    """Añade el resumen de cada ejecución como una línea JSON a `ruta`."""
+
+    def __init__(self, ruta: str):
+        self.ruta = Path(ruta)
+
+    def emitir(self, metricas: Metricas) -> None:
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with self.ruta.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(metricas.resumen(), ensure_ascii=False) + "\n")
+
+
+class SumideroPrometheus:
+    """Escribe la última ejecución en formato de texto de Prometheus (textfile collector).
+
+    El archivo se reemplaza de forma atómica para que el recolector nunca lea uno a medias.
+    """
+
+    def __init__(self, ruta: str, prefijo: str = "invima"):
+        self.ruta = Path(ruta)
+        self.prefijo = prefijo
+
+    def emitir(self, metricas: Metricas) -> None:
+        p = self.prefijo
+        resumen = metricas.resumen()
+        lineas = [
+            f"# HELP {p}_ejecucion_timestamp_segundos Inicio de la última ejecución (epoch).",
+            f"# TYPE {p}_ejecucion_timestamp_segundos gauge",
+            f"{p}_ejecucion_timestamp_segundos {metricas.inicio:.0f}",
+            f"# HELP {p}_ejecucion_segundos Duración de la última ejecución.",
+            f"# TYPE {p}_ejecucion_segundos gauge",
+            f"{p}_ejecucion_segundos {resumen['duracion_s']}",
+            f"# HELP {p}_tramo_segundos Tiempo acumulado por etapa en la última ejecución.",
+            f"# TYPE {p}_tramo_segundos gauge",
+        ]
+        lineas += [f'{p}_tramo_segundos{{tramo="{etapa}"}} {datos["segundos"]}' for etapa, datos in resumen["tramos"].items()]
+        lineas += [f"# TYPE {p}_tramo_veces gauge"]
+        lineas += [f'{p}_tramo_veces{{tramo="{etapa}"}} {datos["veces"]}' for etapa, datos in resumen["tramos"].items()]
+        for nombre, valor in resumen["contadores"].items():
+            lineas += [f"# TYPE {p}_{nombre} gauge", f"{p}_{nombre} {valor}"]
+        for nombre, datos in resumen["observaciones"].items():
+            lineas += [
+                f"# TYPE {p}_{nombre} summary",
+                f"{p}_{nombre}_sum {datos['suma']}",
+                f"{p}_{nombre}_count {datos['cuenta']}",
+            ]
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta.with_name(self.ruta.name + ".tmp")
+        temporal.write_text("\n".join(lineas) + "\n", encoding="utf-8")
+        os.replace(temporal, self.ruta)
+
+
+def sumideros_desde_config(config: Dict) -> List:
+    """Sumideros pedidos en `config`: `metricas_json` y/o `metricas_prometheus` (rutas)."""
+    sumideros = []
+    if config.get("metricas_json"):
+        sumideros.append(SumideroJSON(config["metricas_json"]))
+    if config.get("metricas_prometheus"):
+        sumideros.append(SumideroPrometheus(config["metricas_prometheus"]))
+    return sumideros
@@ -0,0 +1,310 @@
+"""Extracción de alertas desde el HTML del listado de INVIMA.
+
+Hay dos motores que producen exactamente la misma salida:
+  - "lxml": rápido; usa XPath precompilados sobre los bytes de la respuesta.
+  - "bs4": el BeautifulSoup original con html.parser; se usa si lxml no está instalado.
+
+Con lxml también se puede parsear por trozos (`ExtractorIncremental`) sin construir
+el árbol completo de la página. `parsear_detalle` extrae los campos de la página de
+detalle de una alerta con cualquiera de los dos motores.
+"""
+
+import codecs
+import re
+import threading
+import unicodedata
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from invima_alerta import Alerta, Detalle
+
+try:
+    from lxml import etree
+except ImportError:  # lxml es opcional
+    etree = None
+
+HAY_LXML = etree is not None
+
+CLASE_FILA = "alertas-invima-list"
+# Clases CSS de los campos de cada fila, en el orden de `Alerta.desde_campos`
+CAMPOS = (
+    "views-field-title",
+    "views-field-field-numero-de-id-d-m",
+    "views-field-field-a-o",
+)
+# Campo con el enlace a la página de detalle (el título de la fila)
+CAMPO_ENLACE = "views-field-title"
+MOTORES = ("auto", "lxml", "bs4")
+
+# Página de detalle: clases de las etiquetas de campo (Drupal) y del cuerpo del texto
+CLASES_ETIQUETA = ("field-label", "views-label")
+CLASES_CUERPO = ("field-name-body", "views-field-body")
+# Palabra de la etiqueta (sin tildes, en minúsculas) -> atributo de `Detalle`
+ETIQUETAS_DETALLE = (
+    ("lote", "lotes"),
+    ("fabricante", "fabricante"),
+    ("fecha", "fecha_texto"),
+    ("descripcion", "descripcion"),
+    ("resumen", "descripcion"),
+)
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+_CHARSET_CABECERA = re.compile(r"""charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+# Sin codificación declarada: UTF-8 si los bytes lo son y si no la de Windows en español
+CODIFICACION_ALTERNATIVA = "windows-1252"
+
+
+def _xpath_clase(clase: str) -> str:
+    # Equivalente a class_="..." de BeautifulSoup: la clase es uno de los tokens del atributo
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {clase} ')"
+
+
+if etree is not None:
+    _XPATH_FILAS = etree.XPath(f"//div[{_xpath_clase(CLASE_FILA)}]")
+    _XPATH_CAMPOS = tuple(etree.XPath(f"string((.//*[{_xpath_clase(clase)}])[1])") for clase in CAMPOS)
+    _XPATH_ENLACE = etree.XPath(f"string((.//*[{_xpath_clase(CAMPO_ENLACE)}]//a/@href)[1])")
+    _XPATH_ETIQUETAS = etree.XPath("//*[" + " or ".join(_xpath_clase(c) for c in CLASES_ETIQUETA) + "]")
+    _XPATH_CUERPO = etree.XPath("string((//*[" + " or ".join(_xpath_clase(c) for c in CLASES_CUERPO) + "])[1])")
+
+# Los parsers de lxml no deben compartirse entre hilos: uno por hilo y codificación
+_local = threading.local()
+
+
+def codificacion_declarada(contenido: bytes, tipo_contenido: Optional[str] = None) -> Optional[str]:
+    """Charset de la cabecera Content-Type (`tipo_contenido`) o, si no trae, de la meta charset.
+
+    Solo mira el principio de `contenido`, así que sirve también con el primer trozo de
+    una descarga. Devuelve None si ninguno declara una codificación conocida.
+    """
+    m = _CHARSET_CABECERA.search(tipo_contenido or "")
+    candidatas = [m.group(1)] if m else []
+    m = _META_CHARSET.search(contenido[:4096])
+    if m:
+        candidatas.append(m.group(1).decode("ascii"))
+    for codificacion in candidatas:
+        try:
+            codecs.lookup(codificacion)
+        except LookupError:
+            continue
+        return codificacion.lower()
+    return None
+
+
+def detectar_codificacion(contenido: bytes, tipo_contenido: Optional[str] = None) -> str:
+    """Codificación del documento: la declarada (cabecera y luego meta), UTF-8 si es válido o windows-1252."""
+    declarada = codificacion_declarada(contenido, tipo_contenido)
+    if declarada:
+        return declarada
+    try:
+        contenido.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return CODIFICACION_ALTERNATIVA
+
+
+class _DecodificadorAlternativo:
+    """La alternativa de `detectar_codificacion` por trozos, sin tener la página entera.
+
+    Decodifica como UTF-8 hasta el primer byte que no lo es y desde ahí como
+    windows-1252; la parte ASCII anterior se lee igual con las dos.
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def decodificar(self, trozo: bytes, final: bool = False) -> str:
+        if self._utf8 is not None:
+            pendiente = self._utf8.getstate()[0]
+            try:
+                return self._utf8.decode(trozo, final)
+            except UnicodeDecodeError:
+                self._utf8 = None
+                trozo = pendiente + trozo
+        return trozo.decode(CODIFICACION_ALTERNATIVA, errors="replace")
+
+
+def parsear_lxml(contenido: bytes, tipo_contenido: Optional[str] = None) -> List[Alerta]:
+    codificacion = detectar_codificacion(contenido, tipo_contenido)
+    parsers = getattr(_local, "parsers", None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    parser = parsers.get(codificacion)
+    if parser is None:
+        try:
+            parser = etree.HTMLParser(encoding=codificacion)
+        except LookupError:
+            parser = etree.HTMLParser(encoding="utf-8")
+        parsers[codificacion] = parser
+    raiz = etree.fromstring(contenido, parser)
+    if raiz is None:
+        return []
+    return [
+        Alerta.desde_campos(*(xpath(fila) for xpath in _XPATH_CAMPOS), enlace=_XPATH_ENLACE(fila))
+        for fila in _XPATH_FILAS(raiz)
+    ]
+
+
+class ExtractorIncremental:
+    """Parser de lxml alimentado por trozos que entrega cada alerta al cerrar su fila.
+
+    Los elementos ya procesados se liberan en cuanto terminan, de modo que la memoria
+    depende del tamaño de una fila y no del de la página. Sirve tanto para lecturas
+    síncronas (`parsear_listado_stream`) como asíncronas. Requiere lxml.
+    La codificación se decide como en `detectar_codificacion`, con la cabecera
+    Content-Type (`tipo_contenido`) y el primer trozo.
+    """
+
+    def __init__(self, tipo_contenido: Optional[str] = None):
+        if etree is None:
+            raise RuntimeError("El parseo incremental requiere instalar lxml.")
+        self.tipo_contenido = tipo_contenido
+        self._parser = None
+        self._decodificador: Optional[_DecodificadorAlternativo] = None
+        self._dentro_de_fila = 0
+
+    def alimentar(self, trozo: bytes) -> List[Alerta]:
+        if self._parser is None:
+            # La meta charset, si existe, va en la cabecera y por tanto en el primer trozo
+            codificacion = codificacion_declarada(trozo, self.tipo_contenido)
+            if codificacion is not None:
+                try:
+                    self._parser = etree.HTMLPullParser(events=("start", "end"), encoding=codificacion)
+                except LookupError:
+                    pass
+            if self._parser is None:
+                # Sin codificación declarada se le pasa a lxml el texto ya decodificado
+                self._parser = etree.HTMLPullParser(events=("start", "end"))
+                self._decodificador = _DecodificadorAlternativo()
+        self._parser.feed(self._decodificador.decodificar(trozo) if self._decodificador else trozo)
+        return self._leer_eventos()
+
+    def cerrar(self) -> List[Alerta]:
+        if self._parser is None:
+            return []
+        if self._decodificador is not None:
+            resto = self._decodificador.decodificar(b"", final=True)
+            if resto:
+                self._parser.feed(resto)
+        self._parser.close()
+        return self._leer_eventos()
+
+    def _leer_eventos(self) -> List[Alerta]:
+        alertas = []
+        for evento, elemento in self._parser.read_events():
+            es_fila = elemento.tag == "div" and CLASE_FILA in (elemento.get("class") or "").split()
+            if evento == "start":
+                if es_fila:
+                    self._dentro_de_fila += 1
+                continue
+            if es_fila:
+                alertas.append(Alerta.desde_campos(*(xpath(elemento) for xpath in _XPATH_CAMPOS), enlace=_XPATH_ENLACE(elemento)))
+                self._dentro_de_fila -= 1
+            if self._dentro_de_fila == 0:
+                # Fuera de cualquier fila ya no hace falta nada de lo anterior
+                elemento.clear()
+                padre = elemento.getparent()
+                while padre is not None and elemento.getprevious() is not None:
+                    del padre[0]
+        return alertas
+
+
+def parsear_listado_stream(trozos: Iterable[bytes], tipo_contenido: Optional[str] = None) -> Iterator[Alerta]:
+    """Parsea el listado a medida que llegan los bytes (ver `ExtractorIncremental`)."""
+    extractor = ExtractorIncremental(tipo_contenido)
+    for trozo in trozos:
+        yield from extractor.alimentar(trozo)
+    yield from extractor.cerrar()
+
+
+def parsear_bs4(contenido: bytes, tipo_contenido: Optional[str] = None) -> List[Alerta]:
+    # Solo se importa si hace falta: con lxml instalado BeautifulSoup no se usa
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(contenido, "html.parser", from_encoding=detectar_codificacion(contenido, tipo_contenido))
+    scraped_data = []
+    filas = soup.find_all("div", class_=CLASE_FILA)
+    for fila in filas:
+        campos = []
+        for clase in CAMPOS:
+            try:
+                campos.append(fila.find(class_=clase).text)
+            except Exception:
+                campos.append("")
+        enlace = fila.select_one(f".{CAMPO_ENLACE} a[href]")
+        scraped_data.append(Alerta.desde_campos(*campos, enlace=enlace["href"] if enlace else ""))
+    return scraped_data
+
+
+def parsear_listado(contenido: bytes, motor: str = "auto", tipo_contenido: Optional[str] = None) -> List[Alerta]:
+    """Devuelve las alertas (`Alerta`) de una página del listado.
+
+    `motor` puede ser "auto" (lxml si está disponible), "lxml" o "bs4". `tipo_contenido`
+    es la cabecera Content-Type de la respuesta (ver `detectar_codificacion`).
+    """
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de parseo desconocido: {motor!r} (opciones: {', '.join(MOTORES)})")
+    if motor == "bs4" or (motor == "auto" and etree is None):
+        return parsear_bs4(contenido, tipo_contenido)
+    if etree is None:
+        raise RuntimeError("El motor 'lxml' requiere instalar lxml.")
+    return parsear_lxml(contenido, tipo_contenido)
+
+
+def _sin_tildes(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)).lower()
+
+
+def _detalle_desde_pares(pares: Iterable[Tuple[str, str]], cuerpo: str) -> Detalle:
+    # El primer campo cuya etiqueta contiene la palabra clave gana; el cuerpo es la descripción por defecto
+    campos = {}
+    for etiqueta, valor in pares:
+        etiqueta = _sin_tildes(etiqueta)
+        valor = " ".join(valor.split())
+        for palabra, atributo in ETIQUETAS_DETALLE:
+            if palabra in etiqueta and valor and atributo not in campos:
+                campos[atributo] = valor
+                break
+    cuerpo = " ".join(cuerpo.split())
+    if cuerpo and "descripcion" not in campos:
+        campos["descripcion"] = cuerpo
+    return Detalle(**campos)
+
+
+def _pares_lxml(contenido: bytes) -> Tuple[List[Tuple[str, str]], str]:
+    parser = etree.HTMLParser(encoding=detectar_codificacion(contenido))
+    raiz = etree.fromstring(contenido, parser)
+    if raiz is None:
+        return [], ""
+    pares = []
+    for elemento in _XPATH_ETIQUETAS(raiz):
+        etiqueta = "".join(elemento.itertext())
+        padre = elemento.getparent()
+        if padre is not None:
+            pares.append((etiqueta, "".join(padre.itertext()).replace(etiqueta, "", 1)))
+    return pares, _XPATH_CUERPO(raiz)
+
+
+def _pares_bs4(contenido: bytes) -> Tuple[List[Tuple[str, str]], str]:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(contenido, "html.parser")
+    pares = []
+    for elemento in soup.select(", ".join(f".{clase}" for clase in CLASES_ETIQUETA)):
+        etiqueta = elemento.get_text()
+        pares.append((etiqueta, elemento.parent.get_text().replace(etiqueta, "", 1)))
+    cuerpo = soup.select_one(", ".join(f".{clase}" for clase in CLASES_CUERPO))
+    return pares, cuerpo.get_text() if cuerpo else ""
+
+
+def parsear_detalle(contenido: bytes, motor: str = "auto") -> Detalle:
+    """Campos de la página de detalle de una alerta (lotes, fabricante, fecha, descripción).
+
+    Se reconocen por la etiqueta de cada campo (p. ej. "Lotes afectados:") y no por
+    su posición, así que un campo nuevo o reordenado no rompe la extracción.
+    """
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de parseo desconocido: {motor!r} (opciones: {', '.join(MOTORES)})")
+    usar_bs4 = motor == "bs4" or (motor == "auto" and etree is None)
+    if motor == "lxml" and etree is None:
+        raise RuntimeError("El motor 'lxml' requiere instalar lxml.")
+    pares, cuerpo = _pares_bs4(contenido) if usar_bs4 else _pares_lxml(contenido)
+    return _detalle_desde_pares(pares, cuerpo)
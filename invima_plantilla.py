@@ -0,0 +1,146 @@
+"""Caché en memoria de plantillas Excel ya parseadas y del logotipo redimensionado.
+
+`load_workbook` de la plantilla es buena parte del tiempo de un reporte pequeño y
+se repite en cada reporte. Aquí la plantilla se parsea una vez y cada reporte recibe
+una copia propia, mucho más barata que volver a leer el XML.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from copy import copy, deepcopy
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, NamedTuple, Tuple
+
+import openpyxl
+from openpyxl.cell.cell import Cell
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.workbook import Workbook
+
+
+class _Entrada(NamedTuple):
+    mtime_ns: int
+    tamano: int
+    sha1: str
+    libro: Workbook
+
+
+def _clonar_celdas(celdas: Dict[Tuple[int, int], Cell], hoja) -> Dict[Tuple[int, int], Cell]:
+    # Copia directa de los slots: evita el __init__ de cada celda y la validación de valores
+    nuevas = {}
+    for clave, celda in celdas.items():
+        clase = celda.__class__
+        nueva = clase.__new__(clase)
+        nueva.row = celda.row
+        nueva.column = celda.column
+        nueva.parent = hoja
+        # Los descriptores de estilo modifican el StyleArray en su sitio: no se puede compartir
+        nueva._style = copy(celda._style)
+        if clase is Cell:
+            nueva._value = celda._value
+            nueva.data_type = celda.data_type
+            nueva._hyperlink = copy(celda._hyperlink)
+            nueva._comment = copy(celda._comment)
+        nuevas[clave] = nueva
+    return nuevas
+
+
+def clonar_libro(libro: Workbook) -> Workbook:
+    """Copia independiente de `libro`, equivalente a volver a cargarlo del disco.
+
+    Las celdas se copian a mano y el resto (dimensiones, combinaciones, imágenes,
+    configuración de página, estilos) con `deepcopy`. Las listas de estilos
+    (`IndexedList`) se copian aparte porque `deepcopy` no reconstruye bien su índice,
+    y a los `defaultdict` de las hojas se les devuelve su fábrica.
+    No es seguro llamarla a la vez sobre el mismo libro desde varios hilos.
+    """
+    hojas = libro._sheets
+    celdas = [hoja._cells for hoja in hojas]
+    memo = {id(valor): IndexedList(valor) for valor in vars(libro).values() if isinstance(valor, IndexedList)}
+    try:
+        for hoja in hojas:
+            hoja._cells = {}
+        nuevo = deepcopy(libro, memo)
+    finally:
+        for hoja, originales in zip(hojas, celdas):
+            hoja._cells = originales
+    for original, hoja, originales in zip(hojas, nuevo._sheets, celdas):
+        hoja._cells = _clonar_celdas(originales, hoja)
+        # deepcopy pierde la fábrica de los defaultdict (row_dimensions, column_dimensions)
+        for nombre, valor in vars(original).items():
+            if isinstance(valor, defaultdict) and valor.default_factory is not None:
+                fabrica = valor.default_factory
+                if getattr(fabrica, "__self__", None) is original:
+                    fabrica = getattr(hoja, fabrica.__name__)
+                getattr(hoja, nombre).default_factory = fabrica
+        for rango in hoja.merged_cells.ranges:
+            rango.start_cell = hoja._cells.get((rango.min_row, rango.min_col), rango.start_cell)
+    return nuevo
+
+
+class CachePlantillas:
+    """Plantillas parseadas, identificadas por ruta, fecha de modificación y SHA-1.
+
+    Si la fecha o el tamaño del archivo cambian se vuelve a leer y se compara el
+    hash: solo se parsea de nuevo si el contenido es distinto. `obtener` nunca
+    entrega la plantilla guardada sino una copia que se puede llenar libremente.
+    """
+
+    def __init__(self, maximo: int = 4):
+        self.maximo = maximo
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, ruta: str) -> Workbook:
+        clave = os.path.abspath(ruta)
+        with self._lock:
+            estado = os.stat(clave)
+            entrada = self._entradas.get(clave)
+            if entrada is None or (entrada.mtime_ns, entrada.tamano) != (estado.st_mtime_ns, estado.st_size):
+                with open(clave, "rb") as f:
+                    datos = f.read()
+                sha1 = hashlib.sha1(datos).hexdigest()
+                if entrada is None or entrada.sha1 != sha1:
+                    libro = openpyxl.load_workbook(BytesIO(datos))
+                else:
+                    libro = entrada.libro
+                entrada = _Entrada(estado.st_mtime_ns, estado.st_size, sha1, libro)
+                self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+            return clonar_libro(entrada.libro)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+
+
+PLANTILLAS = CachePlantillas()
+
+
+def cargar_plantilla(ruta: str) -> Workbook:
+    """Copia lista para llenar de la plantilla en `ruta` (ver `CachePlantillas`)."""
+    return PLANTILLAS.obtener(ruta)
+
+
+@lru_cache(maxsize=16)
+def _logotipo_png(ruta: str, mtime_ns: int, ancho: int) -> Tuple[bytes, int]:
+    # Pillow solo hace falta si la plantilla no trae el logotipo
+    from PIL import Image as PILImage
+
+    with PILImage.open(ruta) as imagen:
+        w, h = imagen.size
+        alto = int(ancho * h / w)
+        redimensionada = imagen.resize((ancho, alto), PILImage.LANCZOS)
+    bio = BytesIO()
+    redimensionada.save(bio, format='PNG')
+    return bio.getvalue(), alto
+
+
+def logotipo_png(ruta: str, ancho: int) -> Tuple[bytes, int]:
+    """PNG del logotipo redimensionado a `ancho` píxeles y su alto; se calcula una vez por archivo y ancho."""
+    ruta = os.path.abspath(ruta)
+    return _logotipo_png(ruta, os.stat(ruta).st_mtime_ns, ancho)
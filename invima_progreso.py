@@ -0,0 +1,101 @@
+"""Progreso de una ejecución para la interfaz: avance tipado y mensajes acotados.
+
+El scraper no avisa a la interfaz de cada página ni de cada mensaje. Los números
+(páginas, alertas, bytes, filas) ya los cuentan las métricas activas
+(`invima_metricas`) y los mensajes se encolan en `MonitorProgreso`, que sirve como
+callback `progress`. La interfaz consulta el monitor con un temporizador: cada
+consulta resume en un solo `EventoProgreso` todo lo ocurrido desde la anterior y
+entrega los mensajes acumulados de una vez.
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from invima_metricas import Metricas
+
+
+@dataclass(frozen=True, slots=True)
+class EventoProgreso:
+    """Estado acumulado de la ejecución en un instante."""
+
+    paginas: int = 0
+    paginas_total: int = 0
+    alertas: int = 0
+    bytes: int = 0
+    filas: int = 0
+    segundos: float = 0.0
+
+    @classmethod
+    def desde_metricas(cls, metricas: Metricas) -> "EventoProgreso":
+        contadores = metricas.instantanea()
+        return cls(
+            paginas=contadores.get("paginas", 0),
+            paginas_total=contadores.get("paginas_total", 0),
+            alertas=contadores.get("alertas", 0),
+            bytes=contadores.get("bytes_descargados", 0),
+            filas=contadores.get("filas_escritas", 0),
+            segundos=metricas.duracion(),
+        )
+
+    @property
+    def fraccion(self) -> Optional[float]:
+        """Parte de las páginas ya procesada, o None si aún no se conoce el total."""
+        if not self.paginas_total:
+            return None
+        return min(1.0, self.paginas / self.paginas_total)
+
+    @property
+    def paginas_por_segundo(self) -> float:
+        return self.paginas / self.segundos if self.segundos > 0 else 0.0
+
+    @property
+    def eta_s(self) -> Optional[float]:
+        """Segundos estimados para terminar las páginas, al ritmo medio hasta ahora."""
+        if not self.paginas_total or not self.paginas:
+            return None
+        return max(0, self.paginas_total - self.paginas) / self.paginas_por_segundo
+
+    def texto(self) -> str:
+        partes = [f"Página {self.paginas}/{self.paginas_total or '?'}", f"{self.alertas} alertas"]
+        if self.bytes:
+            partes.append(f"{self.bytes / 1048576:.1f} MB")
+        if self.filas:
+            partes.append(f"{self.filas} filas")
+        if self.paginas:
+            partes.append(f"{self.paginas_por_segundo:.1f} pág/s")
+        eta = self.eta_s
+        if eta is not None and self.paginas < self.paginas_total:
+            partes.append(f"quedan ~{eta:.0f} s")
+        return " · ".join(partes)
+
+
+class MonitorProgreso:
+    """Callback `progress` que guarda los mensajes para que otro hilo los recoja.
+
+    Solo se retienen los últimos `max_mensajes` pendientes: si la interfaz se atrasa,
+    los más antiguos se descartan y se avisa cuántos se omitieron.
+    """
+
+    def __init__(self, metricas: Optional[Metricas] = None, max_mensajes: int = 500):
+        self.metricas = metricas or Metricas()
+        self._mensajes: deque = deque(maxlen=max_mensajes)
+        self._omitidos = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, mensaje: str) -> None:
+        with self._lock:
+            if len(self._mensajes) == self._mensajes.maxlen:
+                self._omitidos += 1
+            self._mensajes.append(str(mensaje))
+
+    def tomar(self) -> Tuple[EventoProgreso, List[str]]:
+        """El estado actual y los mensajes llegados desde la última llamada."""
+        with self._lock:
+            mensajes = list(self._mensajes)
+            self._mensajes.clear()
+            omitidos, self._omitidos = self._omitidos, 0
+        if omitidos:
+            mensajes.insert(0, f"... {omitidos} mensajes omitidos ...")
+        return EventoProgreso.desde_metricas(self.metricas), mensajes
@@ -0,0 +1,118 @@
+"""Punto de control de una ejecución: las páginas descargadas se guardan al llegar.
+
+Si la ejecución se cancela o falla antes de guardar el Excel, la siguiente con las
+mismas fuentes toma esas páginas del disco y solo descarga las que faltan. Al
+terminar bien el punto de control se borra.
+
+El archivo es JSON por línea: una cabecera con las URL y la fecha de creación y
+luego una línea por página (con la URL de su fuente si hay varias). Cada línea se
+escribe y se sincroniza entera, así que un corte a mitad de escritura solo puede
+dañar la última, que se descarta al leer.
+"""
+
+import json
+import os
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from invima_alerta import Alerta
+
+
+def _alerta(campos: List) -> Alerta:
+    # Los puntos de control de versiones anteriores no guardaban el enlace
+    nombre, risarh, fecha_texto, fecha, *resto = campos
+    return Alerta(nombre, risarh, fecha_texto, date.fromisoformat(fecha) if fecha else None, enlace=resto[0] if resto else "")
+
+
+class PuntoControl:
+    """Páginas ya descargadas de una ejecución, por fuente y número de página.
+
+    Un punto de control de otras URL o con más de `ttl_horas` se ignora y se
+    reemplaza, para no mezclar un listado viejo con el actual. En memoria solo se
+    guardan las alertas de las páginas leídas del disco; de las descargadas en esta
+    ejecución basta saber que ya están escritas.
+    """
+
+    def __init__(self, ruta: str, clave: str, ttl_horas: float = 24):
+        self.ruta = Path(ruta)
+        self.clave = clave
+        self.ttl_horas = ttl_horas
+        self.paginas: Dict[Tuple[str, int], List[Alerta]] = {}
+        self._guardadas: Set[Tuple[str, int]] = set()
+        self._archivo = None
+        self._cargar()
+
+    def _cargar(self) -> None:
+        if not self.ruta.exists():
+            return
+        with self.ruta.open("r", encoding="utf-8") as f:
+            try:
+                cabecera = json.loads(f.readline())
+                vigente = (
+                    cabecera.get("clave") == self.clave
+                    and time.time() - float(cabecera.get("creado", 0)) <= self.ttl_horas * 3600
+                )
+            except (ValueError, AttributeError):
+                vigente = False
+            if not vigente:
+                return
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    # Última línea a medio escribir
+                    break
+                self.paginas[registro.get("fuente", ""), int(registro["pagina"])] = [
+                    _alerta(campos) for campos in registro["alertas"]
+                ]
+
+    def __len__(self) -> int:
+        return len(self.paginas)
+
+    def obtener(self, pagina: int, fuente: str = "") -> Optional[List[Alerta]]:
+        """Alertas de la página si se leyó del disco al abrir el punto de control."""
+        return self.paginas.get((fuente, pagina))
+
+    def contiene(self, pagina: int, fuente: str = "") -> bool:
+        """Si la página ya está en el archivo (leída del disco o guardada en esta ejecución)."""
+        return (fuente, pagina) in self.paginas or (fuente, pagina) in self._guardadas
+
+    def guardar(self, pagina: int, alertas: List[Alerta], fuente: str = "") -> None:
+        """Añade la página al archivo y la sincroniza con el disco."""
+        if self._archivo is None:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            if self.paginas:
+                self._archivo = self.ruta.open("a", encoding="utf-8")
+            else:
+                # Sin páginas válidas se empieza de cero (también si el archivo era de otra ejecución)
+                self._archivo = self.ruta.open("w", encoding="utf-8")
+                self._archivo.write(json.dumps({"clave": self.clave, "creado": time.time()}) + "\n")
+        registro = {
+            **({"fuente": fuente} if fuente else {}),
+            "pagina": pagina,
+            "alertas": [
+                [a.nombre, a.risarh, a.fecha_texto, a.fecha.isoformat() if a.fecha else None, a.enlace]
+                for a in alertas
+            ],
+        }
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._guardadas.add((fuente, pagina))
+
+    def cerrar(self) -> None:
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    def descartar(self) -> None:
+        """Borra el punto de control; se llama cuando el reporte ya quedó guardado."""
+        self.cerrar()
+        self.paginas = {}
+        self._guardadas = set()
+        try:
+            self.ruta.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,372 @@
+"""Modo vigilancia: revisa el listado periódicamente y avisa de las alertas nuevas.
+
+Cada revisión empieza por lo barato: solo la primera página de cada fuente, con la
+caché HTTP condicional (si nada cambió, el servidor responde 304 sin cuerpo). Si su
+contenido es el mismo de la última revisión no se hace nada más. Si cambió se
+descarga el listado en modo incremental, se genera un reporte con las alertas no
+reportadas antes y se envían a los notificadores de `notificaciones`:
+
+    "notificaciones": [
+        {"tipo": "archivo", "directorio": "avisos"},
+        {"tipo": "smtp", "host": "localhost", "puerto": 25, "remitente": "invima@hospital",
+         "destinatarios": ["biomedica@hospital"], "adjuntar_reporte": true},
+        {"tipo": "webhook", "url": "https://...", "cabeceras": {"Authorization": "..."}}
+    ]
+
+Las revisiones se repiten cada `intervalo_minutos` con una variación aleatoria
+(`variacion_intervalo`, fracción del intervalo) para no consultar siempre en el mismo
+segundo y, con `horario_vigilancia` ("07:00-19:00"), solo dentro de esas horas.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import smtplib
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from invima_alerta import Alerta
+from invima_excel import escribir_reporte
+from invima_fuentes import fuentes_desde_config
+from invima_http import crear_cliente_async, crear_sesion, httpx
+from main import (
+    cabeceras_desde_config,
+    cache_http_desde_config,
+    notificar,
+    obtener_alertas_async,
+    progress_para_hilo,
+    scraper_invima,
+    scraper_invima_async,
+    vistos_desde_config,
+)
+
+
+@dataclass(frozen=True)
+class Aviso:
+    """Alertas nuevas de una revisión y el reporte generado con ellas."""
+
+    alertas: List[Alerta]
+    reporte: Optional[str] = None
+    fecha: datetime = field(default_factory=datetime.now)
+
+    def asunto(self) -> str:
+        return f"INVIMA: {len(self.alertas)} alertas nuevas"
+
+    def texto(self) -> str:
+        lineas = [f"{self.asunto()} ({self.fecha:%Y-%m-%d %H:%M})", ""]
+        for alerta in self.alertas:
+            marca = " [ACTUALIZADA]" if alerta.cambiada else ""
+            lineas.append(f"- {alerta.risarh} ({alerta.fecha_texto}){marca}: {alerta.nombre}")
+        if self.reporte:
+            lineas += ["", f"Reporte: {self.reporte}"]
+        return "\n".join(lineas)
+
+    def como_dict(self) -> Dict:
+        return {
+            "fecha": self.fecha.isoformat(timespec="seconds"),
+            "reporte": self.reporte,
+            "alertas": [
+                {
+                    "risarh": alerta.risarh,
+                    "nombre": alerta.nombre,
+                    "fecha": alerta.fecha_texto,
+                    "fuente": alerta.fuente,
+                    "enlace": alerta.enlace,
+                    "cambiada": alerta.cambiada,
+                }
+                for alerta in self.alertas
+            ],
+        }
+
+
+class NotificadorArchivo:
+    """Deja cada aviso como un archivo JSON en `directorio`, para que lo recoja otro proceso.
+
+    El archivo se escribe con otro nombre y se renombra al final, así quien vigile la
+    carpeta nunca lee uno a medias.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = Path(directorio)
+
+    def notificar(self, aviso: Aviso) -> None:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        destino = self.directorio / f"alertas_{aviso.fecha:%Y%m%d_%H%M%S_%f}.json"
+        temporal = destino.with_suffix(".tmp")
+        temporal.write_text(json.dumps(aviso.como_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temporal, destino)
+
+
+class NotificadorSMTP:
+    """Envía cada aviso por correo, opcionalmente con el reporte adjunto."""
+
+    def __init__(
+        self,
+        destinatarios: Sequence[str],
+        host: str = "localhost",
+        puerto: int = 25,
+        remitente: str = "invima@localhost",
+        usuario: Optional[str] = None,
+        clave: Optional[str] = None,
+        starttls: bool = False,
+        adjuntar_reporte: bool = False,
+        timeout: float = 30,
+    ):
+        self.destinatarios = [destinatarios] if isinstance(destinatarios, str) else list(destinatarios)
+        self.host = host
+        self.puerto = int(puerto)
+        self.remitente = remitente
+        self.usuario = usuario
+        self.clave = clave
+        self.starttls = starttls
+        self.adjuntar_reporte = adjuntar_reporte
+        self.timeout = timeout
+
+    def notificar(self, aviso: Aviso) -> None:
+        mensaje = EmailMessage()
+        mensaje["Subject"] = aviso.asunto()
+        mensaje["From"] = self.remitente
+        mensaje["To"] = ", ".join(self.destinatarios)
+        mensaje.set_content(aviso.texto())
+        if self.adjuntar_reporte and aviso.reporte:
+            reporte = Path(aviso.reporte)
+            mensaje.add_attachment(
+                reporte.read_bytes(),
+                maintype="application",
+                subtype="vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                filename=reporte.name,
+            )
+        with smtplib.SMTP(self.host, self.puerto, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.usuario:
+                smtp.login(self.usuario, self.clave or "")
+            smtp.send_message(mensaje)
+
+
+class NotificadorWebhook:
+    """Envía cada aviso como JSON (ver `Aviso.como_dict`) en un POST a `url`."""
+
+    def __init__(self, url: str, cabeceras: Optional[Dict[str, str]] = None, timeout: float = 30):
+        self.url = url
+        self.cabeceras = cabeceras or {}
+        self.timeout = timeout
+
+    def notificar(self, aviso: Aviso) -> None:
+        respuesta = requests.post(self.url, json=aviso.como_dict(), headers=self.cabeceras, timeout=self.timeout)
+        respuesta.raise_for_status()
+
+
+TIPOS_NOTIFICADOR = {
+    "archivo": NotificadorArchivo,
+    "smtp": NotificadorSMTP,
+    "webhook": NotificadorWebhook,
+}
+
+
+def notificadores_desde_config(config: Dict) -> List:
+    """Notificadores de `notificaciones` en `config` (ver el docstring del módulo)."""
+    notificadores = []
+    for especificacion in config.get("notificaciones", []):
+        tipo = especificacion.get("tipo")
+        if tipo not in TIPOS_NOTIFICADOR:
+            raise ValueError(f"Tipo de notificación desconocido: {tipo!r} (opciones: {', '.join(TIPOS_NOTIFICADOR)})")
+        parametros = {clave: valor for clave, valor in especificacion.items() if clave != "tipo"}
+        try:
+            notificadores.append(TIPOS_NOTIFICADOR[tipo](**parametros))
+        except TypeError as e:
+            raise ValueError(f"Notificación {tipo!r} mal configurada: {e}") from None
+    return notificadores
+
+
+def _horario(texto: str) -> Tuple[time, time]:
+    inicio, separador, fin = texto.partition("-")
+    if not separador:
+        raise ValueError(f"Horario inválido {texto!r}; se esperaba HH:MM-HH:MM.")
+    return time.fromisoformat(inicio.strip()), time.fromisoformat(fin.strip())
+
+
+def _en_horario(instante: time, inicio: time, fin: time) -> bool:
+    if inicio <= fin:
+        return inicio <= instante < fin
+    # Horario que cruza la medianoche ("22:00-06:00")
+    return instante >= inicio or instante < fin
+
+
+def proxima_espera(config: Dict, ahora: Optional[datetime] = None, azar: Optional[random.Random] = None) -> float:
+    """Segundos hasta la próxima revisión según `intervalo_minutos`, `variacion_intervalo` y `horario_vigilancia`."""
+    azar = azar or random.Random()
+    intervalo = float(config.get("intervalo_minutos", 60)) * 60
+    variacion = float(config.get("variacion_intervalo", 0.1))
+    espera = intervalo * (1 + azar.uniform(-variacion, variacion))
+    if config.get("horario_vigilancia"):
+        inicio, fin = _horario(config["horario_vigilancia"])
+        ahora = ahora or datetime.now()
+        proxima = ahora + timedelta(seconds=espera)
+        if not _en_horario(proxima.time(), inicio, fin):
+            # Fuera de horario se espera a la próxima apertura (también con variación)
+            apertura = datetime.combine(proxima.date(), inicio)
+            if apertura < proxima:
+                apertura += timedelta(days=1)
+            espera = (apertura - ahora).total_seconds() + azar.uniform(0, variacion * intervalo)
+    return max(1.0, espera)
+
+
+def firma_pagina(alertas: Sequence[Alerta]) -> str:
+    """Resumen del contenido de una página: cambia si entra, sale o cambia alguna alerta."""
+    contenido = "\n".join(sorted(f"{alerta.clave}\t{alerta.huella()}" for alerta in alertas))
+    return hashlib.blake2b(contenido.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def primeras_paginas_async(
+    config: Dict,
+    progress: Optional[Callable[[str], object]] = None,
+) -> Dict[str, Optional[List[Alerta]]]:
+    """Alertas de la primera página de cada fuente, por URL de la fuente (None si falló)."""
+    fuentes = fuentes_desde_config(config)
+    headers = cabeceras_desde_config(config)
+    cache = cache_http_desde_config(config)
+    motor = config.get("motor_parser", "auto")
+    reintentos = int(config.get("reintentos", 3))
+    factor_espera = float(config.get("factor_espera", 0.5))
+    urls = [fuente.url for fuente in fuentes]
+    try:
+        if httpx is not None:
+            async with crear_cliente_async(headers, conexiones=len(urls)) as cliente:
+                paginas = await asyncio.gather(*(
+                    scraper_invima_async(f"{url}&page=0", headers, cliente, cache, motor, reintentos, factor_espera, progress)
+                    for url in urls
+                ))
+        else:
+            progress_hilo = progress_para_hilo(progress, asyncio.get_running_loop())
+            with crear_sesion(headers, reintentos, factor_espera, conexiones=len(urls)) as session:
+                paginas = [
+                    await asyncio.to_thread(scraper_invima, f"{url}&page=0", headers, session, cache, motor, progress_hilo)
+                    for url in urls
+                ]
+    finally:
+        if cache is not None:
+            cache.cerrar()
+    return dict(zip(urls, paginas))
+
+
+def _leer_estado(ruta: Path) -> Dict[str, str]:
+    try:
+        return json.loads(ruta.read_text(encoding="utf-8")).get("firmas", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def _guardar_estado(ruta: Path, firmas: Dict[str, str]) -> None:
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(ruta.name + ".tmp")
+    datos = {"firmas": firmas, "revisado": datetime.now().isoformat(timespec="seconds")}
+    temporal.write_text(json.dumps(datos, ensure_ascii=False), encoding="utf-8")
+    os.replace(temporal, ruta)
+
+
+def _salida_con_fecha(salida_path: str, fecha: datetime) -> str:
+    # Cada revisión con novedades deja su propio reporte, sin sobrescribir el anterior
+    ruta = Path(salida_path)
+    return str(ruta.with_name(f"{ruta.stem}_{fecha:%Y%m%d_%H%M%S}{ruta.suffix}"))
+
+
+async def revisar_async(
+    config: Dict,
+    notificadores: Sequence = (),
+    progress: Optional[Callable[[str], object]] = None,
+) -> Optional[Aviso]:
+    """Una revisión completa; retorna el aviso enviado o None si no hubo alertas nuevas.
+
+    Lanza RuntimeError si no se pudo revisar ninguna fuente o si hay notificadores y
+    ninguno pudo entregar el aviso.
+    """
+    ruta_estado = Path(config.get("vigilancia_estado_path", str(Path(config.get("cache_dir", ".invima_cache")) / "vigilancia.json")))
+    anteriores = _leer_estado(ruta_estado)
+    paginas = await primeras_paginas_async(config, progress)
+    firmas = {url: firma_pagina(alertas) for url, alertas in paginas.items() if alertas is not None}
+    if not firmas:
+        # Sin ninguna primera página no se sabe si hubo cambios: es una revisión fallida
+        raise RuntimeError("No se pudo revisar ninguna fuente; se reintentará en la próxima revisión.")
+    if len(firmas) < len(paginas):
+        await notificar(progress, f"No se pudo revisar {len(paginas) - len(firmas)} fuentes; se reintentará en la próxima revisión.")
+    if all(anteriores.get(url) == firma for url, firma in firmas.items()):
+        await notificar(progress, "Sin cambios en la primera página del listado.")
+        return None
+
+    await notificar(progress, "La primera página cambió; descargando las alertas nuevas...")
+    vistos = vistos_desde_config(config)
+    alertas = await obtener_alertas_async(config, progress, vistos)
+    aviso = None
+    if alertas:
+        fecha = datetime.now()
+        salida_path = _salida_con_fecha(config.get("salida_path", "reporte_invima_lleno.xlsx"), fecha)
+        progress_hilo = progress_para_hilo(progress, asyncio.get_running_loop())
+        reporte = await asyncio.to_thread(escribir_reporte, alertas, dict(config, salida_path=salida_path), progress_hilo)
+        aviso = Aviso(alertas, reporte, fecha)
+        entregados = 0
+        for notificador in notificadores:
+            try:
+                await asyncio.to_thread(notificador.notificar, aviso)
+                entregados += 1
+            except Exception as e:
+                await notificar(progress, f"Advertencia: falló la notificación {type(notificador).__name__}: {e}")
+        if notificadores and not entregados:
+            # Sin registrarlas ni guardar la firma: la próxima revisión las vuelve a avisar
+            # (quedan pendientes para que tampoco se pierdan las que ya se habían visto y cambiaron)
+            vistos.aplazar(alerta.clave for alerta in alertas)
+            raise RuntimeError(f"Ningún notificador pudo entregar el aviso de {len(alertas)} alertas; se reintentará en la próxima revisión.")
+        # Se registran todas las avisadas (no solo las que cupieron en el reporte) para no repetir avisos
+        vistos.agregar(alerta.clave for alerta in alertas)
+        await notificar(progress, f"{len(alertas)} alertas nuevas avisadas.")
+    else:
+        await notificar(progress, "No hay alertas nuevas desde la última revisión.")
+    _guardar_estado(ruta_estado, {**anteriores, **firmas})
+    return aviso
+
+
+async def vigilar_async(
+    config: Dict,
+    progress: Optional[Callable[[str], object]] = None,
+    detener: Optional[asyncio.Event] = None,
+    ciclos: Optional[int] = None,
+) -> Dict:
+    """Repite `revisar_async` hasta que se active `detener` o se cumplan `ciclos`.
+
+    Un error en una revisión (también una en la que no se pudo leer ninguna fuente o un
+    aviso que ningún notificador pudo entregar) se informa por `progress`, se cuenta en `errores` y no detiene la vigilancia.
+    Retorna las cifras acumuladas: revisiones, avisos, alertas, errores y reportes generados.
+    """
+    notificadores = notificadores_desde_config(config)
+    resumen = {"revisiones": 0, "avisos": 0, "alertas": 0, "errores": 0, "reportes": []}
+    while True:
+        try:
+            aviso = await revisar_async(config, notificadores, progress)
+        except Exception as e:
+            resumen["errores"] += 1
+            await notificar(progress, f"Error en la revisión: {e}")
+        else:
+            if aviso is not None:
+                resumen["avisos"] += 1
+                resumen["alertas"] += len(aviso.alertas)
+                resumen["reportes"].append(aviso.reporte)
+        resumen["revisiones"] += 1
+        if ciclos is not None and resumen["revisiones"] >= ciclos:
+            return resumen
+        espera = proxima_espera(config)
+        await notificar(progress, f"Próxima revisión a las {datetime.now() + timedelta(seconds=espera):%H:%M:%S}.")
+        if detener is None:
+            await asyncio.sleep(espera)
+            continue
+        try:
+            await asyncio.wait_for(detener.wait(), espera)
+            return resumen
+        except asyncio.TimeoutError:
+            pass
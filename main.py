@@ -1,195 +1,676 @@
+import asyncio
+import inspect
 import requests
-from bs4 import BeautifulSoup
-import time
-import openpyxl
-from typing import Callable, Dict, List, Optional
+from contextlib import AsyncExitStack, aclosing
+from dataclasses import replace
+from datetime import date
+from collections import deque
+from itertools import chain
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
+from urllib.parse import urljoin
 
-# Image handling for Excel
-from openpyxl.drawing.image import Image as OpenpyxlImage
-from PIL import Image as PILImage
-from io import BytesIO
+from invima_alerta import Alerta
+from invima_almacen import AlmacenAlertas
+from invima_cache import CacheHTTP
+from invima_detalle import CacheDetalles, enriquecer
+from invima_excel import EscritorReporte, crear_escritor, escribir_reporte
+from invima_fuentes import Fuente, fuentes_desde_config
+from invima_http import (
+    LimitadorTasa,
+    crear_cliente_async,
+    crear_sesion,
+    descargar,
+    descargar_trozos,
+    descargar_trozos_async,
+    httpx,
+)
+from invima_incremental import IndiceHuellas, RegistroVistos, SinAlertasNuevas
+from invima_metricas import Metricas, activar, contar, cronometrar, cronometrar_async, observar, sumideros_desde_config, tramo
+from invima_parser import HAY_LXML, ExtractorIncremental, parsear_detalle, parsear_listado
+from invima_punto_control import PuntoControl
 
 
-def scraper_invima(url: str, headers: Dict[str, str]) -> Optional[List[Dict[str, str]]]:
+def scraper_invima(
+    url: str,
+    headers: Dict[str, str],
+    session: Optional[requests.Session] = None,
+    cache: Optional[CacheHTTP] = None,
+    motor: str = "auto",
+    progress: Optional[Callable[[str], None]] = None,
+) -> Optional[List[Alerta]]:
     """Realiza una petición y extrae alertas desde la página dada.
 
-    Retorna lista de dicts con claves: Nombre, RISARH, Fecha. Devuelve [] si no hay filas.
+    Retorna lista de `Alerta` (usar `como_dict()` para la forma antigua). Devuelve [] si no hay filas
+    y None si la petición falla (tras agotar los reintentos de `session`, si se indica); el
+    error se informa por `progress`. Con `cache` las páginas sin cambios se sirven desde
+    disco tras un 304. `motor` elige el parser (ver `invima_parser.parsear_listado`).
     """
+    # El charset de la cabecera Content-Type manda sobre el de la página
+    respuesta: Dict[str, str] = {}
     try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
+        if motor != "bs4" and HAY_LXML:
+            # Parseo por trozos: nunca se tiene en memoria el árbol completo de la página
+            trozos = cronometrar(descargar_trozos(url, headers, session=session, cache=cache, cabeceras_respuesta=respuesta), "descarga")
+            extractor = ExtractorIncremental()
+            alertas = []
+            for trozo in trozos:
+                extractor.tipo_contenido = respuesta.get("Content-Type")
+                with tramo("parseo"):
+                    alertas.extend(extractor.alimentar(trozo))
+            with tramo("parseo"):
+                alertas.extend(extractor.cerrar())
+            return alertas
+        with tramo("descarga"):
+            contenido = descargar(url, headers, session=session, cache=cache, cabeceras_respuesta=respuesta)
     except requests.exceptions.RequestException as e:
-        print(f"Error al hacer la petición a {url}: {e}")
+        if progress:
+            progress(_error_peticion(url, e))
         return None
-    soup = BeautifulSoup(response.text, "html.parser")
-    scraped_data = []
-    filas = soup.find_all("div", class_="alertas-invima-list")
-    if not filas:
-        return []
-    for fila in filas:
-        try:
-            nombre = fila.find(class_="views-field-title").text.strip()
-        except Exception:
-            nombre = ""
-        try:
-            risarh = fila.find(class_="views-field-field-numero-de-id-d-m").text.strip()
-        except Exception:
-            risarh = ""
+    with tramo("parseo"):
+        return parsear_listado(contenido, motor, respuesta.get("Content-Type"))
+
+
+def _error_peticion(url: str, error: Exception) -> str:
+    # Algunos errores de httpx ocupan varias líneas; el mensaje se deja en una sola
+    return f"Error al hacer la petición a {url}: {' '.join(str(error).split())}"
+
+
+async def notificar(progress: Optional[Callable[[str], object]], texto: str) -> None:
+    """Llama a `progress`, que puede ser una función normal o asíncrona."""
+    if progress is None:
+        return
+    resultado = progress(texto)
+    if inspect.isawaitable(resultado):
+        await resultado
+
+
+def progress_para_hilo(
+    progress: Optional[Callable[[str], object]],
+    loop: asyncio.AbstractEventLoop,
+) -> Optional[Callable[[str], None]]:
+    """Adapta `progress` para usarlo desde un hilo auxiliar (p. ej. al cargar la plantilla)."""
+    if progress is None:
+        return None
+
+    async def esperar(resultado) -> None:
+        await resultado
+
+    def puente(texto: str) -> None:
+        resultado = progress(texto)
+        if inspect.isawaitable(resultado):
+            asyncio.run_coroutine_threadsafe(esperar(resultado), loop).result()
+
+    return puente
+
+
+async def scraper_invima_async(
+    url: str,
+    headers: Dict[str, str],
+    cliente,
+    cache: Optional[CacheHTTP] = None,
+    motor: str = "auto",
+    reintentos: int = 3,
+    factor_espera: float = 0.5,
+    progress: Optional[Callable[[str], object]] = None,
+) -> Optional[List[Alerta]]:
+    """Versión asíncrona de `scraper_invima` sobre un `httpx.AsyncClient`.
+
+    Con lxml la página se parsea a medida que llegan los trozos del cuerpo.
+    """
+    respuesta: Dict[str, str] = {}
+    trozos = descargar_trozos_async(url, headers, cliente, cache, reintentos, factor_espera, cabeceras_respuesta=respuesta)
+    try:
+        async with aclosing(trozos):
+            medidos = cronometrar_async(trozos, "descarga")
+            if motor != "bs4" and HAY_LXML:
+                extractor = ExtractorIncremental()
+                alertas = []
+                async for trozo in medidos:
+                    extractor.tipo_contenido = respuesta.get("Content-Type")
+                    with tramo("parseo"):
+                        alertas.extend(extractor.alimentar(trozo))
+                with tramo("parseo"):
+                    alertas.extend(extractor.cerrar())
+                return alertas
+            contenido = b"".join([trozo async for trozo in medidos])
+    except httpx.HTTPError as e:
+        await notificar(progress, _error_peticion(url, e))
+        return None
+    with tramo("parseo"):
+        return parsear_listado(contenido, motor, respuesta.get("Content-Type"))
+
+
+def cabeceras_desde_config(config: Dict) -> Dict[str, str]:
+    """Cabeceras HTTP de `config` (`headers`) o las de un navegador de escritorio."""
+    return config.get("headers", {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7'
+    })
+
+
+def cache_http_desde_config(config: Dict) -> Optional[CacheHTTP]:
+    """Caché HTTP en disco según `config`, o None con `cache_http` desactivado."""
+    if not config.get("cache_http", True):
+        return None
+    ttl = config.get("cache_ttl")
+    return CacheHTTP(
+        str(Path(config.get("cache_dir", ".invima_cache")) / "http"),
+        tamano_maximo=int(float(config.get("cache_tamano_mb", 50)) * 1024 * 1024),
+        ttl=float(ttl) if ttl is not None else None,
+    )
+
+
+async def _scrapear_paginas_async(
+    num_pages: int,
+    descargar_pagina: Callable[[int], Awaitable[Optional[List[Alerta]]]],
+    ventana: int,
+) -> AsyncIterator[Tuple[int, Optional[List[Alerta]]]]:
+    """Lanza hasta `ventana` páginas por adelantado y las entrega en orden.
+
+    Cuando una página llega vacía se cancelan las posteriores; una página que
+    falla (None) no detiene la descarga.
+    """
+    pendientes: Dict[int, asyncio.Task] = {}
+    siguiente = 0
+    try:
+        for page_num in range(num_pages):
+            while siguiente < num_pages and len(pendientes) < ventana:
+                pendientes[siguiente] = asyncio.ensure_future(descargar_pagina(siguiente))
+                siguiente += 1
+            alertas = await pendientes.pop(page_num)
+            yield page_num, alertas
+            if alertas == []:
+                return
+    finally:
+        # También se ejecuta si quien consume el generador deja de iterar antes de tiempo
+        for tarea in pendientes.values():
+            tarea.cancel()
+
+
+async def _en_orden_async(
+    alertas: AsyncIterator[Alerta],
+    transformar: Callable[[Alerta], Awaitable[Alerta]],
+    ventana: int,
+) -> AsyncIterator[Alerta]:
+    """Aplica `transformar` a hasta `ventana` alertas a la vez y las entrega en el orden de llegada."""
+    pendientes: deque = deque()
+    try:
+        async with aclosing(alertas):
+            async for alerta in alertas:
+                pendientes.append(asyncio.ensure_future(transformar(alerta)))
+                if len(pendientes) >= ventana:
+                    yield await pendientes.popleft()
+        while pendientes:
+            yield await pendientes.popleft()
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+
+
+async def _descargar_detalle(
+    url: str,
+    headers: Dict[str, str],
+    cliente,
+    session: Optional[requests.Session],
+    reintentos: int,
+    factor_espera: float,
+    progress: Optional[Callable[[str], object]] = None,
+) -> Optional[bytes]:
+    """Cuerpo de la página de detalle `url`, o None si la petición falla (sin caché HTTP)."""
+    errores = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
+    try:
+        if cliente is None:
+            return await asyncio.to_thread(descargar, url, headers, session)
+        trozos = descargar_trozos_async(url, headers, cliente, None, reintentos, factor_espera)
+        async with aclosing(trozos):
+            return b"".join([trozo async for trozo in trozos])
+    except errores as e:
+        await notificar(progress, _error_peticion(url, e))
+        return None
+
+
+async def _combinar_fuentes(recorridos: List[AsyncIterator[Alerta]]) -> AsyncIterator[Alerta]:
+    """Recorre todas las fuentes a la vez y entrega sus alertas en el orden de las fuentes.
+
+    Las alertas de la primera fuente salen a medida que llegan; las de las demás se
+    acumulan hasta que terminan las anteriores, así el resultado no depende de qué
+    fuente responde antes (ni, tras `_sin_repetidas`, cuál de ellas se queda con un
+    RISARH que aparece en varias).
+    """
+    fin = object()
+    colas: List[asyncio.Queue] = [asyncio.Queue() for _ in recorridos]
+
+    async def vaciar(recorrido: AsyncIterator[Alerta], cola: asyncio.Queue) -> None:
         try:
-            fecha = fila.find(class_="views-field-field-a-o").text.strip()
-        except Exception:
-            fecha = ""
-        data = {"Nombre": nombre, "RISARH": risarh, "Fecha": fecha}
-        scraped_data.append(data)
-    return scraped_data
+            async with aclosing(recorrido):
+                async for alerta in recorrido:
+                    cola.put_nowait(alerta)
+        except Exception as e:
+            cola.put_nowait(e)
+        cola.put_nowait(fin)
 
+    tareas = [asyncio.ensure_future(vaciar(recorrido, cola)) for recorrido, cola in zip(recorridos, colas)]
+    try:
+        for cola in colas:
+            while (elemento := await cola.get()) is not fin:
+                if isinstance(elemento, Exception):
+                    raise elemento
+                yield elemento
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
 
-def run_invima_scraper(config: Dict, progress: Optional[Callable[[str], None]] = None) -> str:
+
+async def _sin_repetidas(
+    alertas: AsyncIterator[Alerta],
+    progress: Optional[Callable[[str], object]] = None,
+) -> AsyncIterator[Alerta]:
+    """Entrega cada RISARH una sola vez: la primera aparición en el orden del listado.
+
+    Si el listado se desplaza mientras se pagina (se publica una alerta nueva), la
+    última fila de una página vuelve a salir como primera de la siguiente; con varias
+    fuentes, una alerta puede estar en más de una.
+    """
+    entregados = set()
+    repetidas = 0
+    async with aclosing(alertas):
+        async for alerta in alertas:
+            if alerta.clave:
+                if alerta.clave in entregados:
+                    repetidas += 1
+                    continue
+                entregados.add(alerta.clave)
+            yield alerta
+    if repetidas:
+        contar("alertas_repetidas", repetidas)
+        await notificar(progress, f"Se omitieron {repetidas} alertas repetidas.")
+
+
+async def iterar_alertas_async(
+    config: Dict,
+    progress: Optional[Callable[[str], object]] = None,
+    vistos: Optional[RegistroVistos] = None,
+    punto_control: Optional[PuntoControl] = None,
+    huellas: Optional[IndiceHuellas] = None,
+) -> AsyncIterator[Alerta]:
+    """Genera las alertas del listado en orden, página a página, según `config`.
+
+    Acepta las claves de red y caché de `run_invima_scraper`. Cada RISARH se entrega
+    una sola vez. Con `huellas` se marcan como `cambiada` las alertas cuyo contenido
+    difiere del de la última vez que se vieron. Con `vistos` solo se entregan alertas
+    no registradas (o cambiadas) y se deja de paginar en la primera página ya conocida.
+    Las páginas se guardan en el histórico (`almacen_path`) a medida que llegan y,
+    con `punto_control`, también ahí; las que ya estén en él no se vuelven a descargar.
+    Con varias `fuentes` se descargan todas a la vez con el mismo cliente, límite de
+    tasa y concurrencia (ver `_combinar_fuentes`). Con `detalle` cada alerta se completa
+    con su página de detalle, también bajo esos límites y guardada por RISARH en
+    `detalles_path` para no volver a pedirla.
+    Sin httpx instalado las páginas se descargan con `requests` en hilos auxiliares.
+    """
+    # Valores por defecto
+    fuentes = fuentes_desde_config(config)
+    headers = cabeceras_desde_config(config)
+
+    concurrencia = max(1, int(config.get("concurrencia", 1)))
+    # Sin tasa explícita se respeta el antiguo `delay` como separación mínima entre peticiones
+    peticiones_por_segundo = config.get("peticiones_por_segundo")
+    if peticiones_por_segundo is None:
+        delay = float(config.get("delay", 1))
+        peticiones_por_segundo = 1.0 / delay if delay > 0 else None
+    limitador = LimitadorTasa(peticiones_por_segundo)
+    semaforo = asyncio.Semaphore(concurrencia)
+    max_errores_consecutivos = int(config.get("max_errores_consecutivos", 3))
+    motor = config.get("motor_parser", "auto")
+    reintentos = int(config.get("reintentos", 3))
+    factor_espera = float(config.get("factor_espera", 0.5))
+    cache = cache_http_desde_config(config)
+    progress_hilo = progress_para_hilo(progress, asyncio.get_running_loop())
+
+    async with AsyncExitStack() as pila:
+        if cache is not None:
+            # Los usos de la caché se guardan una sola vez al terminar
+            pila.enter_context(cache)
+        if httpx is not None:
+            cliente = await pila.enter_async_context(crear_cliente_async(headers, conexiones=concurrencia))
+            session = None
+        else:
+            cliente = None
+            session = pila.enter_context(crear_sesion(headers, reintentos, factor_espera, conexiones=concurrencia))
+
+        almacen_path = config.get("almacen_path", "alertas_invima.sqlite3")
+        # Cada página se guarda en el histórico al llegar, aunque luego falle el Excel
+        almacen = pila.enter_context(AlmacenAlertas(almacen_path)) if almacen_path else None
+
+        detalles = None
+        if config.get("detalle", False):
+            detalles_path = Path(config.get("detalles_path", str(Path(config.get("cache_dir", ".invima_cache")) / "detalles.sqlite3")))
+            detalles_path.parent.mkdir(parents=True, exist_ok=True)
+            detalles = pila.enter_context(CacheDetalles(str(detalles_path)))
+        url_fuente = {fuente.nombre: fuente.url for fuente in fuentes}
+
+        async def agregar_detalle(alerta: Alerta) -> Alerta:
+            if not alerta.enlace or not alerta.clave:
+                return alerta
+            contenido = detalles.leer(alerta.clave)
+            if contenido is not None:
+                contar("detalles_cache")
+            else:
+                url = urljoin(url_fuente[alerta.fuente], alerta.enlace)
+                async with semaforo:
+                    await limitador.esperar_async()
+                    with tramo("detalle"):
+                        contenido = await _descargar_detalle(url, headers, cliente, session, reintentos, factor_espera, progress)
+                if contenido is None:
+                    await notificar(progress, f"No se pudo descargar el detalle de {alerta.risarh}; se deja sin él.")
+                    return alerta
+                contar("detalles_descargados")
+                detalles.guardar(alerta.clave, url, contenido)
+            with tramo("parseo"):
+                return enriquecer(alerta, parsear_detalle(contenido, motor))
+
+        async def recorrer(fuente: Fuente) -> AsyncIterator[Alerta]:
+            base_url = fuente.url
+            # En el punto de control las páginas de cada fuente se distinguen por su URL
+            clave = base_url if len(fuentes) > 1 else ""
+            prefijo = f"[{fuente.nombre}] " if fuente.nombre else ""
+
+            async def descargar_pagina(page_num: int) -> Optional[List[Alerta]]:
+                guardada = punto_control.obtener(page_num, clave) if punto_control is not None else None
+                if guardada is not None:
+                    return guardada
+                url = f"{base_url}&page={page_num}"
+                async with semaforo:
+                    await limitador.esperar_async()
+                    if cliente is None:
+                        return await asyncio.to_thread(scraper_invima, url, headers, session, cache, motor, progress_hilo)
+                    return await scraper_invima_async(url, headers, cliente, cache, motor, reintentos, factor_espera, progress)
+
+            errores_consecutivos = 0
+            # Alertas que no cupieron en un reporte anterior: no se deja de paginar hasta encontrarlas
+            faltan = vistos.pendientes if vistos is not None else set()
+            # Se adelantan más páginas de las que el semáforo deja descargar a la vez, para
+            # que una página lenta no deje ociosas las demás conexiones
+            paginas = _scrapear_paginas_async(fuente.num_pages, descargar_pagina, ventana=2 * concurrencia)
+            async with aclosing(paginas):
+                async for page_num, alertas_pagina_actual in paginas:
+                    await notificar(progress, f"{prefijo}Scrapeada página {page_num + 1}: {base_url}&page={page_num}")
+                    contar("paginas")
+                    if alertas_pagina_actual is None:
+                        # Un fallo aislado no significa que se acabaron las alertas: se omite la página
+                        contar("paginas_fallidas")
+                        errores_consecutivos += 1
+                        await notificar(progress, f"{prefijo}Error al descargar la página {page_num + 1}; se omite.")
+                        if errores_consecutivos >= max_errores_consecutivos:
+                            await notificar(progress, f"{prefijo}{errores_consecutivos} páginas seguidas con error. Deteniendo.")
+                            break
+                        continue
+                    errores_consecutivos = 0
+                    observar("filas_por_pagina", len(alertas_pagina_actual))
+                    if fuente.nombre:
+                        # Antes de guardarlas, para que el histórico también sepa de qué fuente salieron
+                        alertas_pagina_actual = [replace(a, fuente=fuente.nombre) for a in alertas_pagina_actual]
+                    if alertas_pagina_actual and almacen is not None:
+                        almacen.guardar(alertas_pagina_actual)
+                    if alertas_pagina_actual and punto_control is not None and not punto_control.contiene(page_num, clave):
+                        punto_control.guardar(page_num, alertas_pagina_actual, clave)
+                    if alertas_pagina_actual and huellas is not None:
+                        alertas_pagina_actual = [huellas.comparar(a) for a in alertas_pagina_actual]
+                        cambiadas = sum(a.cambiada for a in alertas_pagina_actual)
+                        if cambiadas:
+                            contar("alertas_cambiadas", cambiadas)
+                            await notificar(progress, f"{prefijo}{cambiadas} alertas de la página {page_num + 1} cambiaron desde la última vez.")
+                    if alertas_pagina_actual and vistos is not None:
+                        # El listado va de la más reciente a la más antigua: una página sin nada
+                        # nuevo indica que el resto ya se procesó en ejecuciones anteriores
+                        nuevas = [a for a in alertas_pagina_actual if not a.clave or a.clave not in vistos or a.cambiada]
+                        faltan.difference_update(a.clave for a in alertas_pagina_actual)
+                        if not nuevas and faltan:
+                            await notificar(progress, f"{prefijo}La página {page_num + 1} solo contiene alertas conocidas; se sigue buscando {len(faltan)} pendientes de reportar.")
+                            continue
+                        if not nuevas:
+                            await notificar(progress, f"{prefijo}La página {page_num + 1} solo contiene alertas conocidas. Deteniendo.")
+                            break
+                        alertas_pagina_actual = nuevas
+                    if alertas_pagina_actual:
+                        await notificar(progress, f"{prefijo}Encontradas {len(alertas_pagina_actual)} alertas en la página {page_num + 1}.")
+                        contar("alertas", len(alertas_pagina_actual))
+                        for alerta in alertas_pagina_actual:
+                            yield alerta
+                    else:
+                        await notificar(progress, f"{prefijo}No se encontraron más alertas. Deteniendo.")
+                        break
+
+        total_paginas = sum(fuente.num_pages for fuente in fuentes)
+        if len(fuentes) == 1:
+            await notificar(progress, f"Iniciando scraping de las primeras {total_paginas} páginas ({concurrencia} en paralelo)...")
+        else:
+            await notificar(progress, f"Iniciando scraping de {len(fuentes)} fuentes (hasta {total_paginas} páginas, {concurrencia} en paralelo)...")
+        if punto_control:
+            await notificar(progress, f"Reanudando la ejecución anterior: {len(punto_control)} páginas ya descargadas.")
+        contar("paginas_total", total_paginas)
+
+        if len(fuentes) == 1:
+            alertas = recorrer(fuentes[0])
+        else:
+            alertas = _combinar_fuentes([recorrer(fuente) for fuente in fuentes])
+        alertas = _sin_repetidas(alertas, progress)
+        if detalles is not None:
+            await notificar(progress, f"Se añadirá el detalle de cada alerta ({len(detalles)} ya guardados).")
+            # Los detalles se piden por adelantado, como las páginas, y se entregan en orden
+            alertas = _en_orden_async(alertas, agregar_detalle, ventana=4 * concurrencia)
+        async with aclosing(alertas):
+            async for alerta in alertas:
+                yield alerta
+
+
+async def run_invima_scraper_async(config: Dict, progress: Optional[Callable[[str], object]] = None) -> str:
     """Ejecuta el scraping y llena la plantilla según `config`.
 
     Config (valores por defecto razonables):
       - base_url
       - num_pages
+      - fuentes (varias combinaciones de filtros en una ejecución; ver `invima_fuentes`)
       - headers
+      - concurrencia (peticiones simultáneas, por defecto 1)
+      - peticiones_por_segundo (límite compartido; por defecto 1/delay)
+      - reintentos, factor_espera (reintentos con espera exponencial ante 429/5xx)
+      - max_errores_consecutivos (páginas fallidas seguidas antes de detenerse)
+      - cache_http, cache_dir, cache_tamano_mb, cache_ttl (caché HTTP condicional en disco)
+      - incremental, vistos_path (solo alertas no vistas; se detiene en la primera página ya conocida,
+        salvo que falte volver a encontrar alertas que no cupieron en el reporte anterior)
+      - huellas_path (huella del contenido de cada RISARH; las alertas que cambiaron desde la
+        última ejecución se marcan en el reporte y cuentan como nuevas en modo incremental;
+        vacío para no detectar cambios)
+      - almacen_path (histórico SQLite; vacío para no guardarlo)
+      - reanudar, punto_control_path, punto_control_ttl_horas (las páginas descargadas se
+        guardan al llegar y una ejecución cancelada o fallida se retoma desde ellas)
+      - motor_parser ("auto", "lxml" o "bs4")
+      - detalle, detalles_path (añade fabricante, lotes, fecha y descripción de la página de
+        detalle a la novedad reportada; cada página se pide una sola vez y se guarda por RISARH)
       - plantilla_path
       - salida_path
       - fila_inicial
       - ultima_fila_datos
       - medicamento_dispositivo
-      - aplica_institucion
+      - aplica_institucion (valor de la columna E sin inventario o sin coincidencias)
+      - inventario_path, inventario_columnas, inventario_umbral, inventario_max_coincidencias
+        (CSV o XLSX con los equipos de la institución; la columna E lista los que coinciden
+        con cada alerta por nombre, marca o registro sanitario; ver `invima_inventario`)
       - acciones_ejecutadas
       - responsable_revision
+      - modo_salida ("plantilla" o "masivo" para exportaciones sin límite de filas)
+      - desbordamiento ("truncar", "insertar" filas antes del pie o repartir en "hojas" copiadas de la plantilla)
+      - metricas_json, metricas_prometheus (rutas donde dejar los tiempos por etapa y contadores)
 
-    `progress` puede ser una función que recibe strings para mostrar al usuario.
+    `progress` puede ser una función (normal o asíncrona) que recibe strings para
+    mostrar al usuario; al terminar recibe también una tabla con los tiempos por etapa.
+    La plantilla se carga y se guarda en un hilo auxiliar para no bloquear el bucle de
+    eventos; cancelar la tarea cancela las descargas pendientes y deja el punto de control
+    para la próxima ejecución.
     Retorna la ruta del archivo generado.
     """
-    # Valores por defecto
-    base_url = config.get("base_url", "https://app.invima.gov.co/alertas/dispositivos-medicos-invima?field_tipo_de_documento_value=1&field_a_o_value=1")
-    num_pages = int(config.get("num_pages", 2))
-    headers = config.get("headers", {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7'
-    })
+    escritor = await generar_reporte_async(config, progress)
+    return escritor.salida
 
-    plantilla = config.get("plantilla_path", "plantilla.xlsx")
-    salida = config.get("salida_path", "reporte_invima_lleno.xlsx")
-    fila_inicial = int(config.get("fila_inicial", 6))
-    ultima_fila_datos = int(config.get("ultima_fila_datos", 34))
-
-    medicamento_dispositivo = config.get("medicamento_dispositivo", "DISPOSITIVO MÉDICO")
-    aplica_institucion = config.get("aplica_institucion", "NO")
-    acciones_ejecutadas = config.get("acciones_ejecutadas", "N/A")
-    responsable_revision = config.get("responsable_revision", "")
-
-    todas_las_alertas = []
-    if progress:
-        progress(f"Iniciando scraping de las primeras {num_pages} páginas...")
-    for page_num in range(num_pages):
-        url_actual = f"{base_url}&page={page_num}"
-        if progress:
-            progress(f"Scrapeando página {page_num + 1}: {url_actual}")
-        alertas_pagina_actual = scraper_invima(url_actual, headers)
-        if alertas_pagina_actual:
-            todas_las_alertas.extend(alertas_pagina_actual)
-            if progress:
-                progress(f"Encontradas {len(alertas_pagina_actual)} alertas en la página {page_num + 1}.")
-        else:
-            if progress:
-                progress("No se encontraron más alertas. Deteniendo.")
-            break
-        time.sleep(float(config.get("delay", 1)))
 
-    if not todas_las_alertas:
-        if progress:
-            progress("No se extrajeron alertas.")
-        raise RuntimeError("No se extrajeron alertas desde la fuente especificada.")
+async def generar_reporte_async(
+    config: Dict,
+    progress: Optional[Callable[[str], object]] = None,
+    metricas: Optional[Metricas] = None,
+) -> EscritorReporte:
+    """Igual que `run_invima_scraper_async`, pero retorna el escritor ya guardado.
 
-    # Guardar en Excel
+    Sirve a quien necesita las cifras del reporte además de la ruta: `salida`,
+    `total` (alertas recibidas) y `risarh_escritos` (las que se escribieron).
+    Los tiempos y contadores se acumulan en `metricas` (si no se pasa, en unas
+    nuevas) y se envían a los sumideros de `config` aunque la ejecución falle.
+    """
+    metricas = metricas or Metricas()
     try:
-        if progress:
-            progress(f"Cargando la plantilla '{plantilla}'...")
-        workbook = openpyxl.load_workbook(plantilla)
-        sheet = workbook.active
-
-        espacios_disponibles = ultima_fila_datos - fila_inicial + 1
-        if len(todas_las_alertas) > espacios_disponibles:
-            alertas_para_escribir = todas_las_alertas[:espacios_disponibles]
-            if progress:
-                progress(f"Se extrajeron {len(todas_las_alertas)} alertas, pero la plantilla tiene espacio para {espacios_disponibles}. Se escribirán las primeras {espacios_disponibles}.")
-        else:
-            alertas_para_escribir = todas_las_alertas
-
-        for index, alerta in enumerate(alertas_para_escribir):
-            row = fila_inicial + index
-            sheet[f'A{row}'] = alerta.get('Fecha', '')
-            sheet[f'B{row}'] = alerta.get('RISARH', '')
-            sheet[f'C{row}'] = medicamento_dispositivo
-            sheet[f'D{row}'] = alerta.get('Nombre', '')
-            sheet[f'E{row}'] = aplica_institucion
-            sheet[f'F{row}'] = acciones_ejecutadas
-            sheet[f'H{row}'] = responsable_revision
-
-        # Decide whether to insert an image. If the template already contains the logo,
-        # the GUI sets `template_has_logo` (default True) and we skip insertion.
-        template_has_logo = bool(config.get('template_has_logo', True))
-        image_path = config.get('image_path', 'logotipo.png')
-        image_merge_range = config.get('image_merge_range', 'A1:B4')
-        # Desired width in pixels for the image (tweak if needed to fit the template)
-        image_width_px = int(config.get('image_width_px', 240))
-
-        if template_has_logo:
-            if progress:
-                progress("Plantilla marcada como que ya contiene el logotipo; omitiendo inserción de imagen.")
-        else:
+        with activar(metricas):
+            return await _generar_reporte_async(config, progress)
+    finally:
+        for sumidero in sumideros_desde_config(config):
             try:
-                img_path_obj = Path(image_path)
-                if img_path_obj.exists():
-                    # Optionally merge the target cells so image is visually contained
-                    if image_merge_range:
-                        try:
-                            sheet.merge_cells(image_merge_range)
-                        except Exception:
-                            # ignore merge errors and continue
-                            pass
-
-                    # Open and resize with Pillow to target width, preserving aspect ratio
-                    pil_img = PILImage.open(str(img_path_obj))
-                    w, h = pil_img.size
-                    new_h = int(image_width_px * h / w)
-                    pil_resized = pil_img.resize((image_width_px, new_h), PILImage.LANCZOS)
-
-                    bio = BytesIO()
-                    pil_resized.save(bio, format='PNG')
-                    bio.seek(0)
-                    op_img = OpenpyxlImage(bio)
-                    op_img.width = image_width_px
-                    op_img.height = new_h
-                    # Anchor to the first cell of the merge (e.g. 'A1')
-                    anchor_cell = image_merge_range.split(':')[0]
-                    sheet.add_image(op_img, anchor_cell)
-                    if progress:
-                        progress(f"Imagen insertada desde: {image_path} en {image_merge_range}")
-                else:
-                    if progress:
-                        progress(f"No se encontró imagen en: {image_path} — omitiendo inserción.")
-            except Exception as e:
-                if progress:
-                    progress(f"Advertencia: no se pudo insertar la imagen: {e}")
-
-        workbook.save(salida)
-        if progress:
-            progress(f"Reporte guardado en: {salida}")
-        return salida
+                sumidero.emitir(metricas)
+            except OSError as e:
+                await notificar(progress, f"Advertencia: no se pudieron guardar las métricas: {e}")
+        await notificar(progress, "Resumen de tiempos:\n" + metricas.tabla())
 
-    except FileNotFoundError:
-        if progress:
-            progress(f"ERROR: No se encontró el archivo de plantilla '{plantilla}'.")
-        raise
-    except Exception as e:
-        if progress:
-            progress(f"Error al procesar Excel: {e}")
-        raise
+
+def _punto_control(config: Dict) -> Optional[PuntoControl]:
+    """Punto de control de la ejecución según `config`, o None con `reanudar` desactivado."""
+    if not config.get("reanudar", True):
+        return None
+    ruta = config.get("punto_control_path", str(Path(config.get("cache_dir", ".invima_cache")) / "punto_control.jsonl"))
+    clave = "\n".join(sorted(fuente.url for fuente in fuentes_desde_config(config)))
+    return PuntoControl(ruta, clave, float(config.get("punto_control_ttl_horas", 24)))
+
+
+def vistos_desde_config(config: Dict) -> RegistroVistos:
+    """Registro de RISARH ya reportados del modo incremental (`vistos_path`)."""
+    return RegistroVistos(config.get("vistos_path", str(Path(config.get("cache_dir", ".invima_cache")) / "vistos.txt")))
+
+
+def _huellas(config: Dict) -> Optional[IndiceHuellas]:
+    """Índice de huellas según `config`, o None con `huellas_path` vacío."""
+    ruta = config.get("huellas_path", str(Path(config.get("cache_dir", ".invima_cache")) / "huellas.tsv"))
+    return IndiceHuellas(ruta) if ruta else None
+
+
+async def _generar_reporte_async(config: Dict, progress: Optional[Callable[[str], object]]) -> EscritorReporte:
+    vistos = None
+    if config.get("incremental", False):
+        vistos = vistos_desde_config(config)
+        await notificar(progress, f"Modo incremental: {len(vistos)} alertas ya conocidas.")
+
+    punto_control = _punto_control(config)
+    huellas = _huellas(config)
+    try:
+        alertas = iterar_alertas_async(config, progress, vistos, punto_control, huellas)
+        async with aclosing(alertas):
+            # Se mira la primera alerta antes de cargar la plantilla para fallar pronto si no hay nada
+            primera = await anext(alertas, None)
+            if primera is None and vistos is not None:
+                if punto_control is not None:
+                    punto_control.descartar()
+                await notificar(progress, "No hay alertas nuevas desde la última ejecución.")
+                raise SinAlertasNuevas("No hay alertas nuevas desde la última ejecución.")
+            if primera is None:
+                await notificar(progress, "No se extrajeron alertas.")
+                raise RuntimeError("No se extrajeron alertas desde la fuente especificada.")
+
+            progress_hilo = progress_para_hilo(progress, asyncio.get_running_loop())
+            escritor = await asyncio.to_thread(crear_escritor, config, progress_hilo)
+            # Con "truncar" las que no caben se descartan; en modo incremental quedan pendientes
+            truncadas = []
+            if not escritor.agregar(primera):
+                truncadas.append(primera.clave)
+            async for alerta in alertas:
+                if not escritor.agregar(alerta):
+                    truncadas.append(alerta.clave)
+        await asyncio.to_thread(escritor.guardar)
+        if punto_control is not None:
+            punto_control.descartar()
+    finally:
+        if punto_control is not None:
+            punto_control.cerrar()
+    if huellas is not None:
+        huellas.confirmar()
+    if vistos is not None:
+        # Solo se registran las escritas; las truncadas quedan pendientes y la próxima
+        # ejecución sigue paginando hasta volver a encontrarlas
+        vistos.agregar(escritor.risarh_escritos)
+        if truncadas:
+            pendientes = vistos.aplazar(truncadas)
+            await notificar(progress, f"{pendientes} alertas quedan pendientes para el próximo reporte.")
+    return escritor
+
+
+def run_invima_scraper(config: Dict, progress: Optional[Callable[[str], None]] = None) -> str:
+    """Ejecuta el scraping y llena la plantilla según `config` (ver `run_invima_scraper_async`).
+
+    Envoltorio síncrono para la GUI y la línea de comandos; no debe llamarse desde
+    un bucle de eventos en marcha (ahí se usa directamente la versión asíncrona).
+    Retorna la ruta del archivo generado.
+    """
+    return asyncio.run(run_invima_scraper_async(config, progress))
+
+
+async def obtener_alertas_async(
+    config: Dict,
+    progress: Optional[Callable[[str], object]] = None,
+    vistos: Optional[RegistroVistos] = None,
+) -> List[Alerta]:
+    """Descarga el listado según `config` y devuelve todas las alertas, sin generar reporte.
+
+    Es el paso de red de `run_invima_scraper` por separado, para reutilizar un mismo
+    resultado en varios reportes (ver `invima_lote`). Con `vistos` solo devuelve las
+    alertas no registradas, como el modo incremental; registrarlas queda a cargo de
+    quien las use.
+    """
+    alertas = []
+    punto_control = _punto_control(config)
+    huellas = _huellas(config)
+    try:
+        iterador = iterar_alertas_async(config, progress, vistos, punto_control, huellas)
+        async with aclosing(iterador):
+            async for alerta in iterador:
+                alertas.append(alerta)
+        if punto_control is not None:
+            punto_control.descartar()
+        if huellas is not None:
+            huellas.confirmar()
+    finally:
+        if punto_control is not None:
+            punto_control.cerrar()
+    return alertas
+
+
+def obtener_alertas(config: Dict, progress: Optional[Callable[[str], None]] = None) -> List[Alerta]:
+    """Envoltorio síncrono de `obtener_alertas_async`."""
+    return asyncio.run(obtener_alertas_async(config, progress))
+
+
+def generar_reporte_desde_almacen(
+    config: Dict,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    progress: Optional[Callable[[str], None]] = None,
+) -> str:
+    """Genera el reporte con las alertas del histórico local entre `desde` y `hasta`, sin red."""
+    almacen_path = config.get("almacen_path", "alertas_invima.sqlite3")
+    if not almacen_path or not Path(almacen_path).exists():
+        raise RuntimeError(f"No existe el histórico de alertas '{almacen_path}'.")
+    with AlmacenAlertas(almacen_path) as almacen:
+        alertas = almacen.consultar(desde, hasta)
+        primera = next(alertas, None)
+        if primera is None:
+            if progress:
+                progress("No hay alertas en el histórico para el rango solicitado.")
+            raise RuntimeError("No hay alertas en el histórico para el rango solicitado.")
+        return escribir_reporte(chain([primera], alertas), config, progress)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+# Measures cold import time of the entry points with `python -X importtime`
+# and checks it against a budget, so slow top-level imports do not creep back in.
+#
+#   python scripts/medir_importacion.py            # all modules
+#   python scripts/medir_importacion.py invima     # only some
+#   python scripts/medir_importacion.py --factor 2 # slower machine: allow 2x the budget
+#
+# Exits with 1 when a module goes over its budget. Modules whose dependencies are
+# not installed (e.g. PySide6 on a server) are reported and skipped. The same check
+# runs under pytest in tests/test_importacion.py.
+
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time budget per module, in milliseconds
+PRESUPUESTO_MS = {
+    # CLI: only argparse/json/asyncio; the scraper is imported per command
+    'invima': 120,
+    # GUI: only PySide6 widgets; main, openpyxl and QtSvg are imported later
+    'invima_gui': 700,
+    # Scraper: requests/httpx, lxml and openpyxl, but not bs4
+    'main': 450,
+}
+# Modules that should only load on demand, never on import of the entry point
+DIFERIDOS = {
+    'invima': ('main', 'openpyxl', 'requests', 'PySide6'),
+    'invima_gui': ('main', 'openpyxl', 'requests', 'bs4', 'PIL', 'PySide6.QtSvg'),
+    # openpyxl imports Pillow by itself, so it cannot be deferred from main
+    'main': ('bs4', 'PySide6'),
+}
+
+LINEA = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def medir(modulo: str):
+    """Returns (cumulative microseconds, {module: cumulative us}) or None if it cannot be imported."""
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        return None
+    tiempos = {}
+    for linea in proceso.stderr.splitlines():
+        m = LINEA.match(linea)
+        if m:
+            tiempos[m.group(4)] = int(m.group(2))
+    return tiempos.get(modulo, 0), tiempos
+
+
+def mejor(modulo: str, repeticiones: int = 3):
+    """Fastest of `repeticiones` runs of `medir`, or None if the module cannot be imported."""
+    mediciones = [medir(modulo) for _ in range(repeticiones)]
+    if any(m is None for m in mediciones):
+        return None
+    return min(mediciones, key=lambda m: m[0])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Import-time budget check.')
+    parser.add_argument('modulos', nargs='*', default=list(PRESUPUESTO_MS))
+    parser.add_argument('--factor', type=float, default=1.0, help='Multiplier for the budgets.')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Runs per module; the best one counts.')
+    args = parser.parse_args()
+
+    fallos = 0
+    for modulo in args.modulos:
+        medicion = mejor(modulo, args.repeticiones)
+        if medicion is None:
+            print(f'{modulo}: not importable here, skipped')
+            continue
+        total_us, tiempos = medicion
+        presupuesto = PRESUPUESTO_MS.get(modulo, float('inf')) * args.factor
+        estado = 'OK' if total_us / 1000 <= presupuesto else 'OVER BUDGET'
+        print(f'{modulo}: {total_us / 1000:.0f} ms (budget {presupuesto:.0f} ms) {estado}')
+        if estado != 'OK':
+            fallos += 1
+        cargados = [d for d in DIFERIDOS.get(modulo, ()) if d in tiempos]
+        if cargados:
+            print(f'  loaded eagerly but should be deferred: {", ".join(cargados)}')
+            fallos += 1
+        for nombre, us in sorted(tiempos.items(), key=lambda x: -x[1])[1:6]:
+            print(f'  {nombre}: {us / 1000:.0f} ms')
+    return 1 if fallos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""Presupuesto de tiempo de importación de los puntos de entrada (ver scripts/medir_importacion.py).
+
+En una máquina más lenta que la de referencia, INVIMA_FACTOR_IMPORTACION multiplica
+los presupuestos (p. ej. 2 permite el doble).
+"""
+
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+_SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "medir_importacion.py"
+_spec = importlib.util.spec_from_file_location("medir_importacion", _SCRIPT)
+medir_importacion = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(medir_importacion)
+
+FACTOR = float(os.environ.get("INVIMA_FACTOR_IMPORTACION", "1"))
+
+
+@pytest.mark.parametrize("modulo", ["invima", "invima_gui", "main"])
+def test_presupuesto_importacion(modulo):
+    medicion = medir_importacion.mejor(modulo)
+    if medicion is None:
+        pytest.skip(f"{modulo} no se puede importar aquí (faltan dependencias)")
+    total_us, tiempos = medicion
+    presupuesto_ms = medir_importacion.PRESUPUESTO_MS[modulo] * FACTOR
+    assert total_us / 1000 <= presupuesto_ms, f"{modulo} tarda {total_us / 1000:.0f} ms en importarse (presupuesto {presupuesto_ms:.0f} ms)"
+    cargados = [diferido for diferido in medir_importacion.DIFERIDOS[modulo] if diferido in tiempos]
+    assert not cargados, f"{modulo} importa al arrancar lo que debería cargarse después: {', '.join(cargados)}"